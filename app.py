@@ -4,6 +4,10 @@ from flask import Flask
 from config import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_PORT
 from utils import check_user_role, check_system_feature_access
 from models import db, User, Sprint, SprintBacklog
+from decorators import init_endpoint_access
+from round_state import round_state
+from jobs import background_jobs
+from migrations import run_migrations
 
 
 # 导入路由模块
@@ -24,6 +28,9 @@ from routes.test_cases import test_cases_bp
 from routes.prototype import prototype_bp
 from routes.defects import defects_bp
 from routes.todos import todos_bp
+from routes.jobs import jobs_bp
+from routes.search import search_bp
+from routes.reference import reference_bp
 
 def create_app():
     app = Flask(__name__)
@@ -76,6 +83,18 @@ def create_app():
     app.register_blueprint(prototype_bp)
     app.register_blueprint(defects_bp)
     app.register_blueprint(todos_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(reference_bp)
+
+    # 构建端点到系统功能的路由表
+    init_endpoint_access(app)
+
+    # 从数据库重建未结束估算回合的内存状态，并启动出牌的后台写入线程
+    round_state.init_app(app)
+
+    # 启动导入导出后台任务线程池，并恢复重启前排队中的任务
+    background_jobs.init_app(app)
 
     return app
 
@@ -83,4 +102,5 @@ if __name__ == '__main__':
     app = create_app()
     with app.app_context():
         db.create_all()
+        run_migrations()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
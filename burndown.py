@@ -0,0 +1,248 @@
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+
+from models import db, Task, SprintBacklog, Sprint, SprintBurndownSnapshot
+
+
+def compute_burndown_series(sprint, sprint_backlogs, tasks):
+    """
+    计算迭代每天的剩余故事点和理想故事点
+    每个已完成任务在完成当天烧掉 故事点/该故事任务数，按天累加即可，复杂度 O(天数 + 任务数)
+    :param sprint_backlogs: 需提供 user_story_id、story_points
+    :param tasks: 需提供 user_story_id、status、completed_at
+    :return: [(日期, 剩余故事点, 理想故事点), ...]
+    """
+    if not sprint.start_date or not sprint.end_date:
+        return []
+
+    start_date = sprint.start_date
+    days_total = (sprint.end_date - start_date).days + 1
+    if days_total <= 0:
+        return []
+
+    # 每个用户故事的故事点和任务数
+    points_by_story = {}
+    for backlog in sprint_backlogs:
+        points_by_story[backlog.user_story_id] = points_by_story.get(backlog.user_story_id, 0) + (backlog.story_points or 0)
+    total_points = sum(points_by_story.values())
+    story_task_count = Counter(task.user_story_id for task in tasks)
+
+    # 每天新烧掉的故事点（迭代开始前完成的任务计入第一天）
+    burned_by_day = [0.0] * days_total
+    for task in tasks:
+        if task.status != '已完成' or not task.completed_at:
+            continue
+        story_points = points_by_story.get(task.user_story_id)
+        if not story_points:
+            continue
+        offset = (task.completed_at.date() - start_date).days
+        if offset >= days_total:
+            continue
+        burned_by_day[max(offset, 0)] += story_points / story_task_count[task.user_story_id]
+
+    series = []
+    burned = 0.0
+    for i in range(days_total):
+        burned += burned_by_day[i]
+        # 确保不会出现负数
+        remaining_points = max(0, total_points - burned)
+        ideal_points = total_points * (days_total - i) / days_total
+        series.append((start_date + timedelta(days=i), round(remaining_points, 2), round(ideal_points, 2)))
+    return series
+
+
+def rebuild_sprint_snapshots(sprint):
+    """
+    重算迭代的燃尽图快照（不提交事务）
+    只更新数值发生变化的日期，多余的日期（迭代缩短）会被删除
+    """
+    sprint_backlogs = db.session.query(
+        SprintBacklog.user_story_id, SprintBacklog.story_points
+    ).filter(SprintBacklog.sprint_id == sprint.id).all()
+    story_ids = [backlog.user_story_id for backlog in sprint_backlogs]
+    tasks = db.session.query(
+        Task.user_story_id, Task.status, Task.completed_at
+    ).filter(Task.user_story_id.in_(story_ids)).all() if story_ids else []
+
+    series = compute_burndown_series(sprint, sprint_backlogs, tasks)
+
+    existing = {snapshot.snapshot_date: snapshot
+                for snapshot in SprintBurndownSnapshot.query.filter_by(sprint_id=sprint.id)}
+    for snapshot_date, remaining_points, ideal_points in series:
+        snapshot = existing.pop(snapshot_date, None)
+        if snapshot is None:
+            db.session.add(SprintBurndownSnapshot(
+                sprint_id=sprint.id,
+                snapshot_date=snapshot_date,
+                remaining_points=remaining_points,
+                ideal_points=ideal_points
+            ))
+        elif snapshot.remaining_points != remaining_points or snapshot.ideal_points != ideal_points:
+            snapshot.remaining_points = remaining_points
+            snapshot.ideal_points = ideal_points
+    for snapshot in existing.values():
+        db.session.delete(snapshot)
+    return series
+
+
+def refresh_sprint_burndown(*sprint_ids):
+    """在写操作提交前调用，重算指定迭代的燃尽图快照"""
+    for sprint_id in set(sprint_ids):
+        sprint = db.session.get(Sprint, sprint_id) if sprint_id else None
+        if sprint:
+            rebuild_sprint_snapshots(sprint)
+
+
+def refresh_story_burndown(*story_ids):
+    """用户故事下的任务变化时调用，重算包含这些故事的迭代的燃尽图快照"""
+    story_ids = [story_id for story_id in story_ids if story_id]
+    if not story_ids:
+        return
+    rows = db.session.query(SprintBacklog.sprint_id).filter(
+        SprintBacklog.user_story_id.in_(story_ids)
+    ).distinct().all()
+    refresh_sprint_burndown(*(row.sprint_id for row in rows))
+
+
+def get_burndown_data(sprint):
+    """
+    读取迭代的燃尽图数据（一次按日期区间的查询）
+    快照缺失或与迭代日期不一致时（旧数据、迭代日期被修改）即时重算并保存
+    """
+    if not sprint.start_date or not sprint.end_date:
+        return []
+
+    snapshots = SprintBurndownSnapshot.query.filter(
+        SprintBurndownSnapshot.sprint_id == sprint.id,
+        SprintBurndownSnapshot.snapshot_date.between(sprint.start_date, sprint.end_date)
+    ).order_by(SprintBurndownSnapshot.snapshot_date).all()
+    series = [(snapshot.snapshot_date, snapshot.remaining_points, snapshot.ideal_points)
+              for snapshot in snapshots]
+
+    days_total = (sprint.end_date - sprint.start_date).days + 1
+    if len(series) != days_total:
+        series = rebuild_sprint_snapshots(sprint)
+        try:
+            db.session.commit()
+        except Exception:
+            # 并发重算时可能违反唯一约束，本次直接使用计算结果
+            db.session.rollback()
+
+    return [{
+        'date': snapshot_date.strftime('%Y-%m-%d'),
+        'remaining_points': remaining_points,
+        'ideal_points': ideal_points
+    } for snapshot_date, remaining_points, ideal_points in series]
+
+
+def compute_sprints_analytics(sprints):
+    """
+    批量计算多个迭代的燃尽曲线、速率和完成率（用于回顾等历史分析）
+    两次查询取出全部待办事项和任务，所有迭代的天数拼接成一个数组，
+    用 bincount 按天分箱、cumsum 分段累加，一次计算完所有迭代
+    :return: 与 sprints 顺序一致的字典列表
+    """
+    sprints = list(sprints)
+    if not sprints:
+        return []
+    sprint_index = {sprint.id: i for i, sprint in enumerate(sprints)}
+    sprint_count = len(sprints)
+
+    # 每个迭代的天数和在拼接数组中的起始位置（没有日期的迭代天数为 0）
+    days = np.array([
+        max((sprint.end_date - sprint.start_date).days + 1, 0) if sprint.start_date and sprint.end_date else 0
+        for sprint in sprints
+    ], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(days)[:-1]))
+    total_days = int(days.sum())
+
+    # 每个迭代中每个用户故事的故事点
+    backlog_rows = db.session.query(
+        SprintBacklog.sprint_id, SprintBacklog.user_story_id, SprintBacklog.story_points
+    ).filter(SprintBacklog.sprint_id.in_(sprint_index)).all()
+    story_points = {}
+    committed_points = np.zeros(sprint_count)
+    for row in backlog_rows:
+        key = (sprint_index[row.sprint_id], row.user_story_id)
+        story_points[key] = story_points.get(key, 0) + (row.story_points or 0)
+        committed_points[key[0]] += row.story_points or 0
+
+    # 迭代内的任务（一个故事可能出现在多个迭代中，按迭代分别计算）
+    task_rows = db.session.query(
+        SprintBacklog.sprint_id, Task.id, Task.user_story_id, Task.status, Task.completed_at
+    ).join(
+        Task, Task.user_story_id == SprintBacklog.user_story_id
+    ).filter(SprintBacklog.sprint_id.in_(sprint_index)).distinct().all() if backlog_rows else []
+
+    task_sprint = np.array([sprint_index[row.sprint_id] for row in task_rows], dtype=np.int64)
+    task_count = np.bincount(task_sprint, minlength=sprint_count)
+    completed = np.array([row.status == '已完成' and row.completed_at is not None for row in task_rows], dtype=bool)
+    completed_task_count = np.bincount(task_sprint[completed], minlength=sprint_count) if len(task_rows) else task_count
+
+    remaining = np.zeros(total_days)
+    ideal = np.zeros(total_days)
+    completed_points = np.zeros(sprint_count)
+    if total_days:
+        # 每个已完成任务烧掉 故事点/该故事任务数
+        story_task_count = Counter((sprint_index[row.sprint_id], row.user_story_id) for row in task_rows)
+        shares = np.array([
+            story_points.get((sprint_index[row.sprint_id], row.user_story_id), 0)
+            / story_task_count[(sprint_index[row.sprint_id], row.user_story_id)]
+            for row in task_rows
+        ])
+        start_ordinals = np.array([sprint.start_date.toordinal() if sprint.start_date else 0 for sprint in sprints])
+        completed_ordinals = np.array([row.completed_at.date().toordinal() if row.completed_at else 0
+                                       for row in task_rows], dtype=np.int64)
+
+        if len(task_rows):
+            day_offset = completed_ordinals - start_ordinals[task_sprint]
+            # 天数为 0 的迭代（没有日期或结束日期早于开始日期）没有燃尽曲线，其任务不能落到下一个迭代的区间里
+            mask = completed & (shares > 0) & (days[task_sprint] > 0) & (day_offset < days[task_sprint])
+            # 迭代开始前完成的任务计入第一天
+            bins = offsets[task_sprint[mask]] + np.maximum(day_offset[mask], 0)
+            burned_by_day = np.bincount(bins, weights=shares[mask], minlength=total_days)
+        else:
+            burned_by_day = np.zeros(total_days)
+
+        # 分段累加：全局 cumsum 减去每段起点之前的累计值
+        day_sprint = np.repeat(np.arange(sprint_count), days)
+        cumulative = np.cumsum(burned_by_day)
+        segment_base = np.concatenate(([0.0], cumulative))[offsets]
+        burned = cumulative - segment_base[day_sprint]
+
+        totals = committed_points[day_sprint]
+        remaining = np.maximum(totals - burned, 0)
+        day_in_sprint = np.arange(total_days) - offsets[day_sprint]
+        ideal = totals * (days[day_sprint] - day_in_sprint) / days[day_sprint]
+
+        # 速率 = 迭代结束时已烧掉的故事点
+        has_days = days > 0
+        last_day = offsets[has_days] + days[has_days] - 1
+        completed_points[has_days] = committed_points[has_days] - remaining[last_day]
+
+    remaining = np.round(remaining, 2)
+    ideal = np.round(ideal, 2)
+
+    results = []
+    for i, sprint in enumerate(sprints):
+        start = int(offsets[i])
+        results.append({
+            'id': sprint.id,
+            'name': sprint.name,
+            'status': sprint.status,
+            'start_date': sprint.start_date.strftime('%Y-%m-%d') if sprint.start_date else '',
+            'end_date': sprint.end_date.strftime('%Y-%m-%d') if sprint.end_date else '',
+            'committed_points': round(float(committed_points[i]), 2),
+            'completed_points': round(float(completed_points[i]), 2),
+            'completion_ratio': round(float(completed_points[i] / committed_points[i]), 4) if committed_points[i] else 0,
+            'task_count': int(task_count[i]),
+            'completed_task_count': int(completed_task_count[i]),
+            'burndown_data': [{
+                'date': (sprint.start_date + timedelta(days=day)).strftime('%Y-%m-%d'),
+                'remaining_points': float(remaining[start + day]),
+                'ideal_points': float(ideal[start + day])
+            } for day in range(int(days[i]))]
+        })
+    return results
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+
+class TTLCache:
+    """
+    进程内的 TTL + LRU 缓存（线程安全）
+    :param maxsize: 最多缓存的条目数，超出后淘汰最久未使用的条目
+    :param ttl: 条目存活秒数，过期后视为未命中
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def invalidate_on_commit(session, models, callback):
+    """
+    被监视的模型有写入并提交后调用 callback(发生变化的模型集合)，回滚则不调用
+    包括经过 flush 的增删改，以及不经过 flush 的 Query.update() / Query.delete() 批量语句
+    :param session: db.session
+    """
+    models = tuple(models)
+    pending_key = ('invalidate_on_commit', callback)
+
+    def mark(target_session, changed):
+        if changed:
+            target_session.info.setdefault(pending_key, set()).update(changed)
+
+    @event.listens_for(session, 'after_flush')
+    def collect_changes(target_session, flush_context):
+        mark(target_session, {type(obj) for obj in list(target_session.new) + list(target_session.dirty)
+                              + list(target_session.deleted) if isinstance(obj, models)})
+
+    @event.listens_for(session, 'do_orm_execute')
+    def collect_bulk_changes(orm_execute_state):
+        if orm_execute_state.is_delete or orm_execute_state.is_update:
+            mark(orm_execute_state.session, {mapper.class_ for mapper in orm_execute_state.all_mappers
+                                             if issubclass(mapper.class_, models)})
+
+    @event.listens_for(session, 'after_commit')
+    def apply_invalidation(target_session):
+        changed = target_session.info.pop(pending_key, None)
+        if changed:
+            callback(changed)
+
+    @event.listens_for(session, 'after_rollback')
+    def discard_invalidation(target_session):
+        target_session.info.pop(pending_key, None)
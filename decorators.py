@@ -1,9 +1,118 @@
+from collections import namedtuple
 from functools import wraps
-from flask import request, session, redirect, url_for
+from flask import request, session, redirect, url_for, current_app
+from sqlalchemy.exc import SQLAlchemyError
 from models import SystemFeature
 from utils import check_user_role, check_system_feature_access
 
 
+# 整个蓝图共用同一个系统功能的蓝图，其所有端点都使用该功能的路由名称做权限检查
+BLUEPRINT_FEATURE_KEYS = {
+    'sprints': 'sprints.sprints',
+    'kanban': 'kanban.kanban',
+    'tasks': 'tasks.tasks',
+    'user_stories': 'user_stories.user_stories',
+    'product_backlog': 'product_backlog.product_backlog',
+    'test_cases': 'test_cases.test_cases',
+}
+
+# 单独指定系统功能的端点
+ENDPOINT_FEATURE_KEYS = {
+    # 这个接口可以被有产品待办列表或用户故事权限的用户访问
+    'projects.get_project_modules': 'projects.projects',
+}
+
+# 端点访问规则：对应的功能路由名称、功能是否公开/启用（取自构建时加载的功能记录）、视图内是否已自行检查同一功能
+AccessRule = namedtuple('AccessRule', ['feature_key', 'is_public', 'is_enabled', 'self_checked'])
+
+
+def resolve_feature_key(endpoint):
+    """将端点名称转换为对应的系统功能路由名称"""
+    if endpoint in ENDPOINT_FEATURE_KEYS:
+        return ENDPOINT_FEATURE_KEYS[endpoint]
+    blueprint = endpoint.split('.', 1)[0]
+    return BLUEPRINT_FEATURE_KEYS.get(blueprint, endpoint)
+
+
+def self_checked(feature_key):
+    """
+    标记视图函数内会自行检查该功能的权限（check_system_feature_access），蓝图级检查不再重复
+    需放在 route 装饰器下面：
+        @sprints_bp.route('/sprints')
+        @self_checked('sprints.sprints')
+        def sprints(): ...
+    """
+    def decorator(func):
+        func.self_checked_feature = feature_key
+        return func
+    return decorator
+
+
+def _view_checked_feature(view_func):
+    """返回视图函数标记的自行检查的功能路由名称，没有标记则返回 None"""
+    return getattr(view_func, 'self_checked_feature', None)
+
+
+class EndpointAccessTable:
+    """
+    端点到系统功能的路由表
+    在 create_app() 时遍历 app.url_map 构建一次，请求时只需一次字典查找
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.features = {}
+
+    def build(self, app):
+        with app.app_context():
+            self.refresh_features()
+            for url_rule in app.url_map.iter_rules():
+                endpoint = url_rule.endpoint
+                if endpoint == 'static' or endpoint in self.rules:
+                    continue
+                feature_key = resolve_feature_key(endpoint)
+                checked_key = _view_checked_feature(app.view_functions.get(endpoint))
+                self.rules[endpoint] = self._make_rule(feature_key, checked_key == feature_key)
+        return self
+
+    def _make_rule(self, feature_key, self_checked):
+        feature = self.features.get(feature_key)
+        return AccessRule(feature_key=feature_key, is_public=bool(feature and feature.is_public),
+                          is_enabled=bool(feature and feature.is_enabled), self_checked=self_checked)
+
+    def refresh_features(self):
+        """重新加载系统功能记录并更新已有规则的公开/启用状态（数据库不可用时保留原状态）"""
+        try:
+            self.features = {feature.route_name: feature for feature in SystemFeature.query.all()}
+        except SQLAlchemyError:
+            return
+        for endpoint, rule in self.rules.items():
+            self.rules[endpoint] = self._make_rule(rule.feature_key, rule.self_checked)
+
+    def lookup(self, endpoint):
+        rule = self.rules.get(endpoint)
+        if rule is None:
+            rule = self.rules[endpoint] = self._make_rule(resolve_feature_key(endpoint), False)
+        return rule
+
+    def unmapped_endpoints(self):
+        """列出没有对应系统功能记录的端点"""
+        return sorted(endpoint for endpoint, rule in self.rules.items()
+                      if rule.feature_key not in self.features)
+
+
+def init_endpoint_access(app):
+    """构建端点路由表并挂到 app.extensions 上，需在注册全部蓝图之后调用"""
+    app.extensions['endpoint_access'] = EndpointAccessTable().build(app)
+
+
+def get_endpoint_access_table():
+    table = current_app.extensions.get('endpoint_access')
+    if table is None:
+        table = current_app.extensions['endpoint_access'] = EndpointAccessTable()
+    return table
+
+
 def check_access_blueprint(route_prefix):
     """
     为蓝图创建权限检查装饰器
@@ -12,44 +121,13 @@ def check_access_blueprint(route_prefix):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # 排除静态文件路由
-            if request.endpoint and not request.endpoint.startswith('static'):
-                # 检查当前请求的路由是否需要权限控制
-                endpoint = request.endpoint
-                if endpoint and endpoint.startswith(route_prefix):
-                    # 特殊处理sprints蓝图，所有端点都使用sprints.sprints作为路由名称
-                    if route_prefix == 'sprints':
-                        route_name = 'sprints.sprints'
-                    elif route_prefix == 'kanban':
-                        route_name = 'kanban.kanban'
-                    elif route_prefix == 'tasks':
-                        route_name = 'tasks.tasks'
-                    elif route_prefix == 'user_stories':
-                        route_name = 'user_stories.user_stories'
-                    elif route_prefix == 'product_backlog':
-                        route_name = 'product_backlog.product_backlog'
-                    elif route_prefix == 'test_cases':
-                        route_name = 'test_cases.test_cases'
-                    elif route_prefix == 'projects' and endpoint == 'projects.get_project_modules':
-                        # 允许特定的项目模块获取接口通过权限检查
-                        # 这个接口可以被有产品待办列表或用户故事权限的用户访问
-                        route_name = 'projects.projects'
-                    else:
-                        # 对于knowledge蓝图和其他蓝图，直接使用端点名称转换为路由名称
-                        # 将 'knowledge.knowledge_view' 转换为 'knowledge.knowledge_view'
-                        if '.' in endpoint:
-                            # 如果endpoint已经包含蓝图前缀，则直接使用
-                            route_name = endpoint
-                        else:
-                            # 否则按原有逻辑转换
-                            route_name = endpoint.replace('_', '.', 1)
-                            if not route_name.startswith(f'{route_prefix}.'):
-                                # 如果转换后不符合预期格式，则使用基础路由名称
-                                route_name = f'{route_prefix}.{route_prefix}'
-
-                    # 使用 utils 中的 check_system_feature_access 函数来检查权限
-                    if not check_system_feature_access(session, route_name):
-                        return redirect(url_for('auth.index'))
+            endpoint = request.endpoint
+            # 排除静态文件路由，只检查属于该前缀的端点
+            if endpoint and not endpoint.startswith('static') and endpoint.startswith(route_prefix):
+                rule = get_endpoint_access_table().lookup(endpoint)
+                # 视图内会检查同一功能的，无需在蓝图级重复检查
+                if not rule.self_checked and not check_system_feature_access(session, rule.feature_key):
+                    return redirect(url_for('auth.index'))
             return func(*args, **kwargs)
         return wrapper
     return decorator
@@ -0,0 +1,154 @@
+"""
+流式导出 Excel / CSV
+数据用服务端游标（yield_per）分批读取，Excel 使用 openpyxl 的 write_only 模式逐行写入临时文件，
+CSV 边查询边输出；列宽只根据前若干行估算，内存占用与导出行数无关。
+"""
+
+import codecs
+import csv
+import io
+import tempfile
+from collections import namedtuple
+from itertools import chain, islice
+from urllib.parse import quote
+
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+
+
+# 导出列：表头和取值函数（参数为查询结果的一行）
+ExportColumn = namedtuple('ExportColumn', ['header', 'value'])
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 每次从数据库读取的行数
+YIELD_PER = 1000
+# 用于估算列宽的行数
+WIDTH_SAMPLE_SIZE = 200
+MAX_COLUMN_WIDTH = 50
+# 下载时每次发送的字节数
+BLOCK_SIZE = 64 * 1024
+
+
+def format_datetime(value, fmt='%Y-%m-%d %H:%M:%S'):
+    return value.strftime(fmt) if value else ''
+
+
+def format_date(value):
+    return format_datetime(value, '%Y-%m-%d')
+
+
+def iter_values(query, columns):
+    """用服务端游标分批读取查询结果，逐行转换为单元格值"""
+    for row in query.yield_per(YIELD_PER):
+        yield [column.value(row) for column in columns]
+
+
+def _attachment(filename):
+    # 中文文件名按 RFC 5987 编码
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+def _column_widths(headers, sample):
+    widths = [len(str(header)) for header in headers]
+    for values in sample:
+        for index, value in enumerate(values):
+            if value is not None:
+                widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def _send_file_blocks(output):
+    try:
+        output.seek(0)
+        while True:
+            block = output.read(BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+    finally:
+        output.close()
+
+
+def write_xlsx(query, columns, sheet_title, output):
+    """
+    以 write_only 模式逐行写入 Excel 到 output（文件或文件对象）
+    write_only 模式下列宽必须在写入数据前设置，因此先缓存前 WIDTH_SAMPLE_SIZE 行用于估算
+    """
+    headers = [column.header for column in columns]
+    rows = iter_values(query, columns)
+    sample = list(islice(rows, WIDTH_SAMPLE_SIZE))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    for index, width in enumerate(_column_widths(headers, sample), 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for values in chain(sample, rows):
+        ws.append(values)
+    wb.save(output)
+
+
+def iter_csv(query, columns):
+    """逐批生成 CSV 字节块（带 BOM，Excel 可直接打开中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield codecs.BOM_UTF8
+    writer.writerow([column.header for column in columns])
+    for count, values in enumerate(iter_values(query, columns), 1):
+        writer.writerow(values)
+        if count % YIELD_PER == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_export(query, columns, path, sheet_title, export_format='xlsx'):
+    """导出到文件（后台任务使用）"""
+    if export_format == 'csv':
+        with open(path, 'wb') as output:
+            for block in iter_csv(query, columns):
+                output.write(block)
+    else:
+        write_xlsx(query, columns, sheet_title, path)
+
+
+def export_filename(filename, export_format='xlsx'):
+    return f"{filename}.{'csv' if export_format == 'csv' else 'xlsx'}"
+
+
+def xlsx_response(query, columns, filename, sheet_title):
+    """导出为 Excel：写入磁盘上的临时文件，再分块发送"""
+    output = tempfile.TemporaryFile()
+    write_xlsx(query, columns, sheet_title, output)
+    return Response(_send_file_blocks(output), mimetype=XLSX_MIMETYPE,
+                    headers={'Content-Disposition': _attachment(filename)})
+
+
+def csv_response(query, columns, filename):
+    """导出为 CSV：边查询边输出"""
+    return Response(stream_with_context(iter_csv(query, columns)), mimetype='text/csv',
+                    headers={'Content-Disposition': _attachment(filename)})
+
+
+def export_response(query, columns, filename, sheet_title, export_format='xlsx'):
+    """
+    按 export_format（xlsx / csv）返回流式下载响应
+    :param filename: 不带扩展名的文件名
+    """
+    if export_format == 'csv':
+        return csv_response(query, columns, export_filename(filename, export_format))
+    return xlsx_response(query, columns, export_filename(filename, export_format), sheet_title)
@@ -0,0 +1,358 @@
+"""
+Excel 批量导入
+整张表只读一次：先校验行并收集引用到的名称，每种实体用一次 IN 查询解析成 名称->ID 字典，
+再按块分配编号，最后分批 executemany 插入。查询次数与行数无关，只与批次数有关。
+大文件（测试用例）使用只读模式流式读取，按批解析、插入并提交，内存占用与文件大小无关。
+"""
+
+from collections import defaultdict
+from datetime import datetime, date
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from models import db, Defect, ProjectInfo, Sprint, User, UserStory, TestCase
+from sequences import allocate_codes, defect_sequence, case_sequence
+from todo_digest import mark_todo_users
+
+
+# 每批插入的行数，同时也是 IN 查询每批的名称数
+CHUNK_SIZE = 1000
+
+
+class ImportReport:
+    """导入结果：成功行数和逐行错误（Excel 行号从 2 开始，第 1 行为表头）"""
+
+    def __init__(self):
+        self.imported_count = 0
+        self.errors = []  # [(行号, 错误信息)]
+        self.last_committed_row = None  # 分批提交时已提交到的行号
+        self.aborted = None  # 中途失败时的错误信息，之后的行未导入
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    @property
+    def error_count(self):
+        return len(self.errors)
+
+    def to_dict(self):
+        return {
+            'imported_count': self.imported_count,
+            'error_count': self.error_count,
+            'errors': [{'row': row_number, 'message': message} for row_number, message in self.errors],
+            'last_committed_row': self.last_committed_row,
+            'aborted': self.aborted
+        }
+
+
+def chunked(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def cell_text(value):
+    """单元格转为去掉首尾空白的字符串，空单元格返回 None"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def cell_datetime(value, fmt):
+    """单元格转为时间，字符串按 fmt 解析；空单元格或无法解析时返回 None"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = cell_text(value)
+    if text:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def cell_date(value):
+    """单元格转为日期，支持 YYYY-MM-DD 字符串和 Excel 日期；空单元格返回 None，格式错误抛出 ValueError"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    raise ValueError(f'无法识别的日期: {value}')
+
+
+def lookup_ids(name_column, id_column, names, *extra_columns):
+    """
+    按名称批量查询ID，每 CHUNK_SIZE 个名称一次 IN 查询
+    名称重复时取ID最小的一条；指定 extra_columns 时值为 (ID, 其他列...)
+    """
+    names = sorted({name for name in names if name})
+    result = {}
+    for batch in chunked(names):
+        rows = db.session.query(name_column, id_column, *extra_columns).filter(
+            name_column.in_(batch)).order_by(id_column.desc())
+        for row in rows:
+            result[row[0]] = tuple(row[1:]) if extra_columns else row[1]
+    return result
+
+
+class NameCache:
+    """名称 -> ID 的缓存，每批只查询尚未解析过的名称（不存在的名称也会缓存为 None）"""
+
+    def __init__(self, name_column, id_column, *extra_columns):
+        self.name_column = name_column
+        self.id_column = id_column
+        self.extra_columns = extra_columns
+        self._values = {}
+
+    def resolve(self, names):
+        missing = {name for name in names if name and name not in self._values}
+        if missing:
+            found = lookup_ids(self.name_column, self.id_column, missing, *self.extra_columns)
+            for name in missing:
+                self._values[name] = found.get(name)
+
+    def get(self, name, default=None):
+        value = self._values.get(name) if name else None
+        return default if value is None else value
+
+
+def insert_mappings(model, mappings):
+    """分批插入（executemany），不提交事务"""
+    for batch in chunked(mappings):
+        db.session.bulk_insert_mappings(model, batch)
+
+
+def import_defects(file, user_id):
+    """
+    导入缺陷（不提交事务）
+    :param file: 上传的 .xlsx 文件
+    :param user_id: 当前用户，作为创建人和默认负责人
+    :return: ImportReport
+    """
+    report = ImportReport()
+    df = pd.read_excel(file, engine='openpyxl')
+    rows = df.to_dict('records')
+
+    def text(row, column, default=None):
+        value = cell_text(row.get(column))
+        return value if value is not None else default
+
+    # 第一遍：必填校验并收集引用到的名称
+    candidates = []
+    project_names, sprint_names, user_names = set(), set(), set()
+    for index, row in enumerate(rows):
+        row_number = index + 2
+        title = text(row, '标题')
+        project_name = text(row, '所属项目')
+        if not title:
+            report.add_error(row_number, '标题为必填项')
+            continue
+        if not project_name:
+            report.add_error(row_number, '所属项目为必填项')
+            continue
+        project_names.add(project_name)
+        sprint_names.add(text(row, '所属迭代'))
+        user_names.update((text(row, '负责人'), text(row, '解决者')))
+        candidates.append((row_number, row, title, project_name))
+
+    # 每种实体一次 IN 查询
+    project_ids = lookup_ids(ProjectInfo.name, ProjectInfo.id, project_names)
+    sprint_ids = lookup_ids(Sprint.name, Sprint.id, sprint_names)
+    user_ids = lookup_ids(User.name, User.id, user_names)
+
+    # 第二遍：解析引用和字段，生成待插入的行
+    mappings = []
+    now = datetime.utcnow()
+    for row_number, row, title, project_name in candidates:
+        project_id = project_ids.get(project_name)
+        if project_id is None:
+            report.add_error(row_number, f'项目"{project_name}"不存在')
+            continue
+        try:
+            start_date = cell_date(row.get('开始日期'))
+            end_date = cell_date(row.get('结束日期'))
+        except ValueError as e:
+            report.add_error(row_number, f'日期格式错误 - {str(e)}')
+            continue
+
+        # 找不到的迭代、解决者置空，找不到的负责人默认为创建者
+        mappings.append({
+            'title': title,
+            'project_id': project_id,
+            'sprint_id': sprint_ids.get(text(row, '所属迭代')),
+            'work_item_type': text(row, '工作项类型', 'defect'),
+            'description': text(row, '缺陷描述', ''),
+            'assignee_id': user_ids.get(text(row, '负责人'), user_id),
+            'priority': text(row, '优先级', 'P3'),
+            'is_online': text(row, '是否线上缺陷') == '是',
+            'severity': text(row, '严重程度', '一般'),
+            'defect_type': text(row, '缺陷类型', '功能问题'),
+            'status': text(row, '缺陷状态', '待处理'),
+            'resolver_id': user_ids.get(text(row, '解决者')),
+            'resolution': text(row, '处理结果', '未设置'),
+            'dev_team': text(row, '开发团队', ''),
+            'collaborators': text(row, '协助者', ''),
+            'start_date': start_date,
+            'end_date': end_date,
+            'created_by_id': user_id,
+            'created_at': now,
+            'updated_at': now
+        })
+
+    # 一次分配整块编号，再分批插入
+    for mapping, defect_id in zip(mappings, allocate_codes(defect_sequence(), len(mappings))):
+        mapping['defect_id'] = defect_id
+    insert_mappings(Defect, mappings)
+    # 批量插入不触发 Session 事件，手动登记需要刷新待办的用户
+    mark_todo_users(db.session, {user_id for mapping in mappings
+                                 for user_id in (mapping['assignee_id'], mapping['resolver_id'])})
+    report.imported_count = len(mappings)
+    report.errors.sort()
+    return report
+
+
+# 测试用例导入模板的列，顺序与导出一致
+TEST_CASE_COLUMNS = (
+    'case_id', 'edit_status', 'project_name', 'project_module', 'sprint_name', 'user_story_title',
+    'title', 'case_type', 'function_point', 'precondition', 'steps', 'expected_result',
+    'priority', 'is_automated', 'created_by_name', 'created_at', 'tested_by_name', 'test_environment',
+    'tested_at', 'execution_status', 'test_result', 'actual_result', 'remarks'
+)
+
+
+def import_test_cases(file, user_id, start_row=2, chunk_size=CHUNK_SIZE, on_progress=None):
+    """
+    流式导入测试用例：只读模式逐行读取，每 chunk_size 行解析名称、分配编号、插入并提交一次，
+    内存占用与文件大小无关。某一批失败时回滚该批并停止，之前的批次已提交，
+    可根据 report.last_committed_row 从下一行继续导入。
+    :param user_id: 当前用户，编写人为空或不存在时作为编写人
+    :param start_row: 从第几行开始导入（第 1 行为表头）
+    :param on_progress: 每批提交后调用 on_progress(已提交到的行号, 总行数)，总行数未知时为 None
+    :return: ImportReport
+    """
+    report = ImportReport()
+    caches = {
+        'project': NameCache(ProjectInfo.name, ProjectInfo.id, ProjectInfo.short_name),
+        'sprint': NameCache(Sprint.name, Sprint.id),
+        'user_story': NameCache(UserStory.title, UserStory.id, UserStory.story_id),
+        'user': NameCache(User.name, User.id),
+    }
+    start_row = max(start_row, 2)
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        # 文件损坏或不是有效的 .xlsx 文件
+        report.aborted = f'文件无法读取，请确认是有效的.xlsx文件: {str(e)}'
+        return report
+    try:
+        total_rows = workbook.active.max_row
+        chunk = []
+        for row_number, values in enumerate(workbook.active.iter_rows(min_row=start_row, values_only=True), start_row):
+            if not any(value is not None and value != '' for value in values):
+                continue
+            values = tuple(values) + (None,) * (len(TEST_CASE_COLUMNS) - len(values))
+            chunk.append((row_number, dict(zip(TEST_CASE_COLUMNS, values))))
+            if len(chunk) >= chunk_size:
+                if not _import_test_case_chunk(chunk, caches, user_id, report):
+                    return report
+                chunk = []
+                if on_progress:
+                    on_progress(report.last_committed_row, total_rows)
+        if chunk:
+            _import_test_case_chunk(chunk, caches, user_id, report)
+    finally:
+        workbook.close()
+    return report
+
+
+def _import_test_case_chunk(chunk, caches, user_id, report):
+    """解析、插入并提交一批测试用例，失败时回滚并返回 False"""
+    rows = [(row_number, {key: cell_text(value) if key not in ('created_at', 'tested_at') else value
+                          for key, value in row.items()})
+            for row_number, row in chunk]
+    caches['project'].resolve(row['project_name'] for _, row in rows)
+    caches['sprint'].resolve(row['sprint_name'] for _, row in rows)
+    caches['user_story'].resolve(row['user_story_title'] for _, row in rows)
+    caches['user'].resolve(name for _, row in rows for name in (row['created_by_name'], row['tested_by_name']))
+
+    # Excel 中填写的编号（无法自动生成时使用）一次查询检查是否已存在
+    given_ids = {row['case_id'] for _, row in rows if row['case_id']}
+    existing_ids = {case_id for (case_id,) in db.session.query(TestCase.case_id).filter(
+        TestCase.case_id.in_(given_ids))} if given_ids else set()
+
+    errors = []
+    mappings = []
+    scoped = defaultdict(list)  # (项目简称, 故事编号) -> 需要自动生成编号的行
+    now = datetime.utcnow()
+    for row_number, row in rows:
+        if not row['title']:
+            errors.append((row_number, '用例标题为必填项'))
+            continue
+        project = caches['project'].get(row['project_name'])
+        if project is None:
+            errors.append((row_number, f'项目"{row["project_name"]}"不存在' if row['project_name'] else '所属项目为必填项'))
+            continue
+        project_id, project_short_name = project
+        user_story_id, story_code = caches['user_story'].get(row['user_story_title'], (None, None))
+
+        mapping = {
+            'case_id': None,
+            'project_id': project_id,
+            'project_module': row['project_module'],
+            'sprint_id': caches['sprint'].get(row['sprint_name']),
+            'user_story_id': user_story_id,
+            'edit_status': row['edit_status'] or '新增',
+            'execution_status': row['execution_status'] or '未开始',
+            'test_result': row['test_result'],
+            'case_type': row['case_type'],
+            'function_point': row['function_point'],
+            'title': row['title'],
+            'precondition': row['precondition'],
+            'steps': row['steps'],
+            'expected_result': row['expected_result'],
+            'actual_result': row['actual_result'],
+            'test_environment': row['test_environment'],
+            'priority': row['priority'] or 'P3',
+            'is_automated': row['is_automated'] == '是',
+            'created_by_id': caches['user'].get(row['created_by_name'], user_id),
+            'created_at': cell_datetime(row['created_at'], '%Y-%m-%d %H:%M:%S') or now,
+            'updated_at': now,
+            'tested_by_id': caches['user'].get(row['tested_by_name']),
+            'tested_at': cell_datetime(row['tested_at'], '%Y-%m-%d'),
+            'remarks': row['remarks']
+        }
+        if project_short_name and story_code:
+            scoped[(project_short_name, story_code)].append(mapping)
+        elif row['case_id']:
+            if row['case_id'] in existing_ids:
+                errors.append((row_number, f'用例编号"{row["case_id"]}"已存在'))
+                continue
+            existing_ids.add(row['case_id'])
+            mapping['case_id'] = row['case_id']
+        mappings.append(mapping)
+
+    try:
+        # 每个编号前缀一次分配整块编号
+        for (project_short_name, story_code), scope_mappings in scoped.items():
+            codes = allocate_codes(case_sequence(project_short_name, story_code), len(scope_mappings))
+            for mapping, case_id in zip(scope_mappings, codes):
+                mapping['case_id'] = case_id
+        db.session.bulk_insert_mappings(TestCase, mappings)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        report.aborted = f'第{chunk[0][0]}-{chunk[-1][0]}行导入失败: {str(e)}'
+        return False
+
+    report.imported_count += len(mappings)
+    report.errors.extend(errors)
+    report.last_committed_row = chunk[-1][0]
+    return True
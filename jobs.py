@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, func
+from sqlalchemy.exc import SQLAlchemyError
+
+from exporters import write_export, export_filename
+from models import db, BackgroundJob
+
+
+JOB_PENDING = '排队中'
+JOB_RUNNING = '运行中'
+JOB_DONE = '已完成'
+JOB_FAILED = '失败'
+
+# 运行中的任务每隔 HEARTBEAT_INTERVAL 秒更新心跳；超过 STALE_AFTER 没有心跳的视为执行进程已退出
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = timedelta(minutes=5)
+# 结果文件保留时间，过期后删除文件
+RESULT_TTL = timedelta(days=1)
+
+logger = logging.getLogger(__name__)
+
+# 任务类型 -> 处理函数 handler(job, params, progress)，返回结果字典（如导入报告）
+_handlers = {}
+
+
+def job_handler(job_type):
+    """注册后台任务处理函数"""
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+class BackgroundJobRunner:
+    """
+    本地后台任务执行器：任务记录在 background_job 表中，由进程内线程池执行，不依赖外部消息队列
+    请求只负责保存上传文件、插入任务记录并立即返回任务ID，前端轮询进度，完成后下载结果文件。
+    多个进程（如 gunicorn 的多个 worker）共用任务表：任务通过条件 UPDATE 原子认领，同一任务只会执行一次；
+    执行中的进程定时更新心跳，只有心跳超时的运行中任务才标记为失败。
+    进程启动时重新提交排队中的任务，已被其他进程认领的会直接跳过。
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self.job_folder = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = None
+        self._app = None
+        self._heartbeat_thread = None
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['background_jobs'] = self
+        self.job_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'jobs')
+        os.makedirs(self.job_folder, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='background-job')
+        with app.app_context():
+            try:
+                self._recover()
+            except SQLAlchemyError:
+                # 数据库尚未就绪（如表还未创建）
+                db.session.rollback()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='background-job-heartbeat',
+                                                  daemon=True)
+        self._heartbeat_thread.start()
+
+    def _recover(self):
+        self._fail_stale_jobs()
+        for (job_id,) in db.session.query(BackgroundJob.id).filter_by(status=JOB_PENDING).order_by(BackgroundJob.id):
+            self._executor.submit(self._run, job_id)
+
+    def _fail_stale_jobs(self):
+        """心跳超时的运行中任务标记为失败（执行它的进程已退出），并删除其上传文件"""
+        last_seen = func.coalesce(BackgroundJob.heartbeat_at, BackgroundJob.started_at, BackgroundJob.created_at)
+        stale = (BackgroundJob.status == JOB_RUNNING) & (last_seen < datetime.utcnow() - STALE_AFTER)
+        stale_jobs = db.session.query(BackgroundJob.id, BackgroundJob.input_path).filter(stale).all()
+        if not stale_jobs:
+            return
+        # 条件中再次带上心跳超时，避免覆盖在此期间恢复心跳或完成的任务
+        failed = db.session.execute(update(BackgroundJob).where(
+            BackgroundJob.id.in_([job.id for job in stale_jobs]), stale
+        ).values(
+            status=JOB_FAILED, message='任务执行中断，请重新提交', finished_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if failed:
+            logger.warning('%s 个后台任务心跳超时，已标记为失败', failed)
+        for job in stale_jobs:
+            remove_file(job.input_path)
+
+    def _heartbeat_loop(self):
+        """定时更新本进程运行中任务的心跳，并回收其他进程遗留的超时任务和过期结果文件"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._app.app_context():
+                try:
+                    db.session.execute(update(BackgroundJob).where(
+                        BackgroundJob.owner == self.owner, BackgroundJob.status == JOB_RUNNING
+                    ).values(heartbeat_at=datetime.utcnow()).execution_options(synchronize_session=False))
+                    db.session.commit()
+                    self._fail_stale_jobs()
+                    purge_expired_results()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('后台任务心跳更新失败')
+                finally:
+                    db.session.remove()
+
+    def _claim(self, job_id):
+        """原子认领排队中的任务，返回是否认领成功（其他进程已认领时返回 False）"""
+        now = datetime.utcnow()
+        claimed = db.session.execute(update(BackgroundJob).where(
+            BackgroundJob.id == job_id, BackgroundJob.status == JOB_PENDING
+        ).values(
+            status=JOB_RUNNING, owner=self.owner, started_at=now, heartbeat_at=now
+        ).execution_options(synchronize_session=False)).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def file_path(self, suffix=''):
+        """在任务目录下生成一个不重复的文件路径"""
+        return os.path.join(self.job_folder, f"{uuid.uuid4().hex}{suffix}")
+
+    def enqueue(self, job_type, user_id, params=None, upload=None):
+        """
+        提交任务（会提交当前事务）
+        :param upload: 上传的文件，保存到任务目录后由任务读取
+        """
+        if job_type not in _handlers:
+            raise ValueError(f'未知的任务类型: {job_type}')
+        job = BackgroundJob(job_type=job_type, user_id=user_id, status=JOB_PENDING,
+                            params=json.dumps(params or {}, ensure_ascii=False))
+        if upload is not None:
+            job.input_path = self.file_path(os.path.splitext(upload.filename)[1])
+            upload.save(job.input_path)
+        db.session.add(job)
+        db.session.commit()
+        self._executor.submit(self._run, job.id)
+        return job
+
+    def _run(self, job_id):
+        with self._app.app_context():
+            try:
+                self._execute(job_id)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                db.session.remove()
+
+    def _execute(self, job_id):
+        if not self._claim(job_id):
+            return
+        job = db.session.get(BackgroundJob, job_id)
+
+        try:
+            result = _handlers[job.job_type](job, json.loads(job.params or '{}'),
+                                              lambda progress, message=None: set_progress(job_id, progress, message))
+            db.session.commit()
+            job = db.session.get(BackgroundJob, job_id)
+            job.status = JOB_DONE
+            job.progress = 100
+            job.result = json.dumps(result or {}, ensure_ascii=False)
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            job = db.session.get(BackgroundJob, job_id)
+            job.status = JOB_FAILED
+            job.message = str(e)[:512]
+        finally:
+            remove_file(job.input_path)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        purge_expired_results()
+
+
+def remove_file(path):
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            logger.exception('删除任务文件失败: %s', path)
+
+
+def purge_expired_results():
+    """删除超过保留时间的结果文件，任务记录保留但不再提供下载"""
+    expired = db.session.query(BackgroundJob.id, BackgroundJob.result_path).filter(
+        BackgroundJob.result_path.isnot(None),
+        BackgroundJob.finished_at < datetime.utcnow() - RESULT_TTL
+    ).all()
+    if not expired:
+        return
+    for job in expired:
+        remove_file(job.result_path)
+    db.session.execute(update(BackgroundJob).where(
+        BackgroundJob.id.in_([job.id for job in expired])
+    ).values(result_path=None).execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+def set_progress(job_id, progress, message=None):
+    """
+    更新任务进度
+    使用独立连接提交，不影响任务自身的事务，也不会打断正在读取的服务端游标
+    """
+    values = {'progress': max(0, min(int(progress), 99)), 'heartbeat_at': datetime.utcnow()}
+    if message is not None:
+        values['message'] = message[:512]
+    with db.engine.begin() as connection:
+        connection.execute(update(BackgroundJob.__table__).where(BackgroundJob.__table__.c.id == job_id).values(**values))
+
+
+def run_export_job(job, export, export_format):
+    """
+    把导出写入结果文件
+    :param export: (query, columns, 不带扩展名的文件名, 工作表名)
+    """
+    query, columns, filename, sheet_title = export
+    job.result_name = export_filename(filename, export_format)
+    job.result_path = background_jobs.file_path(os.path.splitext(job.result_name)[1])
+    write_export(query, columns, job.result_path, sheet_title, export_format)
+    return {}
+
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress or 0,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'has_file': bool(job.result_path),
+        'result_name': job.result_name,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None
+    }
+
+
+background_jobs = BackgroundJobRunner()
@@ -0,0 +1,66 @@
+"""
+列表页的预加载配置
+模型的关联关系默认懒加载，模板逐行访问 defect.assignee、case.project 等关联对象时每行都会多发一条查询。
+每个列表页在这里定义一组加载选项，查询时通过 query.options(*DEFECT_LIST) 一并加载：
+多对一关联用 joinedload（同一条 SQL 联表），一对多关联用 selectinload（按主键 IN 再查一次），
+页面的查询次数不随行数增长。模板新增关联字段时同步修改对应的配置，tests/test_query_counts.py 会检查。
+"""
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import (Defect, TestCase, ProductBacklog, UserStory, Sprint, SprintBacklog, AgileKnowledge,
+                    GameRound)
+
+
+# 缺陷列表 defects/list.html：所属项目、负责人、处理人
+DEFECT_LIST = (
+    joinedload(Defect.project),
+    joinedload(Defect.assignee),
+    joinedload(Defect.resolver),
+)
+
+# 测试用例列表 test_cases.html：所属项目、迭代、用户故事
+TEST_CASE_LIST = (
+    joinedload(TestCase.project),
+    joinedload(TestCase.sprint),
+    joinedload(TestCase.user_story),
+)
+
+# 需求列表 product_backlog.html：所属项目、功能模块、需求责任人
+PRODUCT_BACKLOG_LIST = (
+    joinedload(ProductBacklog.project),
+    joinedload(ProductBacklog.project_module),
+    joinedload(ProductBacklog.customer_owner),
+)
+
+# 需求下的用户故事（user_stories.html 通过接口加载）：故事所在的迭代
+USER_STORY_LIST = (
+    selectinload(UserStory.sprint_backlogs).joinedload(SprintBacklog.sprint),
+)
+
+# 迭代列表 sprints.html：所属项目、产品负责人、Scrum Master
+SPRINT_LIST = (
+    joinedload(Sprint.project),
+    joinedload(Sprint.product_owner),
+    joinedload(Sprint.scrum_master),
+)
+
+# 迭代详情 sprint_detail.html：产品负责人、Scrum Master，以及迭代待办的用户故事和负责人
+SPRINT_DETAIL = (
+    joinedload(Sprint.product_owner),
+    joinedload(Sprint.scrum_master),
+    selectinload(Sprint.sprint_backlogs).options(
+        joinedload(SprintBacklog.user_story),
+        joinedload(SprintBacklog.assignee),
+    ),
+)
+
+# 知识库列表 knowledge_list.html / knowledge_view.html：作者
+KNOWLEDGE_LIST = (
+    joinedload(AgileKnowledge.author),
+)
+
+# 估算历史 history.html：回合的用户故事（出牌由 round_progress.load_round_votes 批量加载）
+HISTORY_LIST = (
+    joinedload(GameRound.user_story),
+)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数据库迁移
+db.create_all() 只会创建缺失的表，已有表上的数据初始化、索引等变更放在这里按版本号顺序执行一次，
+已执行的版本记录在 schema_migration 表中。
+
+使用方法：python migrations.py（app.py 启动时也会自动执行）
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from models import db, SchemaMigration, ProductBacklog, UserStory, Task, TestCase, Defect, AgileKnowledge, \
+    UserRole, GameRound, Estimate, ProjectInfo, SprintBacklog, BackgroundJob
+from project_tree import group_children, rebuild_paths
+from sequences import observe_value, parse_seq, requirement_sequence, defect_sequence
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """注册一个迁移，版本号必须递增且不能修改已发布的版本"""
+    def decorator(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return decorator
+
+
+@migration(1, '根据现有业务编号初始化编号序列')
+def seed_id_sequences():
+    max_values = {}
+
+    def observe(scope, seq):
+        if seq is not None:
+            max_values[scope] = max(max_values.get(scope, 0), seq)
+
+    # 需求编号 R_序号、缺陷编号 F_序号（全局）
+    for sequence, column in ((requirement_sequence(), ProductBacklog.requirement_id),
+                             (defect_sequence(), Defect.defect_id)):
+        scope, prefix, _ = sequence
+        for (code,) in db.session.query(column):
+            observe(scope, parse_seq(code, prefix))
+
+    # 故事编号 US_需求ID_序号（按需求）
+    for row in db.session.query(UserStory.product_backlog_id, UserStory.story_id).filter(
+            UserStory.product_backlog_id.isnot(None)):
+        observe(f'story:{row.product_backlog_id}',
+                parse_seq(row.story_id, f"US_{str(row.product_backlog_id).zfill(3)}_"))
+
+    # 任务编号 TA_故事编号_序号 或 TA_序号（按故事）
+    for row in db.session.query(Task.user_story_id, Task.task_id, UserStory.story_id).join(
+            UserStory, UserStory.id == Task.user_story_id):
+        prefix = f"TA_{row.story_id}_" if row.story_id and row.story_id.startswith('US_') else 'TA_'
+        observe(f'task:{row.user_story_id}', parse_seq(row.task_id, prefix))
+
+    # 用例编号 项目简称-故事编号-序号（按前缀）
+    for (code,) in db.session.query(TestCase.case_id):
+        if code and '-' in code:
+            head, tail = code.rsplit('-', 1)
+            observe(f'case:{head}', int(tail) if tail.isdigit() else None)
+
+    for scope, value in max_values.items():
+        observe_value(scope, value)
+
+
+def is_fulltext(index):
+    return index.dialect_options['mysql'].get('prefix') == 'FULLTEXT'
+
+
+def create_fulltext_index(index, rebuild=False):
+    """
+    创建全文索引时关闭 InnoDB 默认停用词表（停用词表在建索引时绑定到索引上）
+    ngram 分词会丢弃包含停用词的词元，默认停用词表里有 a、i 等单个字母，开启时大部分英文关键词和编号都搜不到
+    """
+    with db.engine.begin() as connection:
+        connection.execute(text('SET SESSION innodb_ft_enable_stopword = OFF'))
+        try:
+            if rebuild:
+                index.drop(bind=connection)
+            index.create(bind=connection)
+        finally:
+            connection.execute(text('SET SESSION innodb_ft_enable_stopword = DEFAULT'))
+
+
+def create_missing_indexes(*models):
+    """创建模型 __table_args__ 中声明、但已有表上还不存在的索引（db.create_all() 不会给已有表补索引）"""
+    inspector = inspect(db.engine)
+    for model in models:
+        table = model.__table__
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                if is_fulltext(index):
+                    create_fulltext_index(index)
+                else:
+                    index.create(bind=db.engine)
+                print(f"创建索引: {table.name}.{index.name}")
+
+
+def add_missing_columns(model, *column_names):
+    """给已有表补上模型中新增的列（db.create_all() 不会修改已有表）"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    for name in column_names:
+        if name not in existing:
+            column_ddl = CreateColumn(table.c[name]).compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+            print(f"添加列: {table.name}.{name}")
+
+
+FULLTEXT_MODELS = (Defect, TestCase, UserStory, ProductBacklog, AgileKnowledge)
+
+
+@migration(2, '创建全文搜索索引')
+def create_fulltext_indexes():
+    create_missing_indexes(*FULLTEXT_MODELS)
+
+
+@migration(3, '创建常用筛选条件的组合索引')
+def create_filter_indexes():
+    create_missing_indexes(Task, Defect, SprintBacklog, GameRound, Estimate, UserRole, ProjectInfo)
+
+
+@migration(4, '创建游标分页排序列的索引')
+def create_keyset_indexes():
+    create_missing_indexes(Defect, UserStory, AgileKnowledge)
+
+
+@migration(5, '创建我的待办查询的索引')
+def create_todo_indexes():
+    create_missing_indexes(Defect)
+
+
+@migration(6, '后台任务增加认领进程和心跳列')
+def add_job_heartbeat_columns():
+    add_missing_columns(BackgroundJob, 'owner', 'heartbeat_at')
+
+
+@migration(7, '关闭停用词表重建全文搜索索引')
+def rebuild_fulltext_indexes():
+    # 版本 2 建索引时使用了默认停用词表，包含停用词字母的英文关键词搜不到
+    inspector = inspect(db.engine)
+    for model in FULLTEXT_MODELS:
+        table = model.__table__
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if is_fulltext(index):
+                create_fulltext_index(index, rebuild=index.name in existing)
+                print(f"重建索引: {table.name}.{index.name}")
+
+
+@migration(8, '按父节点重建项目节点路径')
+def rebuild_project_paths():
+    # 早期按路径前缀批量改写子树，可能留下过期的路径或误改大小写不同的同名兄弟节点
+    changed = rebuild_paths(group_children(ProjectInfo.query.all()))
+    print(f"修正节点路径: {changed} 个")
+
+
+def run_migrations():
+    """执行尚未执行的迁移，每个版本单独提交"""
+    SchemaMigration.__table__.create(bind=db.engine, checkfirst=True)
+    applied = {row.version for row in db.session.query(SchemaMigration.version)}
+    for version, name, func in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in applied:
+            continue
+        try:
+            func()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+            print(f"执行迁移: {version} {name}")
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        print("数据库迁移完成!")
@@ -38,6 +38,10 @@ class UserRole(db.Model):
     # 关联关系
     user = db.relationship('User', backref='user_roles')
 
+    __table_args__ = (
+        db.Index('ix_user_role_user_role', 'user_id', 'role_id'),  # 按用户加载角色
+    )
+
     def __repr__(self):
         return f'<UserRole user_id={self.user_id} role_id={self.role_id}>'
 
@@ -81,6 +85,12 @@ class AgileKnowledge(db.Model):
 
     author = db.relationship('User', backref='knowledge_articles')
 
+    # 全文索引（ngram 分词，支持中文），用于 search.py 的全文搜索
+    __table_args__ = (
+        db.Index('ft_agile_knowledge_title_content', 'title', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+        db.Index('ix_agile_knowledge_updated', 'updated_at'),  # 知识列表游标分页
+    )
+
 class GameRound(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_story_id = db.Column(db.Integer, db.ForeignKey('user_story.id'), nullable=True)
@@ -91,6 +101,11 @@ class GameRound(db.Model):
     # 增加与UserStory的关联关系
     user_story = db.relationship('UserStory', backref='game_rounds')
 
+    __table_args__ = (
+        db.Index('ix_game_round_story_end', 'user_story_id', 'end_time'),  # 故事的未结束/已结束回合
+        db.Index('ix_game_round_end_time', 'end_time'),  # 启动时加载全部未结束回合
+    )
+
 
 # 项目信息树形结构模型
 class ProjectInfo(db.Model):
@@ -107,6 +122,11 @@ class ProjectInfo(db.Model):
     # 自关联关系
     children = db.relationship('ProjectInfo', backref=db.backref('parent', remote_side=[id]), lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_project_info_parent_order', 'parent_id', 'order'),  # 子节点及同级排序
+        db.Index('ix_project_info_path', 'path'),  # 按路径查询节点
+    )
+
 
 # 产品待办列表模型，用于管理项目需求
 class ProductBacklog(db.Model):
@@ -135,6 +155,11 @@ class ProductBacklog(db.Model):
     # 添加功能模块关联关系
     project_module = db.relationship('ProjectInfo', foreign_keys=[project_module_id], backref='module_requirements')
 
+    # 全文索引（ngram 分词，支持中文），用于 search.py 的全文搜索
+    __table_args__ = (
+        db.Index('ft_product_backlog_title_description', 'title', 'description', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
+
 
 class UserStory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -150,6 +175,12 @@ class UserStory(db.Model):
     # 关联关系
     product_backlog = db.relationship('ProductBacklog', backref='user_stories')  # 关联产品待办列表
 
+    # 全文索引（ngram 分词，支持中文），用于 search.py 的全文搜索
+    __table_args__ = (
+        db.Index('ft_user_story_title_description', 'title', 'description', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+        db.Index('ix_user_story_created', 'created_at'),  # 估算列表游标分页
+    )
+
 # 新增Sprint模型，用于管理迭代信息
 class Sprint(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -185,6 +216,29 @@ class SprintBacklog(db.Model):
     user_story = db.relationship('UserStory', backref='sprint_backlogs')
     assignee = db.relationship('User', foreign_keys=[assignee_id], backref='assigned_sprint_tasks')
 
+    __table_args__ = (
+        db.Index('ix_sprint_backlog_sprint_story', 'sprint_id', 'user_story_id'),  # 迭代的故事
+        db.Index('ix_sprint_backlog_story', 'user_story_id'),  # 故事所在的迭代
+    )
+
+
+
+# 迭代燃尽图每日快照，任务或故事点变化时重算，读取时按日期区间查询
+class SprintBurndownSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sprint_id = db.Column(db.Integer, db.ForeignKey('sprint.id'), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)  # 快照日期
+    remaining_points = db.Column(db.Float, nullable=False, default=0)  # 实际剩余故事点
+    ideal_points = db.Column(db.Float, nullable=False, default=0)  # 理想剩余故事点
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('sprint_id', 'snapshot_date', name='uq_burndown_sprint_date'),
+    )
+
+    # 关联关系
+    sprint = db.relationship('Sprint', backref=db.backref('burndown_snapshots', lazy=True,
+                                                          cascade='all, delete-orphan'))
 
 class Estimate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -193,6 +247,10 @@ class Estimate(db.Model):
     card_value = db.Column(db.String(16), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_estimate_round_user', 'round_id', 'user_id'),  # 回合的出牌
+    )
+
 
 # 任务模型，用于将用户故事拆分成任务
 class Task(db.Model):
@@ -218,6 +276,11 @@ class Task(db.Model):
     assignee = db.relationship('User', foreign_keys=[assignee_id], backref='assigned_tasks')
     user_story = db.relationship('UserStory', backref='tasks')
 
+    __table_args__ = (
+        db.Index('ix_task_story_status', 'user_story_id', 'status'),  # 故事下的任务及完成情况
+        db.Index('ix_task_assignee_status_end', 'assignee_id', 'status', 'end_date'),  # 我的待办
+    )
+
 # 测试用例模型
 class TestCase(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -263,6 +326,11 @@ class TestCase(db.Model):
     created_by = db.relationship('User', foreign_keys=[created_by_id], backref='created_test_cases')
     tested_by = db.relationship('User', foreign_keys=[tested_by_id], backref='tested_test_cases')
 
+    # 全文索引（ngram 分词，支持中文），用于 search.py 的全文搜索
+    __table_args__ = (
+        db.Index('ft_test_case_title_steps_expected', 'title', 'steps', 'expected_result', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
+
 # 原型图管理模型
 class PrototypeImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -317,5 +385,53 @@ class Defect(db.Model):
     resolver = db.relationship('User', foreign_keys=[resolver_id], backref='resolved_defects')
     created_by = db.relationship('User', foreign_keys=[created_by_id], backref='created_defects')
 
+    __table_args__ = (
+        # 全文索引（ngram 分词，支持中文），用于 search.py 的全文搜索
+        db.Index('ft_defect_title_description', 'title', 'description', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+        db.Index('ix_defect_project_status_priority_created', 'project_id', 'status', 'priority', 'created_at'),  # 缺陷列表筛选
+        db.Index('ix_defect_sprint', 'sprint_id'),  # 迭代的缺陷（看板）
+        db.Index('ix_defect_created', 'created_at'),  # 缺陷列表游标分页
+        db.Index('ix_defect_resolver_status', 'resolver_id', 'status'),  # 我的待办：待处理缺陷
+        db.Index('ix_defect_assignee_status', 'assignee_id', 'status'),  # 我的待办：待验证缺陷
+    )
+
     def __repr__(self):
-        return f'<Defect {self.defect_id or self.title}>'
\ No newline at end of file
+        return f'<Defect {self.defect_id or self.title}>'
+
+# 业务编号序列（R_、US_、TA_、F_、用例编号），按范围原子递增
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequence'
+    scope = db.Column(db.String(128), primary_key=True)  # 范围，如 requirement、story:12、case:TIM-US_001_001
+    value = db.Column(db.Integer, nullable=False, default=0)  # 最后分配的序号
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# 已执行的数据库迁移版本
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migration'
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# 后台任务（大文件导入导出），由 jobs.py 中的线程池执行
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_job'
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(64), nullable=False)  # 任务类型，如 defects.import、test_cases.export
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 提交人
+    status = db.Column(db.String(32), default='排队中')  # 排队中、运行中、已完成、失败
+    progress = db.Column(db.Integer, default=0)  # 进度 0-100
+    message = db.Column(db.String(512), nullable=True)  # 进度说明或失败原因
+    params = db.Column(db.Text, nullable=True)  # 任务参数（JSON）
+    input_path = db.Column(db.String(512), nullable=True)  # 上传文件的保存路径
+    result_path = db.Column(db.String(512), nullable=True)  # 结果文件路径
+    result_name = db.Column(db.String(256), nullable=True)  # 结果文件下载名
+    result = db.Column(db.Text, nullable=True)  # 任务结果（JSON），如导入报告
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    owner = db.Column(db.String(128), nullable=True)  # 认领任务的进程（主机名:进程号:随机串）
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # 执行进程最后一次心跳时间，超时视为中断
+
+    user = db.relationship('User', backref='background_jobs')
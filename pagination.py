@@ -0,0 +1,204 @@
+"""
+游标分页（keyset / seek 分页）
+按 (排序列, id) 记住上一页最后一行的位置，下一页用 WHERE 排序列 < 游标值 直接从索引定位，
+不再使用 OFFSET 逐行跳过前面的记录，翻到很深的页也不会变慢。
+总条数只用于显示，按查询条件缓存一段时间，不在每次翻页时执行 COUNT(*)。
+"""
+
+import base64
+import json
+import math
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+from cache import TTLCache
+
+
+MAX_PER_PAGE = 100
+
+# 总条数缓存：新增或删除记录后，最多延迟 TOTAL_CACHE_TTL 秒才反映到显示的总数上
+TOTAL_CACHE_TTL = 60
+_total_cache = TTLCache(maxsize=512, ttl=TOTAL_CACHE_TTL)
+
+
+def clamp_per_page(per_page, default=10):
+    """每页条数限制在 1 ~ MAX_PER_PAGE 之间"""
+    if not per_page:
+        return default
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        raise ValueError('无效的游标值')
+    return value
+
+
+def encode_cursor(direction, sort_value, row_id):
+    """游标：方向 + 排序列的值 + id，JSON 后做 URL 安全的 base64"""
+    payload = json.dumps([direction, _dump_value(sort_value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+    :return: (方向, 排序列的值, id)；游标为空或无效时返回 None（回到第一页）
+    """
+    if not cursor:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, sort_value, row_id = json.loads(payload.decode('utf-8'))
+        if direction not in ('next', 'prev') or not isinstance(row_id, int):
+            return None
+        return direction, _load_value(sort_value), row_id
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(sort_column, id_column, sort_value, row_id, descending):
+    """
+    排在 (sort_value, row_id) 之后的行
+    MySQL 中 NULL 在升序时排最前、降序时排最后，需要单独处理
+    """
+    if descending:
+        if sort_value is None:
+            return and_(sort_column.is_(None), id_column < row_id)
+        return or_(sort_column < sort_value,
+                   and_(sort_column == sort_value, id_column < row_id),
+                   sort_column.is_(None))
+    if sort_value is None:
+        return or_(and_(sort_column.is_(None), id_column > row_id), sort_column.isnot(None))
+    return or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > row_id))
+
+
+def _ordering(sort_column, id_column, descending):
+    if descending:
+        return sort_column.desc(), id_column.desc()
+    return sort_column.asc(), id_column.asc()
+
+
+class KeysetPagination:
+    """
+    一页游标分页结果
+    page 只用于显示“第几页”，随翻页链接传递，不参与查询
+    """
+
+    def __init__(self, items, per_page, page, total, next_cursor, prev_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.total = total
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def first_index(self):
+        """本页第一条记录的序号（从 1 开始）"""
+        return (self.page - 1) * self.per_page + 1 if self.items else 0
+
+    @property
+    def last_index(self):
+        return (self.page - 1) * self.per_page + len(self.items) if self.items else 0
+
+    def link_args(self, direction, args=None):
+        """
+        翻页链接的参数：保留当前的筛选条件，替换游标和页码
+        :param direction: 'next' 下一页，'prev' 上一页（上一页是第一页时不带游标）
+        """
+        params = {key: value for key, value in (args or {}).items() if key not in ('cursor', 'page')}
+        if direction == 'next':
+            params.update(cursor=self.next_cursor, page=self.page + 1)
+        elif direction == 'prev' and self.page > 2:
+            params.update(cursor=self.prev_cursor, page=self.page - 1)
+        return params
+
+
+def cached_total(query):
+    """按查询语句和参数缓存总条数"""
+    # 按数据库方言编译，默认方言无法生成全文搜索的 MATCH ... AGAINST
+    compiled = query.statement.compile(dialect=query.session.get_bind().dialect)
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    total = _total_cache.get(key)
+    if total is None:
+        total = query.order_by(None).count()
+        _total_cache.set(key, total)
+    return total
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, page=1, per_page=10,
+                    descending=False, with_total=True):
+    """
+    按 (sort_column, id_column) 游标分页
+    :param query: 未排序的查询，排序由本函数添加
+    :param cursor: 上一次返回的 next_cursor / prev_cursor，为空时取第一页
+    :param page: 当前页码，只用于显示
+    :param with_total: 是否返回（缓存的）总条数
+    :return: KeysetPagination
+    """
+    per_page = clamp_per_page(per_page)
+    position = decode_cursor(cursor)
+    if position is None:
+        page = 1
+    page = max(1, page or 1)
+    sort_key = sort_column.key
+    id_key = id_column.key
+
+    if position is None:
+        direction = 'next'
+        rows = query.order_by(*_ordering(sort_column, id_column, descending)).limit(per_page + 1).all()
+    else:
+        direction, sort_value, row_id = position
+        # 向前翻页时反向排序取紧挨着游标之前的一页，再倒回来
+        reverse = direction == 'prev'
+        rows = query.filter(_after(sort_column, id_column, sort_value, row_id, descending != reverse)) \
+            .order_by(*_ordering(sort_column, id_column, descending != reverse)).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if direction == 'prev':
+        items.reverse()
+        has_next = True
+        has_prev = has_more
+    else:
+        has_next = has_more
+        has_prev = position is not None
+
+    def cursor_at(item, to):
+        return encode_cursor(to, getattr(item, sort_key), getattr(item, id_key))
+
+    next_cursor = cursor_at(items[-1], 'next') if items and has_next else None
+    prev_cursor = cursor_at(items[0], 'prev') if items and has_prev else None
+    if direction == 'prev' and not has_more:
+        # 已经回到第一页
+        page = 1
+    total = cached_total(query) if with_total else None
+    return KeysetPagination(items, per_page, page, total, next_cursor, prev_cursor)
@@ -0,0 +1,206 @@
+from collections import defaultdict
+
+from cache import TTLCache
+from models import db, ProjectInfo
+
+
+# 序列化后的树按项目缓存；多进程部署时其他进程最多在 ttl 秒后看到节点变化
+_tree_cache = TTLCache(maxsize=256, ttl=300)
+_FOREST_KEY = ('forest',)
+
+
+def _sort_key(node):
+    return (node.order if node.order is not None else 0, node.id)
+
+
+def load_all_nodes():
+    """一次查询加载全部项目节点"""
+    return ProjectInfo.query.all()
+
+
+def _subtree_cte(root_id):
+    """节点及其全部子孙节点 id 的递归 CTE"""
+    subtree = db.session.query(ProjectInfo.id).filter(
+        ProjectInfo.id == root_id
+    ).cte(name='subtree', recursive=True)
+    return subtree.union_all(
+        db.session.query(ProjectInfo.id).join(subtree, ProjectInfo.parent_id == subtree.c.id)
+    )
+
+
+def load_subtree(root_id, node_types=None):
+    """
+    使用递归 CTE 一次查询加载节点及其全部子孙节点（需要 MySQL 8.0+）
+    :param node_types: 只返回指定类型的节点，如 ['menu', 'page']
+    """
+    subtree = _subtree_cte(root_id)
+    query = ProjectInfo.query.join(subtree, ProjectInfo.id == subtree.c.id)
+    if node_types:
+        query = query.filter(ProjectInfo.node_type.in_(node_types))
+    return query.all()
+
+
+def is_in_subtree(root_id, node_id):
+    """判断 node_id 是否为 root_id 自身或其子孙节点（一次查询）"""
+    subtree = _subtree_cte(root_id)
+    return db.session.query(subtree.c.id).filter(subtree.c.id == node_id).first() is not None
+
+
+def child_path(parent, name):
+    """计算节点在父节点下的路径，parent 为 None 时为根节点路径"""
+    if parent is None:
+        return f"/{name}"
+    return f"{parent.path}/{name}" if parent.path else f"/{parent.name}/{name}"
+
+
+def rebuild_paths(children, parent_id=None, parent_path=None):
+    """
+    按 parent_id 从上往下重新计算 parent_id 下全部子孙节点的路径（不提交事务）
+    路径只由祖先节点的名称决定，不依赖节点原有的 path，原路径有误时也能修正
+    :param children: group_children 的结果
+    :param parent_path: parent_id 节点的路径，为 None 时从根节点开始
+    :return: 路径发生变化的节点数
+    """
+    changed = 0
+    stack = [(parent_id, parent_path)]
+    while stack:
+        current_id, current_path = stack.pop()
+        for child in children.get(current_id, []):
+            path = f"{current_path}/{child.name}" if current_path is not None else f"/{child.name}"
+            if child.path != path:
+                child.path = path
+                changed += 1
+            stack.append((child.id, path))
+    return changed
+
+
+def rewrite_subtree_path(node, new_path):
+    """
+    修改节点路径，并重新计算全部子孙节点的路径（不提交事务）
+    子孙节点由递归 CTE 一次查询加载，只更新该子树内路径发生变化的节点
+    :return: 更新的子孙节点数
+    """
+    node.path = new_path
+    return rebuild_paths(group_children(load_subtree(node.id)), node.id, new_path)
+
+
+def move_subtree(node, new_parent):
+    """
+    把节点（连同子树）移动到 new_parent 下，new_parent 为 None 时移动为根节点（不提交事务）
+    :raises ValueError: 目标父节点是节点自身或其子孙节点
+    """
+    if new_parent is not None and is_in_subtree(node.id, new_parent.id):
+        raise ValueError('不能将节点移动到自身或其子节点下')
+    node.parent_id = new_parent.id if new_parent is not None else None
+    return rewrite_subtree_path(node, child_path(new_parent, node.name))
+
+
+def rename_node(node, name):
+    """重命名节点，并同步更新全部子孙节点的路径（不提交事务）"""
+    node.name = name
+    return rewrite_subtree_path(node, child_path(node.parent, name))
+
+
+def group_children(nodes):
+    """按 parent_id 分组并在组内按 order 排序，O(n log n)"""
+    children = defaultdict(list)
+    for node in nodes:
+        children[node.parent_id].append(node)
+    for siblings in children.values():
+        siblings.sort(key=_sort_key)
+    return children
+
+
+def build_tree(nodes, root_parent_id=None, serialize=None):
+    """
+    将节点列表组装成嵌套的树形结构（一次分组，线性遍历）
+    :param root_parent_id: 顶层节点的 parent_id，为 None 时从根项目开始
+    :param serialize: 节点转换为字典的函数，结果中会再加上 children
+    """
+    serialize = serialize or serialize_node
+    children = group_children(nodes)
+
+    def _build(parent_id):
+        tree = []
+        for node in children.get(parent_id, []):
+            item = serialize(node)
+            item['children'] = _build(node.id)
+            tree.append(item)
+        return tree
+
+    return _build(root_parent_id)
+
+
+def flatten_subtree(nodes, root_id):
+    """按先序（父节点在前，同级按 order）返回根节点及其全部子孙节点"""
+    by_id = {node.id: node for node in nodes}
+    if root_id not in by_id:
+        return []
+    children = group_children(nodes)
+    ordered = []
+    stack = [by_id[root_id]]
+    while stack:
+        node = stack.pop()
+        ordered.append(node)
+        stack.extend(reversed(children.get(node.id, [])))
+    return ordered
+
+
+def serialize_node(node):
+    return {
+        'id': node.id,
+        'name': node.name,
+        'short_name': node.short_name,
+        'node_type': node.node_type,
+        'path': node.path,
+        'created_at': node.created_at
+    }
+
+
+def get_forest_tree():
+    """全部项目的树形结构（带缓存）"""
+    tree = _tree_cache.get(_FOREST_KEY)
+    if tree is None:
+        tree = build_tree(load_all_nodes())
+        _tree_cache.set(_FOREST_KEY, tree)
+    return tree
+
+
+def get_module_tree(project_id):
+    """项目下菜单和页面节点的树形结构（带缓存）"""
+    key = ('modules_tree', project_id)
+    tree = _tree_cache.get(key)
+    if tree is None:
+        nodes = load_subtree(project_id, node_types=['menu', 'page'])
+        tree = build_tree(nodes, root_parent_id=project_id, serialize=lambda node: {
+            'id': node.id,
+            'name': node.name,
+            'node_type': node.node_type,
+            'path': node.path
+        })
+        _tree_cache.set(key, tree)
+    return tree
+
+
+def get_module_list(project_id):
+    """项目下菜单和页面节点的平铺列表，按路径排序（带缓存）"""
+    key = ('modules_list', project_id)
+    modules = _tree_cache.get(key)
+    if modules is None:
+        nodes = sorted(load_subtree(project_id, node_types=['menu', 'page']), key=lambda node: node.path or '')
+        modules = [{
+            'id': node.id,
+            'name': node.name,
+            'node_type': node.node_type,
+            'path': node.path
+        } for node in nodes]
+        _tree_cache.set(key, modules)
+    return modules
+
+
+def invalidate_project_tree():
+    """
+    节点新增、修改、移动、删除后调用
+    移动可能跨项目，且节点变化频率很低，因此直接清空全部项目的缓存
+    """
+    _tree_cache.clear()
@@ -0,0 +1,85 @@
+"""
+下拉框参考数据（用户、迭代、项目）
+各页面共用的下拉列表只查询 id/名称，返回轻量的命名元组而不是 ORM 对象，缓存在进程内。
+每张表有一个版本号，写入提交后版本号加一，缓存键带版本号，旧版本的条目不再命中。
+人数较多的列表（用户）不再整表渲染到页面里，通过 /api/reference/<类型>?q= 按关键词检索。
+"""
+
+import threading
+from collections import namedtuple
+
+from cache import TTLCache, invalidate_on_commit
+from models import db, User, Sprint, ProjectInfo
+
+
+Option = namedtuple('Option', ['id', 'name'])
+SprintOption = namedtuple('SprintOption', ['id', 'name', 'project_id', 'status'])
+ProjectOption = namedtuple('ProjectOption', ['id', 'name', 'short_name'])
+
+# 多进程部署时其他进程最多在 ttl 秒后看到变化
+_reference_cache = TTLCache(maxsize=256, ttl=300)
+_versions = {User: 0, Sprint: 0, ProjectInfo: 0}
+_versions_lock = threading.Lock()
+
+MAX_TYPEAHEAD_LIMIT = 50
+
+
+def _bump_versions(changed):
+    with _versions_lock:
+        for model in changed:
+            _versions[model] += 1
+
+
+invalidate_on_commit(db.session, tuple(_versions), _bump_versions)
+
+
+def _cached(model, key, loader):
+    cache_key = (model.__tablename__, _versions[model]) + key
+    options = _reference_cache.get(cache_key)
+    if options is None:
+        options = loader()
+        _reference_cache.set(cache_key, options)
+    return options
+
+
+def user_options():
+    """全部用户 [Option(id, name)]，按 id 排序"""
+    return _cached(User, ('all',), lambda: [
+        Option(row.id, row.name) for row in db.session.query(User.id, User.name).order_by(User.id)
+    ])
+
+
+def sprint_options(project_id=None):
+    """迭代 [SprintOption]，按开始日期倒序；指定 project_id 时只返回该项目的迭代"""
+    def load():
+        query = db.session.query(Sprint.id, Sprint.name, Sprint.project_id, Sprint.status)
+        if project_id:
+            query = query.filter(Sprint.project_id == project_id)
+        return [SprintOption(*row) for row in query.order_by(Sprint.start_date.desc(), Sprint.id.desc())]
+    return _cached(Sprint, ('project', project_id), load)
+
+
+def project_options():
+    """项目（根节点）[ProjectOption]，按排序号排序"""
+    return _cached(ProjectInfo, ('roots',), lambda: [
+        ProjectOption(*row) for row in db.session.query(ProjectInfo.id, ProjectInfo.name, ProjectInfo.short_name).filter(
+            ProjectInfo.parent_id.is_(None)
+        ).order_by(ProjectInfo.order, ProjectInfo.id)
+    ])
+
+
+def project_node_options():
+    """节点类型为项目的节点 [ProjectOption]（不限层级，根节点不一定是项目），按 id 排序"""
+    return _cached(ProjectInfo, ('node_type', 'project'), lambda: [
+        ProjectOption(*row) for row in db.session.query(ProjectInfo.id, ProjectInfo.name, ProjectInfo.short_name).filter(
+            ProjectInfo.node_type == 'project'
+        ).order_by(ProjectInfo.id)
+    ])
+
+
+def filter_options(options, keyword, limit=20):
+    """在缓存的列表中按名称包含关键词检索（不区分大小写），关键词为空时返回前 limit 条"""
+    limit = max(1, min(limit or 20, MAX_TYPEAHEAD_LIMIT))
+    keyword = (keyword or '').strip().lower()
+    matched = [option for option in options if keyword in (option.name or '').lower()] if keyword else options
+    return matched[:limit]
@@ -0,0 +1,55 @@
+import json
+import queue
+import threading
+
+
+class RoundEventBroker:
+    """
+    估算回合的进程内事件广播（发布/订阅）
+    每个订阅者一个队列，事件只在发生时推送，服务端工作量与事件数成正比而与在线人数×时间无关。
+    注意：只在单进程内广播，多进程部署需要改为 Redis 等外部通道
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}  # round_id -> {queue: user_id}
+        self._lock = threading.Lock()
+
+    def subscribe(self, round_id, user_id):
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(round_id, {})[subscriber] = user_id
+        return subscriber
+
+    def unsubscribe(self, round_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(round_id)
+            if subscribers is None:
+                return
+            subscribers.pop(subscriber, None)
+            if not subscribers:
+                del self._subscribers[round_id]
+
+    def online_user_ids(self, round_id):
+        """当前在房间内（保持连接）的用户ID"""
+        with self._lock:
+            return set(self._subscribers.get(round_id, {}).values())
+
+    def publish(self, round_id, event, data=None):
+        with self._lock:
+            subscribers = list(self._subscribers.get(round_id, {}))
+        message = format_sse(event, data or {})
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 客户端消费太慢时丢弃事件，客户端重连后会收到最新状态
+                pass
+
+
+def format_sse(event, data):
+    """格式化为 text/event-stream 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+round_events = RoundEventBroker()
@@ -0,0 +1,97 @@
+from collections import namedtuple
+
+from cache import TTLCache
+from pagination import keyset_paginate
+from loader_profiles import HISTORY_LIST
+from models import db, GameRound, Estimate, User
+from round_state import RoundVote, round_state
+
+
+Voter = namedtuple('Voter', ['id', 'name'])
+
+# 用户总数只用于展示“x/总人数 人完成”，允许短时间不准确
+_user_count_cache = TTLCache(maxsize=1, ttl=60)
+
+
+def get_user_count():
+    """获取用户总数（缓存 60 秒）"""
+    user_count = _user_count_cache.get('count')
+    if user_count is None:
+        user_count = User.query.count()
+        _user_count_cache.set('count', user_count)
+    return user_count
+
+
+def load_round_votes(round_ids):
+    """
+    批量加载多个回合的出牌（一次联表查询，并合并写入队列中还未写入数据库的出牌）
+    :return: {round_id: [RoundVote, ...]}，按出牌顺序排列
+    """
+    votes = {round_id: [] for round_id in round_ids}
+    if not votes:
+        return votes
+    rows = db.session.query(
+        Estimate.round_id, Estimate.user_id, User.name, Estimate.card_value
+    ).join(User, User.id == Estimate.user_id).filter(
+        Estimate.round_id.in_(list(votes))
+    ).order_by(Estimate.id).all()
+    for row in rows:
+        votes[row.round_id].append(RoundVote(row.user_id, row.name, row.card_value))
+    # 合并还在写入队列中的出牌（如刚结束的回合），写入完成前后都只计一次
+    for round_id, unwritten in round_state.unwritten_votes(votes).items():
+        voter_ids = {vote.user_id for vote in votes[round_id]}
+        votes[round_id].extend(vote for vote in unwritten if vote.user_id not in voter_ids)
+    return votes
+
+
+def load_open_round_progress(user_story_ids):
+    """
+    获取一页用户故事的未结束回合及出牌进度
+    一次查询取出这些故事的未结束回合；内存中已有状态的回合直接使用，其余回合的出牌一次批量加载
+    :return: {user_story_id: {'round_id', 'finished_count', 'user_count', 'finished_users'}}
+    """
+    user_count = get_user_count()
+    progress_info = {user_story_id: {
+        'round_id': None,
+        'finished_count': 0,
+        'user_count': user_count,
+        'finished_users': []
+    } for user_story_id in user_story_ids}
+    if not progress_info:
+        return progress_info
+
+    open_rounds = db.session.query(GameRound.id, GameRound.user_story_id).filter(
+        GameRound.user_story_id.in_(list(progress_info)),
+        GameRound.end_time.is_(None)
+    ).order_by(GameRound.id).all()
+
+    # 每个故事只取第一个未结束回合
+    round_story = {}
+    for round_row in open_rounds:
+        if progress_info[round_row.user_story_id]['round_id'] is None:
+            progress_info[round_row.user_story_id]['round_id'] = round_row.id
+            round_story[round_row.id] = round_row.user_story_id
+
+    round_votes = {}
+    for round_id in round_story:
+        state = round_state.peek(round_id)
+        if state is not None:
+            round_votes[round_id] = list(state.votes.values())
+    round_votes.update(load_round_votes([round_id for round_id in round_story if round_id not in round_votes]))
+
+    for round_id, votes in round_votes.items():
+        progress = progress_info[round_story[round_id]]
+        progress['finished_count'] = len(votes)
+        progress['finished_users'] = [Voter(vote.user_id, vote.user_name) for vote in votes]
+    return progress_info
+
+
+def load_finished_rounds(rounds_query, cursor, page, per_page):
+    """
+    按 (结束时间, id) 倒序游标分页获取已结束回合，连同用户故事和每个回合的出牌一起加载
+    :return: (分页对象, {round_id: [RoundVote, ...]})
+    """
+    pagination = keyset_paginate(rounds_query.options(*HISTORY_LIST),
+                                 GameRound.end_time, GameRound.id, cursor=cursor, page=page,
+                                 per_page=per_page, descending=True)
+    return pagination, load_round_votes([r.id for r in pagination.items])
@@ -0,0 +1,291 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm import joinedload
+
+from models import db, GameRound, Estimate, User
+
+
+# 不参与数值统计的卡片
+NON_NUMERIC_CARDS = ('?', '∞', 'coffee')
+
+RoundVote = namedtuple('RoundVote', ['user_id', 'user_name', 'card_value'])
+StoryInfo = namedtuple('StoryInfo', ['id', 'title'])
+
+# 写入失败后的重试间隔（秒），每次失败翻倍，最长 MAX_RETRY_DELAY
+MAX_RETRY_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+def calculate_consensus_by_majority(value_counts):
+    """
+    计算共识 - 使用多数投票方法（动态阈值）
+    如果有超过一定比例的成员选择了相同的值，则认为达成共识；对于小团队，使用较低的阈值
+    :param value_counts: 卡片值 -> 票数
+    :return: (是否达成共识, 得票最多的值, 阈值, 有效票数)
+    """
+    # 只考虑有效数值估算
+    numeric_counts = {value: count for value, count in value_counts.items()
+                      if value not in NON_NUMERIC_CARDS and value is not None}
+    total_votes = sum(numeric_counts.values())
+    if total_votes == 0:
+        return False, None, 0, 0
+
+    # 找出得票最多的值
+    majority_value = max(numeric_counts, key=numeric_counts.get)
+    majority_votes = numeric_counts[majority_value]
+
+    # 动态阈值：小团队使用较低阈值，大团队使用较高阈值
+    # 2-3人团队：50%阈值
+    # 4-5人团队：60%阈值
+    # 6人及以上团队：70%阈值
+    if total_votes <= 3:
+        threshold = 0.5
+    elif total_votes <= 5:
+        threshold = 0.6
+    else:
+        threshold = 0.7
+
+    # 检查是否超过阈值
+    consensus_reached = (majority_votes / total_votes) >= threshold
+    return consensus_reached, majority_value, threshold, total_votes
+
+
+class RoundState:
+    """单个未结束回合的内存状态：出牌、投票人、取值分布以及缓存的统计结果"""
+
+    def __init__(self, round_id, story):
+        self.round_id = round_id
+        self.story = story
+        self.votes = OrderedDict()  # user_id -> RoundVote，保持出牌顺序
+        self.value_counts = Counter()
+        self._summary = None
+        self._lock = threading.Lock()
+
+    def add_vote(self, vote):
+        """记录一次出牌，同一用户只记录第一次；返回是否新增"""
+        with self._lock:
+            if vote.user_id in self.votes:
+                return False
+            self.votes[vote.user_id] = vote
+            self.value_counts[vote.card_value] += 1
+            self._summary = None
+            return True
+
+    def get_vote(self, user_id):
+        return self.votes.get(user_id)
+
+    def voter_ids(self):
+        return set(self.votes)
+
+    def summary(self):
+        """揭示页需要的统计结果，出牌变化前直接复用"""
+        summary = self._summary
+        if summary is None:
+            with self._lock:
+                numeric_total, numeric_count = 0.0, 0
+                for value, count in self.value_counts.items():
+                    if value not in NON_NUMERIC_CARDS and value is not None:
+                        numeric_total += float(value) * count
+                        numeric_count += count
+                consensus, consensus_value, threshold, total_votes = calculate_consensus_by_majority(self.value_counts)
+                summary = self._summary = {
+                    'estimates': list(self.votes.values()),
+                    'average': numeric_total / numeric_count if numeric_count else 0,
+                    'consensus': consensus,
+                    'consensus_value': consensus_value,
+                    'threshold': threshold,
+                    'total_votes': total_votes,
+                    'value_counts': dict(self.value_counts)
+                }
+        return summary
+
+
+class RoundStateStore:
+    """
+    未结束回合的内存状态存储
+    出牌先更新内存，再由后台线程批量写入 Estimate 表（write-behind）；
+    进程启动时从数据库重建所有未结束回合，未命中的回合按需从数据库加载。
+    注意：状态只在单进程内有效，多进程部署需共享存储
+    """
+
+    def __init__(self):
+        self._rounds = {}
+        self._load_lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._unwritten = {}  # (round_id, user_id) -> RoundVote，已记录但还未写入数据库的出牌
+        self._unwritten_lock = threading.Lock()
+        self._writer = None
+        self._app = None
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['round_state'] = self
+        with app.app_context():
+            try:
+                self.load_open_rounds()
+            except SQLAlchemyError:
+                # 数据库尚未就绪时按需加载
+                db.session.rollback()
+        self._writer = threading.Thread(target=self._write_loop, name='round-state-writer', daemon=True)
+        self._writer.start()
+
+    def load_open_rounds(self):
+        """从数据库重建所有未结束回合的状态（两次查询）"""
+        rounds = GameRound.query.options(joinedload(GameRound.user_story)).filter_by(end_time=None).all()
+        states = {current_round.id: self._new_state(current_round) for current_round in rounds}
+        for vote_row in self._vote_rows(list(states)):
+            states[vote_row.round_id].add_vote(RoundVote(vote_row.user_id, vote_row.name, vote_row.card_value))
+        with self._load_lock:
+            self._rounds = states
+
+    @staticmethod
+    def _new_state(current_round):
+        story = current_round.user_story
+        return RoundState(current_round.id, StoryInfo(story.id, story.title) if story else None)
+
+    @staticmethod
+    def _vote_rows(round_ids):
+        if not round_ids:
+            return []
+        return db.session.query(
+            Estimate.round_id, Estimate.user_id, Estimate.card_value, User.name
+        ).join(User, User.id == Estimate.user_id).filter(
+            Estimate.round_id.in_(round_ids)
+        ).order_by(Estimate.id).all()
+
+    def get(self, round_id):
+        """获取未结束回合的状态，回合不存在或已结束时返回 None"""
+        state = self._rounds.get(round_id)
+        if state is not None:
+            return state
+        # 同一时刻只加载一次，避免大量请求同时打到数据库
+        with self._load_lock:
+            state = self._rounds.get(round_id)
+            if state is None:
+                current_round = GameRound.query.options(
+                    joinedload(GameRound.user_story)
+                ).filter_by(id=round_id, end_time=None).first()
+                if current_round is None:
+                    return None
+                state = self._new_state(current_round)
+                for vote_row in self._vote_rows([round_id]):
+                    state.add_vote(RoundVote(vote_row.user_id, vote_row.name, vote_row.card_value))
+                self._rounds[round_id] = state
+        return state
+
+    def peek(self, round_id):
+        """只从内存中获取回合状态，不访问数据库"""
+        return self._rounds.get(round_id)
+
+    def record_vote(self, round_id, user_id, user_name, card_value):
+        """记录出牌并排队写入数据库；返回是否新增"""
+        state = self.get(round_id)
+        vote = RoundVote(user_id, user_name, card_value)
+        if state is None or not state.add_vote(vote):
+            return False
+        with self._unwritten_lock:
+            self._unwritten[(round_id, user_id)] = vote
+        self._pending.put((round_id, user_id, card_value, datetime.utcnow()))
+        if self._writer is None:
+            # 未启动后台线程（如脚本中使用）时同步写入
+            self.flush()
+        return True
+
+    def unwritten_votes(self, round_ids):
+        """
+        已记录但还未写入数据库的出牌（回合结束后仍可能在队列中）
+        :return: {round_id: [RoundVote, ...]}，按出牌顺序排列
+        """
+        round_ids = set(round_ids)
+        votes = {}
+        with self._unwritten_lock:
+            for (round_id, _), vote in self._unwritten.items():
+                if round_id in round_ids:
+                    votes.setdefault(round_id, []).append(vote)
+        return votes
+
+    def _mark_written(self, items):
+        with self._unwritten_lock:
+            for round_id, user_id, _, _ in items:
+                self._unwritten.pop((round_id, user_id), None)
+
+    def end_round(self, round_id):
+        """回合结束后移出内存，已排队的出牌仍会写入数据库"""
+        with self._load_lock:
+            self._rounds.pop(round_id, None)
+
+    @staticmethod
+    def _write(batch):
+        db.session.add_all([
+            Estimate(round_id=round_id, user_id=user_id, card_value=card_value, created_at=created_at)
+            for round_id, user_id, card_value, created_at in batch
+        ])
+        db.session.commit()
+
+    def flush(self, first=None):
+        """
+        把排队中的出牌写入数据库，返回写入条数
+        数据库暂时不可用等错误时整批放回队列并抛出异常，由调用方稍后重试；
+        违反约束（如回合或用户已删除）时逐条写入，只丢弃无法写入的出牌
+        """
+        batch = [first] if first else []
+        while True:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+            self._mark_written(batch)
+            return len(batch)
+        except IntegrityError:
+            db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            for item in batch:
+                self._pending.put(item)
+            raise
+
+        written = 0
+        for index, item in enumerate(batch):
+            try:
+                self._write([item])
+                written += 1
+            except IntegrityError:
+                db.session.rollback()
+                logger.error('出牌无法写入数据库，已丢弃: %s', item)
+            except Exception:
+                db.session.rollback()
+                for remaining in batch[index:]:
+                    self._pending.put(remaining)
+                raise
+            self._mark_written([item])
+        return written
+
+    def _write_loop(self):
+        retry_delay = 1
+        while True:
+            # 阻塞等待第一条，然后把同时到达的出牌合并成一次提交
+            first = self._pending.get()
+            with self._app.app_context():
+                try:
+                    self.flush(first)
+                    retry_delay = 1
+                except Exception:
+                    logger.exception('出牌写入数据库失败，%s 秒后重试', retry_delay)
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+                finally:
+                    db.session.remove()
+
+
+round_state = RoundStateStore()
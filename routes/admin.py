@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from datetime import datetime
-from models import db, User, GameRound, Estimate, SystemFeature, UserStory
+from models import db, User, GameRound, SystemFeature, UserStory
 from utils import check_system_feature_access, check_user_role
+from round_progress import load_finished_rounds
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -33,16 +34,16 @@ def history():
     if not check_system_feature_access(session, 'admin.history'):
         return redirect(url_for('auth.index'))
 
-    # 获取页码参数
+    # 获取页码和游标参数
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', type=str)
     per_page = 15  # 每页15条记录
 
-    # 获取已完成的回合（有结束时间的回合）
-    # 按结束时间倒序排列
-    rounds_query = GameRound.query.filter(GameRound.end_time.isnot(None)).order_by(GameRound.end_time.desc())
+    # 获取已完成的回合（有结束时间的回合），按结束时间倒序游标分页
+    rounds_query = GameRound.query.filter(GameRound.end_time.isnot(None))
 
-    # 分页查询
-    rounds_pagination = rounds_query.paginate(page=page, per_page=per_page, error_out=False)
+    # 分页查询，用户故事和出牌一次性加载
+    rounds_pagination, round_votes = load_finished_rounds(rounds_query, cursor, page, per_page)
     rounds = rounds_pagination.items
 
     # 按用户故事分组并计算轮次
@@ -65,7 +66,7 @@ def history():
         for index, r in enumerate(sorted_rounds):
             round_number = index + 1  # 第一轮、第二轮...
 
-            estimates = Estimate.query.filter_by(round_id=r.id).all()
+            estimates = round_votes.get(r.id, [])
             # 构造与模板匹配的数据结构
             history_records.append({
                 'id': r.id,
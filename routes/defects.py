@@ -1,13 +1,20 @@
 import os
 
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash, current_app, Response
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash, current_app
 from models import db, Defect, ProjectInfo, Sprint, User
 from utils import check_system_feature_access
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
+from sequences import allocate_code, defect_sequence
+from importers import import_defects as import_defects_from_excel
+from exporters import ExportColumn, export_response, format_date, format_datetime
+from sqlalchemy.orm import aliased
+from werkzeug.datastructures import MultiDict
+from jobs import background_jobs, job_handler, run_export_job
+from search import text_filter
+from pagination import keyset_paginate, clamp_per_page
+from loader_profiles import DEFECT_LIST
+from reference_data import project_node_options, sprint_options
 from datetime import datetime
-import csv
-import io
-import pandas as pd
 
 defects_bp = Blueprint('defects', __name__)
 
@@ -18,24 +25,8 @@ def check_access():
     pass  # 路由权限由装饰器处理
 
 def generate_defect_id():
-    """生成缺陷编号，格式为F_001, F_002, ..."""
-    # 查询最大的缺陷编号
-    last_defect = Defect.query.filter(Defect.defect_id.isnot(None)).order_by(Defect.id.desc()).first()
-
-    if last_defect and last_defect.defect_id and last_defect.defect_id.startswith('F_'):
-        try:
-            # 提取编号部分并加1
-            last_number = int(last_defect.defect_id[2:])
-            new_number = last_number + 1
-        except ValueError:
-            # 如果解析失败，从1开始
-            new_number = 1
-    else:
-        # 如果没有缺陷或编号格式不正确，从1开始
-        new_number = 1
-
-    # 格式化为3位数字
-    return f"F_{new_number:03d}"
+    """生成缺陷编号，格式为F_001, F_002, ...（从编号序列原子分配，需在同一事务中提交）"""
+    return allocate_code(defect_sequence())
 
 
 @defects_bp.route('/defects/upload-image', methods=['POST'])
@@ -82,6 +73,7 @@ def serve_image(filename):
     return send_from_directory(upload_folder, filename)
 
 @defects_bp.route('/defects')
+@self_checked('defects.defects')
 def defects():
     """缺陷管理主页 - 缺陷列表（分页）"""
     if not check_system_feature_access(session, 'defects.defects'):
@@ -90,7 +82,8 @@ def defects():
     try:
         # 获取查询参数
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        cursor = request.args.get('cursor', type=str)
+        per_page = clamp_per_page(request.args.get('per_page', 10, type=int))
         project_id = request.args.get('project_id', type=int)
         sprint_id = request.args.get('sprint_id', type=int)
         status = request.args.get('status', type=str)
@@ -98,8 +91,8 @@ def defects():
         assignee_id = request.args.get('assignee_id', type=int)
         search = request.args.get('search', type=str)
 
-        # 构建查询
-        query = Defect.query
+        # 构建查询，模板用到的项目、负责人、处理人一并加载
+        query = Defect.query.options(*DEFECT_LIST)
 
         # 添加过滤条件
         if project_id:
@@ -113,24 +106,23 @@ def defects():
         if assignee_id:
             query = query.filter(Defect.assignee_id == assignee_id)
         if search:
-            query = query.filter(Defect.title.contains(search))
+            # 标题和描述的全文索引
+            query = query.filter(text_filter((Defect.title, Defect.description), search)[0])
 
-        # 分页查询
-        pagination = query.order_by(Defect.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False)
+        # 按 (创建时间, id) 游标分页
+        pagination = keyset_paginate(query, Defect.created_at, Defect.id, cursor=cursor, page=page,
+                                     per_page=per_page, descending=True)
         defects = pagination.items
 
         # 获取筛选选项
-        projects = ProjectInfo.query.filter_by(node_type='project').all()
-        sprints = Sprint.query.all()
-        users = User.query.all()
+        projects = project_node_options()
+        sprints = sprint_options()
 
         return render_template('defects/list.html',
                              defects=defects,
                              pagination=pagination,
                              projects=projects,
                              sprints=sprints,
-                             users=users,
                              filters={
                                  'project_id': project_id,
                                  'sprint_id': sprint_id,
@@ -170,13 +162,11 @@ def create_defect():
             # 必填字段验证
             if not title or not project_id:
                 flash('标题和所属项目为必填项', 'error')
-                projects = ProjectInfo.query.filter_by(node_type='project').all()
-                sprints = Sprint.query.all()
-                users = User.query.all()
+                projects = project_node_options()
+                sprints = sprint_options()
                 return render_template('defects/create.html',
                                      projects=projects,
-                                     sprints=sprints,
-                                     users=users)
+                                     sprints=sprints)
 
             # 生成缺陷编号
             defect_id = generate_defect_id()
@@ -216,22 +206,18 @@ def create_defect():
         except Exception as e:
             db.session.rollback()
             flash(f'创建缺陷失败: {str(e)}', 'error')
-            projects = ProjectInfo.query.filter_by(node_type='project').all()
-            sprints = Sprint.query.all()
-            users = User.query.all()
+            projects = project_node_options()
+            sprints = sprint_options()
             return render_template('defects/create.html',
                                  projects=projects,
-                                 sprints=sprints,
-                                 users=users)
+                                 sprints=sprints)
 
     # GET 请求 - 显示创建表单
-    projects = ProjectInfo.query.filter_by(node_type='project').all()
-    sprints = Sprint.query.all()
-    users = User.query.all()
+    projects = project_node_options()
+    sprints = sprint_options()
     return render_template('defects/create.html',
                          projects=projects,
-                         sprints=sprints,
-                         users=users)
+                         sprints=sprints)
 
 
 @defects_bp.route('/defects/edit/<int:defect_id>', methods=['GET', 'POST'])
@@ -265,14 +251,12 @@ def edit_defect(defect_id):
             # 必填字段验证
             if not title or not project_id:
                 flash('标题和所属项目为必填项', 'error')
-                projects = ProjectInfo.query.filter_by(node_type='project').all()
-                sprints = Sprint.query.all()
-                users = User.query.all()
+                projects = project_node_options()
+                sprints = sprint_options()
                 return render_template('defects/edit.html',
                                      defect=defect,
                                      projects=projects,
-                                     sprints=sprints,
-                                     users=users)
+                                     sprints=sprints)
 
             # 更新缺陷信息
             defect.title = title
@@ -311,24 +295,20 @@ def edit_defect(defect_id):
         except Exception as e:
             db.session.rollback()
             flash(f'更新缺陷失败: {str(e)}', 'error')
-            projects = ProjectInfo.query.filter_by(node_type='project').all()
-            sprints = Sprint.query.all()
-            users = User.query.all()
+            projects = project_node_options()
+            sprints = sprint_options()
             return render_template('defects/edit.html',
                                  defect=defect,
                                  projects=projects,
-                                 sprints=sprints,
-                                 users=users)
+                                 sprints=sprints)
 
     # GET 请求 - 显示编辑表单
-    projects = ProjectInfo.query.filter_by(node_type='project').all()
-    sprints = Sprint.query.all()
-    users = User.query.all()
+    projects = project_node_options()
+    sprints = sprint_options()
     return render_template('defects/edit.html',
                          defect=defect,
                          projects=projects,
-                         sprints=sprints,
-                         users=users)
+                         sprints=sprints)
 
 
 @defects_bp.route('/defects/delete/<int:defect_id>', methods=['POST'])
@@ -347,81 +327,97 @@ def delete_defect(defect_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': f'删除缺陷失败: {str(e)}'})
 
+def build_defects_export(args):
+    """缺陷导出的查询和列定义，args 为请求参数"""
+    # 获取查询参数
+    project_id = args.get('project_id', type=int)
+    sprint_id = args.get('sprint_id', type=int)
+    status = args.get('status', type=str)
+    priority = args.get('priority', type=str)
+
+    # 构建查询
+    query = Defect.query
+
+    # 添加过滤条件
+    if project_id:
+        query = query.filter(Defect.project_id == project_id)
+    if sprint_id:
+        query = query.filter(Defect.sprint_id == sprint_id)
+    if status:
+        query = query.filter(Defect.status == status)
+    if priority:
+        query = query.filter(Defect.priority == priority)
+
+    # 关联名称通过外连接一次查出，避免逐行加载关联对象
+    assignee, resolver, created_by = aliased(User), aliased(User), aliased(User)
+    query = query.outerjoin(ProjectInfo, ProjectInfo.id == Defect.project_id) \
+        .outerjoin(Sprint, Sprint.id == Defect.sprint_id) \
+        .outerjoin(assignee, assignee.id == Defect.assignee_id) \
+        .outerjoin(resolver, resolver.id == Defect.resolver_id) \
+        .outerjoin(created_by, created_by.id == Defect.created_by_id) \
+        .add_columns(ProjectInfo.name.label('project_name'), Sprint.name.label('sprint_name'),
+                     assignee.name.label('assignee_name'), resolver.name.label('resolver_name'),
+                     created_by.name.label('created_by_name')) \
+        .order_by(Defect.id)
+
+    columns = [
+        ExportColumn('缺陷编号', lambda row: row.Defect.defect_id or ''),
+        ExportColumn('标题', lambda row: row.Defect.title),
+        ExportColumn('所属项目', lambda row: row.project_name or ''),
+        ExportColumn('所属迭代', lambda row: row.sprint_name or ''),
+        ExportColumn('工作项类型', lambda row: row.Defect.work_item_type),
+        ExportColumn('缺陷描述', lambda row: row.Defect.description or ''),
+        ExportColumn('负责人', lambda row: row.assignee_name or ''),
+        ExportColumn('优先级', lambda row: row.Defect.priority),
+        ExportColumn('是否线上缺陷', lambda row: '是' if row.Defect.is_online else '否'),
+        ExportColumn('严重程度', lambda row: row.Defect.severity),
+        ExportColumn('缺陷类型', lambda row: row.Defect.defect_type),
+        ExportColumn('缺陷状态', lambda row: row.Defect.status),
+        ExportColumn('解决者', lambda row: row.resolver_name or ''),
+        ExportColumn('处理结果', lambda row: row.Defect.resolution),
+        ExportColumn('开发团队', lambda row: row.Defect.dev_team or ''),
+        ExportColumn('协助者', lambda row: row.Defect.collaborators or ''),
+        ExportColumn('开始日期', lambda row: format_date(row.Defect.start_date)),
+        ExportColumn('结束日期', lambda row: format_date(row.Defect.end_date)),
+        ExportColumn('创建人', lambda row: row.created_by_name or ''),
+        ExportColumn('创建时间', lambda row: format_datetime(row.Defect.created_at)),
+        ExportColumn('更新时间', lambda row: format_datetime(row.Defect.updated_at))
+    ]
+
+    filename = f"defects_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return query, columns, filename, '缺陷列表'
+
+
+@job_handler('defects.export')
+def run_defects_export_job(job, params, progress):
+    return run_export_job(job, build_defects_export(MultiDict(params)), params.get('format', 'xlsx'))
+
+
 @defects_bp.route('/defects/export')
 def export_defects():
     """导出缺陷为Excel文件"""
     if not check_system_feature_access(session, 'defects.defects'):
         return redirect(url_for('auth.index'))
 
-    try:
-        # 获取查询参数
-        project_id = request.args.get('project_id', type=int)
-        sprint_id = request.args.get('sprint_id', type=int)
-        status = request.args.get('status', type=str)
-        priority = request.args.get('priority', type=str)
-
-        # 构建查询
-        query = Defect.query
+    # 数据量大时提交后台任务，完成后在任务页面下载
+    if request.args.get('background'):
+        job = background_jobs.enqueue('defects.export', session['user_id'], params=request.args.to_dict())
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
 
-        # 添加过滤条件
-        if project_id:
-            query = query.filter(Defect.project_id == project_id)
-        if sprint_id:
-            query = query.filter(Defect.sprint_id == sprint_id)
-        if status:
-            query = query.filter(Defect.status == status)
-        if priority:
-            query = query.filter(Defect.priority == priority)
-
-        defects = query.all()
-
-        # 准备数据
-        data = []
-        for defect in defects:
-            data.append({
-                '缺陷编号': defect.defect_id or '',
-                '标题': defect.title,
-                '所属项目': defect.project.name if defect.project else '',
-                '所属迭代': defect.sprint.name if defect.sprint else '',
-                '工作项类型': defect.work_item_type,
-                '缺陷描述': defect.description or '',
-                '负责人': defect.assignee.name if defect.assignee else '',
-                '优先级': defect.priority,
-                '是否线上缺陷': '是' if defect.is_online else '否',
-                '严重程度': defect.severity,
-                '缺陷类型': defect.defect_type,
-                '缺陷状态': defect.status,
-                '解决者': defect.resolver.name if defect.resolver else '',
-                '处理结果': defect.resolution,
-                '开发团队': defect.dev_team or '',
-                '协助者': defect.collaborators or '',
-                '开始日期': defect.start_date.strftime('%Y-%m-%d') if defect.start_date else '',
-                '结束日期': defect.end_date.strftime('%Y-%m-%d') if defect.end_date else '',
-                '创建人': defect.created_by.name if defect.created_by else '',
-                '创建时间': defect.created_at.strftime('%Y-%m-%d %H:%M:%S') if defect.created_at else '',
-                '更新时间': defect.updated_at.strftime('%Y-%m-%d %H:%M:%S') if defect.updated_at else ''
-            })
-
-        # 创建DataFrame
-        df = pd.DataFrame(data)
-
-        # 将DataFrame写入内存中的Excel文件
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='缺陷列表')
-        output.seek(0)
-
-        # 设置响应头
-        filename = f"defects_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        return Response(
-            output.getvalue(),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
+    try:
+        query, columns, filename, sheet_title = build_defects_export(request.args)
+        return export_response(query, columns, filename, sheet_title, request.args.get('format', 'xlsx'))
     except Exception as e:
         flash(f'导出缺陷失败: {str(e)}', 'error')
         return redirect(url_for('defects.defects'))
 
+@job_handler('defects.import')
+def run_defects_import_job(job, params, progress):
+    report = import_defects_from_excel(job.input_path, job.user_id)
+    db.session.commit()
+    return report.to_dict()
+
+
 @defects_bp.route('/defects/import', methods=['GET', 'POST'])
 def import_defects():
     """导入缺陷（仅支持.xlsx格式）"""
@@ -441,101 +437,17 @@ def import_defects():
                 return redirect(request.url)
 
             if file and file.filename.endswith('.xlsx'):
-                # 读取Excel文件
-                df = pd.read_excel(file, engine='openpyxl')
-
-                imported_count = 0
-                error_count = 0
-
-                for index, row in df.iterrows():
-                    try:
-                        # 检查必填字段
-                        title = row['标题'] if '标题' in row and pd.notna(row['标题']) else ''
-                        project_name = row['所属项目'] if '所属项目' in row and pd.notna(row['所属项目']) else ''
-
-                        # 验证必填字段
-                        if not title:
-                            flash(f'第{index+2}行: 标题为必填项', 'error')
-                            error_count += 1
-                            continue
-
-                        if not project_name:
-                            flash(f'第{index+2}行: 所属项目为必填项', 'error')
-                            error_count += 1
-                            continue
-
-                        # 根据项目名称查找项目ID
-                        project = ProjectInfo.query.filter_by(name=project_name).first()
-                        if not project:
-                            flash(f'第{index+2}行: 项目"{project_name}"不存在', 'error')
-                            error_count += 1
-                            continue
-
-                        # 生成缺陷编号
-                        defect_id = generate_defect_id()
-
-                        # 处理可选字段
-                        sprint_id = None
-                        if '所属迭代' in row and pd.notna(row['所属迭代']):
-                            sprint = Sprint.query.filter_by(name=row['所属迭代']).first()
-                            if sprint:
-                                sprint_id = sprint.id
-
-                        assignee_id = session['user_id']  # 默认负责人为创建者
-                        if '负责人' in row and pd.notna(row['负责人']):
-                            assignee = User.query.filter_by(name=row['负责人']).first()
-                            if assignee:
-                                assignee_id = assignee.id
-
-                        resolver_id = None
-                        if '解决者' in row and pd.notna(row['解决者']):
-                            resolver = User.query.filter_by(name=row['解决者']).first()
-                            if resolver:
-                                resolver_id = resolver.id
-
-                        # 解析行数据
-                        defect = Defect(
-                            defect_id=defect_id,
-                            title=title,
-                            project_id=project.id,
-                            sprint_id=sprint_id,
-                            work_item_type=row['工作项类型'] if '工作项类型' in row and pd.notna(row['工作项类型']) else 'defect',
-                            description=row['缺陷描述'] if '缺陷描述' in row and pd.notna(row['缺陷描述']) else '',
-                            assignee_id=assignee_id,
-                            priority=row['优先级'] if '优先级' in row and pd.notna(row['优先级']) else 'P3',
-                            is_online=(row['是否线上缺陷'] == '是') if '是否线上缺陷' in row and pd.notna(row['是否线上缺陷']) else False,
-                            severity=row['严重程度'] if '严重程度' in row and pd.notna(row['严重程度']) else '一般',
-                            defect_type=row['缺陷类型'] if '缺陷类型' in row and pd.notna(row['缺陷类型']) else '功能问题',
-                            status=row['缺陷状态'] if '缺陷状态' in row and pd.notna(row['缺陷状态']) else '待处理',
-                            resolver_id=resolver_id,
-                            resolution=row['处理结果'] if '处理结果' in row and pd.notna(row['处理结果']) else '未设置',
-                            dev_team=row['开发团队'] if '开发团队' in row and pd.notna(row['开发团队']) else '',
-                            collaborators=row['协助者'] if '协助者' in row and pd.notna(row['协助者']) else '',
-                            created_by_id=session['user_id']
-                        )
-
-                        # 处理日期字段
-                        if '开始日期' in row and pd.notna(row['开始日期']):
-                            if isinstance(row['开始日期'], str):
-                                defect.start_date = datetime.strptime(row['开始日期'], '%Y-%m-%d').date()
-                            else:
-                                defect.start_date = row['开始日期'].date()
-
-                        if '结束日期' in row and pd.notna(row['结束日期']):
-                            if isinstance(row['结束日期'], str):
-                                defect.end_date = datetime.strptime(row['结束日期'], '%Y-%m-%d').date()
-                            else:
-                                defect.end_date = row['结束日期'].date()
-
-                        db.session.add(defect)
-                        imported_count += 1
-                    except Exception as e:
-                        error_count += 1
-                        flash(f'第{index+2}行: 导入失败 - {str(e)}', 'error')
-                        continue  # 跳过有问题的行
+                # 大文件提交后台任务，在任务页面查看进度和导入结果
+                if request.form.get('background'):
+                    job = background_jobs.enqueue('defects.import', session['user_id'], upload=file)
+                    return redirect(url_for('jobs.job_detail', job_id=job.id))
 
+                report = import_defects_from_excel(file, session['user_id'])
                 db.session.commit()
-                flash(f'成功导入 {imported_count} 个缺陷，{error_count} 个失败', 'success' if error_count == 0 else 'warning')
+                if report.error_count:
+                    # 停留在导入页面展示逐行错误
+                    return render_template('defects/import.html', report=report)
+                flash(f'成功导入 {report.imported_count} 个缺陷', 'success')
                 return redirect(url_for('defects.defects'))
             else:
                 flash('请上传.xlsx格式的文件', 'error')
@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, Response
 from datetime import datetime, UTC
-from models import db, User, GameRound, Estimate, UserStory, SprintBacklog, Sprint
+import queue
+from models import db, User, GameRound, UserStory, SprintBacklog, Sprint
 from utils import check_user_role
+from burndown import refresh_sprint_burndown
+from round_events import round_events, format_sse
+from round_state import round_state
+from round_progress import load_open_round_progress
+from pagination import keyset_paginate
 
 estimation_bp = Blueprint('estimation', __name__)
 
@@ -12,6 +18,34 @@ def require_login():
         return redirect(url_for('auth.login'))
 
 
+def get_round_progress(round_id, state=None):
+    """
+    回合当前的出牌人数，以及在线的人是否都已出牌
+    选牌页（poker.html）和等待页（wait.html）都保持推送连接，在线成员包括还在选牌、尚未出牌的人
+    """
+    state = state or round_state.get(round_id)
+    voter_ids = state.voter_ids() if state else set()
+    online_user_ids = round_events.online_user_ids(round_id)
+    return {
+        'votes': len(voter_ids),
+        'online': len(online_user_ids),
+        'all_voted': bool(voter_ids) and online_user_ids <= voter_ids
+    }
+
+
+def publish_vote(round_id, state=None):
+    """出牌后通知房间内的客户端，所有在线成员都已出牌时额外发送 all_voted"""
+    progress = get_round_progress(round_id, state)
+    round_events.publish(round_id, 'vote', progress)
+    if progress['all_voted']:
+        round_events.publish(round_id, 'all_voted', progress)
+
+
+def publish_round_ended(round_id):
+    """回合结束后通知房间内的客户端离开等待页"""
+    round_events.publish(round_id, 'round_ended', {'redirect': url_for('estimation.estimate')})
+
+
 @estimation_bp.route('/start_estimate/<int:user_story_id>')
 def start_estimate(user_story_id):
     # 检查该功能点是否有未结束的 GameRound
@@ -30,22 +64,22 @@ def poker():
     round_id = request.args.get('round_id', type=int)
     if not round_id:
         return redirect(url_for('estimation.estimate'))
-    current_round = db.session.get(GameRound, round_id)
-    if not current_round or current_round.end_time is not None:
+    # 回合状态保存在内存中，出牌由后台线程写入数据库
+    state = round_state.get(round_id)
+    if not state:
         return redirect(url_for('estimation.estimate'))
     user = db.session.get(User, session['user_id'])
     if not user:
         return redirect(url_for('auth.index'))
-    estimate = Estimate.query.filter_by(user_id=user.id, round_id=current_round.id).first()
+    estimate = state.get_vote(user.id)
     cards = [0, 1, 2, 3, 5, 8, 13, 21, 34, 55, '?', '∞', 'coffee']
     if request.method == 'POST':
         card_value = request.form.get('card_value')
         if card_value and not estimate:
-            estimate = Estimate(user_id=user.id, round_id=current_round.id, card_value=card_value)
-            db.session.add(estimate)
-            db.session.commit()
-        return redirect(url_for('estimation.wait', round_id=current_round.id))
-    return render_template('poker.html', cards=cards, estimate=estimate, user_story=current_round.user_story)
+            if round_state.record_vote(round_id, user.id, user.name, card_value):
+                publish_vote(round_id)
+        return redirect(url_for('estimation.wait', round_id=round_id))
+    return render_template('poker.html', cards=cards, estimate=estimate, user_story=state.story, round_id=round_id)
 
 @estimation_bp.route('/wait')
 def wait():
@@ -54,18 +88,51 @@ def wait():
     round_id = request.args.get('round_id', type=int)
     if not round_id:
         return redirect(url_for('estimation.estimate'))
-    current_round = db.session.get(GameRound, round_id)
-    if not current_round or current_round.end_time is not None:
+    state = round_state.get(round_id)
+    if not state:
         return redirect(url_for('estimation.estimate'))
-    estimates = Estimate.query.filter_by(round_id=current_round.id).all()
-    user_ids = {e.user_id for e in estimates}
-    users = User.query.filter(User.id.in_(user_ids)).all()
-    all_selected = len(estimates) == len(users) and len(users) > 0
-    # 直接从数据库获取用户信息，确保获取到正确的管理员状态
-    user = db.session.get(User, session['user_id'])
-    is_admin = check_user_role(user.id, 'admin') if user else False
-    print('is_admin:', is_admin)
-    return render_template('wait.html', all_selected=all_selected, user_story=current_round.user_story, round_id=round_id, is_admin=is_admin)
+    all_selected = len(state.votes) > 0
+    is_admin = check_user_role(session['user_id'], 'admin')
+    return render_template('wait.html', all_selected=all_selected, user_story=state.story, round_id=round_id, is_admin=is_admin)
+
+@estimation_bp.route('/round_events')
+def round_event_stream():
+    """
+    估算回合的服务端推送（Server-Sent Events）
+    出牌、全部出牌、回合结束时推送事件，空闲时每 15 秒发送一次心跳
+    """
+    round_id = request.args.get('round_id', type=int)
+    if not round_id or not round_state.get(round_id):
+        return Response(format_sse('round_ended', {'redirect': url_for('estimation.estimate')}),
+                        mimetype='text/event-stream')
+
+    user_id = session['user_id']
+    subscriber = round_events.subscribe(round_id, user_id)
+    initial_state = format_sse('vote', get_round_progress(round_id))
+    # 生成器在请求结束后执行，提前释放数据库连接
+    db.session.remove()
+
+    def stream():
+        try:
+            yield initial_state
+            while True:
+                try:
+                    message = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield message
+                if message.startswith('event: round_ended'):
+                    break
+        finally:
+            round_events.unsubscribe(round_id, subscriber)
+            # 尚未出牌的人离开后，剩下的在线成员可能都已出牌（只读内存状态，此时已没有请求上下文）
+            state = round_state.peek(round_id)
+            if state is not None and user_id not in state.voter_ids():
+                publish_vote(round_id, state)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @estimation_bp.route('/reveal')
 def reveal():
@@ -74,84 +141,24 @@ def reveal():
     round_id = request.args.get('round_id', type=int)
     if not round_id:
         return redirect(url_for('estimation.estimate'))
-    current_round = db.session.get(GameRound, round_id)
-    if not current_round or current_round.end_time is not None:
+    # 统计结果在出牌变化前一直复用，揭示页不再查询数据库
+    state = round_state.get(round_id)
+    if not state:
         return redirect(url_for('estimation.estimate'))
-    estimates = Estimate.query.filter_by(round_id=round_id).all()
-    user_ids = {e.user_id for e in estimates}
-    users = User.query.filter(User.id.in_(user_ids)).all()
-    user_map = {e.user_id: e for e in estimates}
-    
-    # 计算统计信息
-    numeric_estimates = [float(e.card_value) for e in estimates 
-                        if e.card_value not in ['?', '∞', 'coffee'] and e.card_value is not None]
-    
-    average = sum(numeric_estimates) / len(numeric_estimates) if numeric_estimates else 0
-    
-    # 计算共识 - 所有人选择相同值
-    # consensus = len(set(e.card_value for e in estimates)) == 1 if estimates else False
-
-    # 计算共识 - 使用多数投票方法（动态阈值）
-    # 如果有超过一定比例（如70%）的成员选择了相同的值，则认为达成共识
-    # 对于小团队，使用较低的阈值
-    def calculate_consensus_by_majority(estimates):
-        if not estimates:
-            return False, None
-
-        # 统计每个值的选择次数
-        value_counts = {}
-        total_votes = 0
-        for e in estimates:
-            # 只考虑有效数值估算
-            if e.card_value not in ['?', '∞', 'coffee'] and e.card_value is not None:
-                value_counts[e.card_value] = value_counts.get(e.card_value, 0) + 1
-                total_votes += 1
-
-        if total_votes == 0:
-            return False, None
-
-        # 找出得票最多的值
-        majority_value = max(value_counts, key=value_counts.get)
-        majority_votes = value_counts[majority_value]
-
-        # 动态阈值：小团队使用较低阈值，大团队使用较高阈值
-        # 2-3人团队：50%阈值
-        # 4-5人团队：60%阈值
-        # 6人及以上团队：70%阈值
-        if total_votes <= 3:
-            threshold = 0.5
-        elif total_votes <= 5:
-            threshold = 0.6
-        else:
-            threshold = 0.7
-
-        # 检查是否超过阈值
-        consensus_reached = (majority_votes / total_votes) >= threshold
+    summary = state.summary()
+    estimates = summary['estimates']
 
-        return consensus_reached, majority_value if consensus_reached else majority_value, threshold, total_votes
-
-    # 使用多数投票方法计算共识
-    consensus, consensus_value, threshold, total_votes = calculate_consensus_by_majority(estimates)
-
-    # 计算数值分布
-    value_counts = {}
-    for e in estimates:
-        value_counts[e.card_value] = value_counts.get(e.card_value, 0) + 1
-    
-    
     return render_template('reveal.html', 
-                         users=users, 
-                         user_map=user_map, 
-                         current_round=current_round, 
+                         user_map={e.user_id: e for e in estimates},
                          round_id=round_id, 
-                         user_story=current_round.user_story,
+                         user_story=state.story,
                          estimates=estimates,
-                         average=average,
-                         consensus=consensus,
-                         consensus_value=consensus_value,
-                         value_counts=value_counts,
-                         threshold=threshold,
-                         total_votes=total_votes
+                         average=summary['average'],
+                         consensus=summary['consensus'],
+                         consensus_value=summary['consensus_value'],
+                         value_counts=summary['value_counts'],
+                         threshold=summary['threshold'],
+                         total_votes=summary['total_votes']
                          )
 
 @estimation_bp.route('/new_round')
@@ -165,6 +172,8 @@ def new_round():
     if current_round and current_round.end_time is None:
         current_round.end_time = datetime.now(UTC)
         db.session.commit()
+        round_state.end_round(round_id)
+        publish_round_ended(round_id)
     return redirect(url_for('estimation.estimate'))
 
 
@@ -205,7 +214,10 @@ def save_story_points():
             # 只有在回合尚未结束时才设置结束时间
             if current_round.end_time is None:
                 current_round.end_time = datetime.now(UTC)  # 结束当前回合
+            refresh_sprint_burndown(sprint_backlog.sprint_id)
             db.session.commit()
+            round_state.end_round(round_id)
+            publish_round_ended(round_id)
             flash(f'故事点已保存为 {story_points}', 'success')
         else:
             # 如果没有关联的冲刺待办事项，则更新用户故事的effort字段作为备选方案
@@ -214,6 +226,8 @@ def save_story_points():
             if current_round.end_time is None:
                 current_round.end_time = datetime.now(UTC)  # 结束当前回合
             db.session.commit()
+            round_state.end_round(round_id)
+            publish_round_ended(round_id)
             flash(f'故事点已保存为 {story_points}', 'success')
     else:
         flash('未找到关联的用户故事', 'error')
@@ -228,14 +242,14 @@ def estimate():
 
     # 添加分页支持，每页显示10条数据
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', type=str)
     per_page = 10
 
-    # 使用 paginate 进行分页查询
-    user_story_pagination = UserStory.query.order_by(UserStory.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    # 按 (创建时间, id) 游标分页
+    user_story_pagination = keyset_paginate(UserStory.query, UserStory.created_at, UserStory.id,
+                                            cursor=cursor, page=page, per_page=per_page, descending=True)
 
     user_story_list = user_story_pagination.items
-    user_count = User.query.count()
 
     # 创建一个字典来存储每个用户故事的故事点
     story_points_info = {}
@@ -250,26 +264,9 @@ def estimate():
     for backlog in sprint_backlogs:
         story_points_info[backlog.user_story_id] = backlog.story_points
 
-    progress_info = {}
-    for user_story in user_story_list:
-        current_round = GameRound.query.filter_by(user_story_id=user_story.id, end_time=None).first()
-        if current_round:
-            estimates = Estimate.query.filter_by(round_id=current_round.id).all()
-            finished_user_ids = {e.user_id for e in estimates}
-            finished_users = User.query.filter(User.id.in_(finished_user_ids)).all()
-            progress_info[user_story.id] = {
-                'round_id': current_round.id,
-                'finished_count': len(finished_user_ids),
-                'user_count': user_count,
-                'finished_users': finished_users
-            }
-        else:
-            progress_info[user_story.id] = {
-                'round_id': None,
-                'finished_count': 0,
-                'user_count': user_count,
-                'finished_users': []
-            }
+    # 一次查询获取这一页故事的未结束回合及出牌进度
+    progress_info = load_open_round_progress(user_story_ids)
+
     return render_template('estimate.html',
                            user_story_list=user_story_list,
                            progress_info=progress_info,
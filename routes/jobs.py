@@ -0,0 +1,50 @@
+import os
+
+from flask import Blueprint, render_template, jsonify, session, redirect, url_for, flash, send_file
+from models import db, BackgroundJob
+from jobs import serialize_job, JOB_DONE
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.before_request
+def check_access():
+    # 确保用户已登录
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+
+
+def get_own_job(job_id):
+    """只能查看自己提交的任务"""
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None or job.user_id != session.get('user_id'):
+        return None
+    return job
+
+
+@jobs_bp.route('/jobs/<int:job_id>')
+def job_detail(job_id):
+    """后台任务进度页面"""
+    job = get_own_job(job_id)
+    if job is None:
+        flash('任务不存在', 'error')
+        return redirect(url_for('auth.index'))
+    return render_template('job_status.html', job=serialize_job(job))
+
+
+@jobs_bp.route('/api/jobs/<int:job_id>')
+def api_job_status(job_id):
+    """轮询后台任务进度"""
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'})
+    return jsonify({'success': True, 'job': serialize_job(job)})
+
+
+@jobs_bp.route('/jobs/<int:job_id>/download')
+def download_job_result(job_id):
+    """下载后台任务的结果文件"""
+    job = get_own_job(job_id)
+    if job is None or job.status != JOB_DONE or not job.result_path or not os.path.exists(job.result_path):
+        flash('结果文件不存在', 'error')
+        return redirect(url_for('jobs.job_detail', job_id=job_id))
+    return send_file(job.result_path, as_attachment=True, download_name=job.result_name)
@@ -1,8 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
-from models import db, Task, UserStory, User, Sprint, SprintBacklog, ProjectInfo, Defect
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, make_response
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from models import db, Task, UserStory, Sprint, SprintBacklog, ProjectInfo, Defect, ProductBacklog
 from utils import check_system_feature_access
-from decorators import check_access_blueprint
-from datetime import datetime, timedelta
+from decorators import check_access_blueprint, self_checked
+from burndown import get_burndown_data
+from reference_data import user_options, sprint_options
+from datetime import datetime
+import hashlib
 
 kanban_bp = Blueprint('kanban', __name__)
 
@@ -13,6 +18,7 @@ def check_access():
     pass  # 路由权限由装饰器处理
 
 @kanban_bp.route('/kanban')
+@self_checked('kanban.kanban')
 def kanban():
     """看板页面"""
     # 检查权限
@@ -20,7 +26,7 @@ def kanban():
         return redirect(url_for('auth.index'))
 
     # 获取所有迭代
-    sprints = Sprint.query.order_by(Sprint.start_date.desc()).all()
+    sprints = sprint_options()
 
     return render_template('kanban.html', sprints=sprints)
 
@@ -33,7 +39,208 @@ def get_priority_order(priority):
     }
     return priority_map.get(priority, 3)  # 未知优先级排在最后
 
+def serialize_task(task):
+    """将任务转换为看板使用的字典格式（需预先加载 assignee 和 user_story）"""
+    story = task.user_story
+    return {
+        'id': task.id,
+        'task_id': task.task_id or '',
+        'name': task.name,
+        'description': task.description or '',
+        'status': task.status,
+        'task_type': task.task_type or '',
+        'priority': task.priority,
+        'assignee_name': task.assignee.name if task.assignee else '',
+        'assignee_id': task.assignee_id,
+        'start_date': task.start_date.strftime('%Y-%m-%d') if task.start_date else '',
+        'end_date': task.end_date.strftime('%Y-%m-%d') if task.end_date else '',
+        'created_at': task.created_at.strftime('%Y-%m-%d %H:%M:%S') if task.created_at else '',
+        'story_title': story.title if story else '',
+        'story_id': story.story_id if story else ''
+    }
+
+
+def serialize_defect(defect):
+    """将缺陷转换为看板使用的字典格式（需预先加载 assignee 和 resolver）"""
+    return {
+        'id': defect.id,
+        'defect_id': defect.defect_id or '',
+        'title': defect.title,
+        'description': defect.description or '',
+        'status': defect.status,
+        'priority': defect.priority,
+        'severity': defect.severity,
+        'defect_type': defect.defect_type,
+        'assignee_name': defect.assignee.name if defect.assignee else '',
+        'assignee_id': defect.assignee_id,
+        'resolver_name': defect.resolver.name if defect.resolver else '',
+        'resolver_id': defect.resolver_id,
+        'created_at': defect.created_at.strftime('%Y-%m-%d %H:%M:%S') if defect.created_at else '',
+        'updated_at': defect.updated_at.strftime('%Y-%m-%d %H:%M:%S') if defect.updated_at else ''
+    }
+
+
+def sort_tasks_data(tasks_data):
+    """按负责人和优先级排序任务"""
+    tasks_data.sort(key=lambda x: (
+        x['assignee_id'] is None,  # 未分配的任务排在前面
+        x['assignee_name'] or '',  # 按负责人名称排序
+        get_priority_order(x['priority'])  # 按优先级排序
+    ))
+    return tasks_data
+
+
+def load_sprint_project_info(story_ids):
+    """通过迭代中的第一个用户故事获取项目信息"""
+    if not story_ids:
+        return None
+
+    product_backlog = ProductBacklog.query.join(
+        UserStory, UserStory.product_backlog_id == ProductBacklog.id
+    ).filter(
+        UserStory.id == min(story_ids)
+    ).options(
+        joinedload(ProductBacklog.project_module),
+        joinedload(ProductBacklog.project)
+    ).first()
+    if not product_backlog:
+        return None
+
+    project_module = product_backlog.project_module
+    project = product_backlog.project
+
+    # 优先使用功能模块的路径信息
+    if project_module and project_module.path:
+        # 从项目模块的路径中提取项目信息，第一个路径段对应根项目
+        path_parts = project_module.path.split('/')
+        if len(path_parts) < 2:
+            return None
+        if project and project.parent_id is None and project.name == path_parts[1]:
+            root_project = project
+        else:
+            root_project = ProjectInfo.query.filter_by(name=path_parts[1], parent_id=None).first()
+        if root_project:
+            return {
+                'name': root_project.name,
+                'short_name': root_project.short_name or ''
+            }
+        return None
+
+    # 如果没有功能模块，则使用项目信息
+    if project:
+        return {
+            'name': project.name,
+            'short_name': project.short_name or ''
+        }
+    return None
+
+
+def build_kanban_payload(sprint_id):
+    """
+    组装看板数据
+    查询次数固定（迭代、待办事项、任务、项目信息、缺陷），不随任务数和用户数增长；
+    用户列表用于任务分配，包含全部用户的 id/name，取自按版本失效的下拉数据缓存
+    """
+    sprint = Sprint.query.options(
+        joinedload(Sprint.product_owner),
+        joinedload(Sprint.scrum_master)
+    ).filter_by(id=sprint_id).first()
+    if not sprint:
+        return None
+
+    story_ids = [row.user_story_id for row in db.session.query(SprintBacklog.user_story_id).filter(
+        SprintBacklog.sprint_id == sprint_id)]
+
+    # 获取这些用户故事下的所有任务，连同用户故事和负责人一起加载
+    tasks = Task.query.options(
+        joinedload(Task.user_story),
+        joinedload(Task.assignee)
+    ).filter(Task.user_story_id.in_(story_ids)).all() if story_ids else []
+
+    # 获取该迭代下的所有缺陷，连同负责人和解决者一起加载
+    defects = Defect.query.options(
+        joinedload(Defect.assignee),
+        joinedload(Defect.resolver)
+    ).filter_by(sprint_id=sprint_id).all()
+
+    # 迭代信息
+    sprint_info = {
+        'id': sprint.id,
+        'name': sprint.name,
+        'start_date': sprint.start_date.strftime('%Y-%m-%d') if sprint.start_date else '',
+        'end_date': sprint.end_date.strftime('%Y-%m-%d') if sprint.end_date else '',
+        'status': sprint.status,
+        'product_owner': sprint.product_owner.name if sprint.product_owner else '',
+        'scrum_master': sprint.scrum_master.name if sprint.scrum_master else ''
+    }
+
+    # 获取所有用户用于任务分配
+    users_data = [{'id': user.id, 'name': user.name} for user in user_options()]
+
+    return {
+        'success': True,
+        # 定义看板列（状态）
+        'columns': [
+            {'status': '未开始', 'name': '待处理'},
+            {'status': '进行中', 'name': '进行中'},
+            {'status': '已完成', 'name': '已完成'}
+        ],
+        'tasks': sort_tasks_data([serialize_task(task) for task in tasks]),
+        'defects': [serialize_defect(defect) for defect in defects],
+        'burndown_data': get_burndown_data(sprint),
+        'sprint_info': sprint_info,
+        'project_info': load_sprint_project_info(story_ids),
+        'sprint_id': sprint_id,
+        'users': users_data,
+        'version': format_watermark(max_updated_at(tasks, defects))
+    }
+
+
+def max_updated_at(*groups):
+    """返回若干组任务/缺陷中最大的 updated_at"""
+    values = [item.updated_at for items in groups for item in items if item.updated_at]
+    return max(values) if values else None
+
+
+def format_watermark(value):
+    """将 updated_at 水位转换为客户端回传的字符串"""
+    return value.isoformat() if value else ''
+
+
+def parse_watermark(value):
+    """解析客户端回传的水位，无效时返回 None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def get_sprint_version(sprint_id, story_ids):
+    """
+    计算迭代看板的版本签名（只做聚合查询）
+    任务/缺陷的数量和最大 updated_at 能反映新增、修改和删除；待办事项的故事点影响燃尽图
+    """
+    task_count, task_max = (db.session.query(func.count(Task.id), func.max(Task.updated_at))
+                            .filter(Task.user_story_id.in_(story_ids)).one()) if story_ids else (0, None)
+    defect_count, defect_max = db.session.query(
+        func.count(Defect.id), func.max(Defect.updated_at)
+    ).filter(Defect.sprint_id == sprint_id).one()
+    latest = max([value for value in (task_max, defect_max) if value], default=None)
+    return {
+        'watermark': latest,
+        'signature': (task_count, task_max, defect_count, defect_max)
+    }
+
+
+def make_kanban_etag(*parts):
+    """根据版本签名生成 ETag"""
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
 @kanban_bp.route('/get_kanban_data/<int:sprint_id>')
+@self_checked('kanban.kanban')
 def get_kanban_data(sprint_id):
     """获取看板数据"""
     # 检查权限
@@ -41,156 +248,89 @@ def get_kanban_data(sprint_id):
         return jsonify({'success': False, 'message': '权限不足'})
 
     try:
-        # 获取迭代
-        sprint = db.session.get(Sprint, sprint_id)
-        if not sprint:
+        payload = build_kanban_payload(sprint_id)
+        if payload is None:
             return jsonify({'success': False, 'message': '迭代不存在'})
+        # 内容未变化时返回 304，省去重复传输
+        response = jsonify(payload)
+        response.add_etag()
+        return response.make_conditional(request)
+    except Exception as e:
+        # 捕获所有异常并返回错误信息
+        import traceback
+        traceback.print_exc()  # 打印错误堆栈信息，方便调试
+        return jsonify({'success': False, 'message': f'服务器内部错误: {str(e)}'})
 
-        # 获取项目信息（通过迭代关联的用户故事）
-        project_info = None
-        sprint_backlogs = SprintBacklog.query.filter_by(sprint_id=sprint_id).all()
-        story_ids = [backlog.user_story_id for backlog in sprint_backlogs]
-
-        if story_ids:
-            # 获取用户故事及关联的项目信息
-            user_story = UserStory.query.filter(UserStory.id.in_(story_ids)).first()
-            # 通过产品待办列表获取项目信息
-            if user_story and user_story.product_backlog:
-                project_module = user_story.product_backlog.project_module
-                project = user_story.product_backlog.project
-
-                # 优先使用功能模块的路径信息
-                if project_module and project_module.path:
-                    # 从项目模块的路径中提取项目信息
-                    path_parts = project_module.path.split('/')
-                    if len(path_parts) >= 2:
-                        # 获取根项目节点（第一个路径段对应根项目）
-                        root_project = ProjectInfo.query.filter_by(name=path_parts[1], parent_id=None).first()
-                        if root_project:
-                            project_info = {
-                                'name': root_project.name,
-                                'short_name': root_project.short_name or ''
-                            }
-                # 如果没有功能模块，则使用项目信息
-                elif project:
-                    project_info = {
-                        'name': project.name,
-                        'short_name': project.short_name or ''
-                    }
 
+@kanban_bp.route('/get_kanban_delta/<int:sprint_id>')
+@self_checked('kanban.kanban')
+def get_kanban_delta(sprint_id):
+    """
+    获取看板增量数据
+    参数 since 为上次返回的 version，只返回此后变化的任务和缺陷；
+    同时返回当前全部任务/缺陷的 id，客户端据此移除已删除的卡片；
+    其中有客户端没有的 id 时（例如新加入迭代的用户故事下 updated_at 较早的任务），客户端改为获取全量数据。
+    版本未变化且 If-None-Match 命中时返回 304
+    """
+    # 检查权限
+    if not check_system_feature_access(session, 'kanban.kanban'):
+        return jsonify({'success': False, 'message': '权限不足'})
 
-        # 定义看板列（状态）
-        columns = [
-            {'status': '未开始', 'name': '待处理'},
-            {'status': '进行中', 'name': '进行中'},
-            {'status': '已完成', 'name': '已完成'}
-        ]
-
-        # 获取这些用户故事下的所有任务
-        tasks = Task.query.filter(Task.user_story_id.in_(story_ids)).all()
-
-        # 获取用户故事信息
-        user_stories = UserStory.query.filter(UserStory.id.in_(story_ids)).all()
-        story_dict = {story.id: story for story in user_stories}
-
-        # 获取用户信息
-        user_ids = [task.assignee_id for task in tasks if task.assignee_id]
-        users = User.query.filter(User.id.in_(user_ids)).all()
-        user_dict = {user.id: user for user in users}
-
-        # 转换任务为字典格式
-        tasks_data = []
-        for task in tasks:
-            story = story_dict.get(task.user_story_id)
-            tasks_data.append({
-                'id': task.id,
-                'task_id': task.task_id or '',
-                'name': task.name,
-                'description': task.description or '',
-                'status': task.status,
-                'task_type': task.task_type or '',
-                'priority': task.priority,
-                'assignee_name': user_dict[task.assignee_id].name if task.assignee_id and task.assignee_id in user_dict else '',
-                'assignee_id': task.assignee_id,
-                'start_date': task.start_date.strftime('%Y-%m-%d') if task.start_date else '',
-                'end_date': task.end_date.strftime('%Y-%m-%d') if task.end_date else '',
-                'created_at': task.created_at.strftime('%Y-%m-%d %H:%M:%S') if task.created_at else '',
-                'story_title': story.title if story else '',
-                'story_id': story.story_id if story else ''
-            })
-
-        # 按负责人和优先级排序任务
-        tasks_data.sort(key=lambda x: (
-            x['assignee_id'] is None,  # 未分配的任务排在前面
-            x['assignee_name'] or '',  # 按负责人名称排序
-            get_priority_order(x['priority'])  # 按优先级排序
-        ))
-
-        # 获取该迭代下的所有缺陷
-        defects = Defect.query.filter_by(sprint_id=sprint_id).all()
-
-        # 获取缺陷相关的用户信息
-        defect_user_ids = []
-        for defect in defects:
-            if defect.assignee_id:
-                defect_user_ids.append(defect.assignee_id)
-            if defect.resolver_id:
-                defect_user_ids.append(defect.resolver_id)
-
-        defect_users = User.query.filter(User.id.in_(defect_user_ids)).all() if defect_user_ids else []
-        defect_user_dict = {user.id: user for user in defect_users}
+    since = parse_watermark(request.args.get('since'))
+    if since is None:
+        # 没有有效水位时退回全量数据
+        return get_kanban_data(sprint_id)
 
-        # 转换缺陷为字典格式
-        defects_data = []
-        for defect in defects:
-            defects_data.append({
-                'id': defect.id,
-                'defect_id': defect.defect_id or '',
-                'title': defect.title,
-                'description': defect.description or '',
-                'status': defect.status,
-                'priority': defect.priority,
-                'severity': defect.severity,
-                'defect_type': defect.defect_type,
-                'assignee_name': defect_user_dict[
-                    defect.assignee_id].name if defect.assignee_id and defect.assignee_id in defect_user_dict else '',
-                'assignee_id': defect.assignee_id,
-                'resolver_name': defect_user_dict[
-                    defect.resolver_id].name if defect.resolver_id and defect.resolver_id in defect_user_dict else '',
-                'resolver_id': defect.resolver_id,
-                'created_at': defect.created_at.strftime('%Y-%m-%d %H:%M:%S') if defect.created_at else '',
-                'updated_at': defect.updated_at.strftime('%Y-%m-%d %H:%M:%S') if defect.updated_at else ''
-            })
-
-        # 计算燃尽图数据
-        burndown_data = calculate_burndown_data(sprint, sprint_backlogs)
-
-        # 迭代信息
-        sprint_info = {
-            'id': sprint.id,
-            'name': sprint.name,
-            'start_date': sprint.start_date.strftime('%Y-%m-%d') if sprint.start_date else '',
-            'end_date': sprint.end_date.strftime('%Y-%m-%d') if sprint.end_date else '',
-            'status': sprint.status,
-            'product_owner': sprint.product_owner.name if sprint.product_owner else '',
-            'scrum_master': sprint.scrum_master.name if sprint.scrum_master else ''
-        }
+    try:
+        sprint = db.session.get(Sprint, sprint_id)
+        if not sprint:
+            return jsonify({'success': False, 'message': '迭代不存在'})
 
-        # 获取所有用户用于任务分配
-        all_users = User.query.all()
-        users_data = [{'id': user.id, 'name': user.name} for user in all_users]
+        sprint_backlogs = db.session.query(
+            SprintBacklog.user_story_id, SprintBacklog.story_points
+        ).filter(SprintBacklog.sprint_id == sprint_id).all()
+        story_ids = [backlog.user_story_id for backlog in sprint_backlogs]
 
-        return jsonify({
+        version = get_sprint_version(sprint_id, story_ids)
+        etag = make_kanban_etag(sprint_id, since, version['signature'], sprint_backlogs,
+                                sprint.start_date, sprint.end_date)
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        # MySQL 的 DATETIME 只精确到秒，使用 >= 避免漏掉同一秒内的修改（客户端按 id 覆盖）
+        changed_tasks = Task.query.options(
+            joinedload(Task.user_story),
+            joinedload(Task.assignee)
+        ).filter(
+            Task.user_story_id.in_(story_ids),
+            Task.updated_at >= since
+        ).all() if story_ids else []
+        changed_defects = Defect.query.options(
+            joinedload(Defect.assignee),
+            joinedload(Defect.resolver)
+        ).filter(
+            Defect.sprint_id == sprint_id,
+            Defect.updated_at >= since
+        ).all()
+
+        task_ids = [row.id for row in db.session.query(Task.id).filter(
+            Task.user_story_id.in_(story_ids))] if story_ids else []
+        defect_ids = [row.id for row in db.session.query(Defect.id).filter(Defect.sprint_id == sprint_id)]
+
+        response = jsonify({
             'success': True,
-            'columns': columns,
-            'tasks': tasks_data,
-            'defects': defects_data,
-            'burndown_data': burndown_data,
-            'sprint_info': sprint_info,
-            'project_info': project_info,
             'sprint_id': sprint_id,
-            'users': users_data
+            'version': format_watermark(max(version['watermark'] or since, since)),
+            'tasks': sort_tasks_data([serialize_task(task) for task in changed_tasks]),
+            'defects': [serialize_defect(defect) for defect in changed_defects],
+            'task_ids': task_ids,
+            'defect_ids': defect_ids,
+            'burndown_data': get_burndown_data(sprint)
         })
+        response.set_etag(etag)
+        return response
     except Exception as e:
         # 捕获所有异常并返回错误信息
         import traceback
@@ -198,105 +338,8 @@ def get_kanban_data(sprint_id):
         return jsonify({'success': False, 'message': f'服务器内部错误: {str(e)}'})
 
 
-def calculate_burndown_data(sprint, sprint_backlogs):
-    """计算燃尽图数据"""
-    if not sprint.start_date or not sprint.end_date:
-        return []
-
-    # 计算总故事点数
-    total_points = sum(backlog.story_points or 0 for backlog in sprint_backlogs)
-
-    # 生成日期范围
-    start_date = sprint.start_date
-    end_date = sprint.end_date
-    date_range = []
-
-    current_date = start_date
-    while current_date <= end_date:
-        date_range.append(current_date)
-        current_date += timedelta(days=1)
-
-    # 计算理想燃尽线数据
-    ideal_points = []
-    days_total = (end_date - start_date).days + 1
-    for i, date in enumerate(date_range):
-        ideal_points.append(total_points * (days_total - i) / days_total)
-
-    # 计算实际剩余故事点数（基于任务完成历史）
-    remaining_points = []
-
-    # 获取所有相关的用户故事ID
-    story_ids = [backlog.user_story_id for backlog in sprint_backlogs]
-
-    # 获取这些用户故事下的所有任务
-    from models import Task
-    tasks = Task.query.filter(Task.user_story_id.in_(story_ids)).all()
-
-    # 为每个用户故事计算总任务数
-    story_task_count = {}
-    for task in tasks:
-        story_id = task.user_story_id
-        if story_id not in story_task_count:
-            story_task_count[story_id] = 0
-        story_task_count[story_id] += 1
-
-    # 计算每天的剩余故事点数
-    for i, date in enumerate(date_range):
-        remaining_points_today = total_points
-
-        # 按用户故事分组任务
-        tasks_by_story = {}
-        for task in tasks:
-            story_id = task.user_story_id
-            if story_id not in tasks_by_story:
-                tasks_by_story[story_id] = []
-            tasks_by_story[story_id].append(task)
-
-        # 遍历每个用户故事
-        for backlog in sprint_backlogs:
-            story_id = backlog.user_story_id
-            story_points = backlog.story_points or 0
-
-            # 如果该用户故事没有任务，跳过
-            if story_id not in tasks_by_story:
-                continue
-
-            story_tasks = tasks_by_story[story_id]
-            total_story_tasks = len(story_tasks)
-
-            # 计算在当前日期前完成的任务数
-            completed_tasks_count = 0
-            for task in story_tasks:
-                if (task.status == '已完成' and
-                    task.completed_at and
-                    task.completed_at.date() <= date):
-                    completed_tasks_count += 1
-
-            # 如果该用户故事的所有任务都已完成，则减去全部故事点
-            if total_story_tasks > 0 and completed_tasks_count == total_story_tasks:
-                remaining_points_today -= story_points
-            # 否则按完成的任务比例减去部分故事点
-            elif total_story_tasks > 0:
-                completed_ratio = completed_tasks_count / total_story_tasks
-                remaining_points_today -= story_points * completed_ratio
-
-        # 确保不会出现负数
-        remaining_points_today = max(0, remaining_points_today)
-        remaining_points.append(remaining_points_today)
-
-    # 构造燃尽图数据
-    burndown_data = []
-    for i, date in enumerate(date_range):
-        burndown_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'remaining_points': round(remaining_points[i], 2) if i < len(remaining_points) else 0,
-            'ideal_points': round(ideal_points[i], 2) if i < len(ideal_points) else 0
-        })
-
-    return burndown_data
-
-
 @kanban_bp.route('/get_task_detail/<int:task_id>')
+@self_checked('kanban.kanban')
 def get_task_detail(task_id):
     """获取任务详情"""
     # 检查权限
@@ -304,33 +347,15 @@ def get_task_detail(task_id):
         return jsonify({'success': False, 'message': '权限不足'})
 
     # 获取任务
-    task = db.session.get(Task, task_id)
+    task = Task.query.options(
+        joinedload(Task.user_story),
+        joinedload(Task.assignee)
+    ).filter_by(id=task_id).first()
     if not task:
         return jsonify({'success': False, 'message': '任务不存在'})
 
-    # 获取用户故事信息
-    user_story = task.user_story
-
-    # 获取负责人信息
-    assignee = task.assignee if task.assignee_id else None
-
     # 转换任务为字典格式
-    task_data = {
-        'id': task.id,
-        'task_id': task.task_id or '',
-        'name': task.name,
-        'description': task.description or '',
-        'status': task.status,
-        'task_type': task.task_type or '',
-        'priority': task.priority,
-        'assignee_name': assignee.name if assignee else '',
-        'assignee_id': task.assignee_id,
-        'start_date': task.start_date.strftime('%Y-%m-%d') if task.start_date else '',
-        'end_date': task.end_date.strftime('%Y-%m-%d') if task.end_date else '',
-        'created_at': task.created_at.strftime('%Y-%m-%d %H:%M:%S') if task.created_at else '',
-        'story_title': user_story.title if user_story else '',
-        'story_id': user_story.story_id if user_story else ''
-    }
+    task_data = serialize_task(task)
 
     return jsonify({
         'success': True,
@@ -339,6 +364,7 @@ def get_task_detail(task_id):
 
 
 @kanban_bp.route('/get_defects_data/<int:sprint_id>')
+@self_checked('kanban.kanban')
 def get_defects_data(sprint_id):
     """获取指定迭代的缺陷数据"""
     # 检查权限
@@ -351,8 +377,11 @@ def get_defects_data(sprint_id):
         if not sprint:
             return jsonify({'success': False, 'message': '迭代不存在'})
 
-        # 获取该迭代下的所有缺陷
-        defects = Defect.query.filter_by(sprint_id=sprint_id).all()
+        # 获取该迭代下的所有缺陷，连同负责人和解决者一起加载
+        defects = Defect.query.options(
+            joinedload(Defect.assignee),
+            joinedload(Defect.resolver)
+        ).filter_by(sprint_id=sprint_id).all()
 
         # 获取项目信息
         project_info = None
@@ -362,42 +391,11 @@ def get_defects_data(sprint_id):
                 'short_name': sprint.project.short_name or ''
             }
 
-        # 获取用户信息
-        user_ids = []
-        for defect in defects:
-            if defect.assignee_id:
-                user_ids.append(defect.assignee_id)
-            if defect.resolver_id:
-                user_ids.append(defect.resolver_id)
-
-        users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
-        user_dict = {user.id: user for user in users}
-
         # 转换缺陷为字典格式
-        defects_data = []
-        for defect in defects:
-            defects_data.append({
-                'id': defect.id,
-                'defect_id': defect.defect_id or '',
-                'title': defect.title,
-                'description': defect.description or '',
-                'status': defect.status,
-                'priority': defect.priority,
-                'severity': defect.severity,
-                'defect_type': defect.defect_type,
-                'assignee_name': user_dict[
-                    defect.assignee_id].name if defect.assignee_id and defect.assignee_id in user_dict else '',
-                'assignee_id': defect.assignee_id,
-                'resolver_name': user_dict[
-                    defect.resolver_id].name if defect.resolver_id and defect.resolver_id in user_dict else '',
-                'resolver_id': defect.resolver_id,
-                'created_at': defect.created_at.strftime('%Y-%m-%d %H:%M:%S') if defect.created_at else '',
-                'updated_at': defect.updated_at.strftime('%Y-%m-%d %H:%M:%S') if defect.updated_at else ''
-            })
-
-        # 获取所有用户用于缺陷分配
-        all_users = User.query.all()
-        users_data = [{'id': user.id, 'name': user.name} for user in all_users]
+        defects_data = [serialize_defect(defect) for defect in defects]
+
+        # 获取所有用户用于缺陷分配（只取 id 和姓名）
+        users_data = [{'id': user.id, 'name': user.name} for user in user_options()]
 
         return jsonify({
             'success': True,
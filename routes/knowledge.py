@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from models import db, AgileKnowledge
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
 from utils import check_system_feature_access
+from search import text_filter
+from pagination import keyset_paginate
+from loader_profiles import KNOWLEDGE_LIST
 
 knowledge_bp = Blueprint('knowledge', __name__)
 
@@ -19,11 +22,12 @@ def knowledge():
 
     # 添加分页支持
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', type=str)
     per_page = 10  # 每页显示10篇文章
 
-    # 使用 paginate 进行分页查询
-    knowledge_pagination = AgileKnowledge.query.order_by(AgileKnowledge.updated_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    # 按 (更新时间, id) 游标分页
+    knowledge_pagination = keyset_paginate(AgileKnowledge.query.options(*KNOWLEDGE_LIST), AgileKnowledge.updated_at, AgileKnowledge.id,
+                                           cursor=cursor, page=page, per_page=per_page, descending=True)
 
     knowledge_articles = knowledge_pagination.items
     return render_template('knowledge_list.html', knowledge_articles=knowledge_articles, pagination=knowledge_pagination)
@@ -104,14 +108,19 @@ def delete_knowledge(knowledge_id):
     return redirect(url_for('knowledge.knowledge'))
 
 @knowledge_bp.route('/knowledge_view')
+@self_checked('knowledge.knowledge_view')
 def knowledge_view():
     # 检查用户是否有知识库查看权限
     if not check_system_feature_access(session, 'knowledge.knowledge_view'):
         return redirect(url_for('auth.index'))
 
-    # 获取所有知识文章，按更新时间倒序排列
-    knowledge_articles = AgileKnowledge.query.order_by(AgileKnowledge.updated_at.desc()).all()
-    return render_template('knowledge_view.html', knowledge_articles=knowledge_articles)
+    # 获取所有知识文章，按更新时间倒序排列；有关键词时按标题和正文全文搜索
+    search = request.args.get('search', '', type=str).strip()
+    query = AgileKnowledge.query.options(*KNOWLEDGE_LIST)
+    if search:
+        query = query.filter(text_filter((AgileKnowledge.title, AgileKnowledge.content), search)[0])
+    knowledge_articles = query.order_by(AgileKnowledge.updated_at.desc()).all()
+    return render_template('knowledge_view.html', knowledge_articles=knowledge_articles, search=search)
 
 
 @knowledge_bp.route('/knowledge_detail/<int:knowledge_id>')
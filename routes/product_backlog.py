@@ -1,12 +1,16 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from openpyxl.reader.excel import load_workbook
 
 from models import db, ProductBacklog, User, ProjectInfo
-from utils import check_system_feature_access, check_user_role
-from decorators import check_access_blueprint
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-from io import BytesIO
+from utils import check_system_feature_access
+from user_directory import non_admin_users
+from reference_data import project_options
+from loader_profiles import PRODUCT_BACKLOG_LIST
+from decorators import check_access_blueprint, self_checked
+from sequences import allocate_code, observe_code, requirement_sequence
+from exporters import ExportColumn, export_response, format_date
+from sqlalchemy.orm import aliased
+from jobs import background_jobs, job_handler, run_export_job
 import json
 
 product_backlog_bp = Blueprint('product_backlog', __name__)
@@ -18,23 +22,20 @@ def check_access():
     pass  # 装饰器会处理权限检查逻辑
 
 @product_backlog_bp.route('/product_backlog')
+@self_checked('product_backlog.product_backlog')
 def product_backlog():
     # 检查权限
     if not check_system_feature_access(session, 'product_backlog.product_backlog'):
         return redirect(url_for('auth.index'))
 
     # 获取所有项目（根节点）
-    projects = ProjectInfo.query.filter_by(parent_id=None).order_by(ProjectInfo.order).all()
+    projects = project_options()
 
-    # 获取所有产品待办事项
-    product_backlogs = ProductBacklog.query.order_by(ProductBacklog.created_at.desc()).all()
+    # 获取所有产品待办事项，模板用到的项目、功能模块、需求责任人一并加载
+    product_backlogs = ProductBacklog.query.options(*PRODUCT_BACKLOG_LIST).order_by(ProductBacklog.created_at.desc()).all()
 
     # 获取所有非管理员用户，用于分配责任人和分析人员
-    all_users = User.query.all()
-    users = []
-    for user in all_users:
-        if not check_user_role(user.id, 'admin'):
-            users.append(user)
+    users = non_admin_users()
 
     return render_template('product_backlog.html',
                           product_backlogs=product_backlogs,
@@ -45,36 +46,12 @@ def product_backlog():
 def generate_requirement_id():
     """
     生成产品待办事项编号
-    规则：R_序号(3位)
+    规则：R_序号(3位)，从编号序列原子分配，需在同一事务中提交
     """
-    # 查询当前最大的需求序号
-    backlogs = ProductBacklog.query.all()
-
-    if backlogs:
-        # 查找最大的序号并加1
-        max_seq = 0
-        for backlog in backlogs:
-            if backlog.requirement_id and backlog.requirement_id.startswith("R_"):
-                try:
-                    seq = int(backlog.requirement_id.split('_')[1])
-                    if seq > max_seq:
-                        max_seq = seq
-                except (IndexError, ValueError):
-                    # 如果解析失败，跳过该需求
-                    pass
-        next_seq = max_seq + 1
-    else:
-        # 如果没有产品待办事项，默认值为1
-        next_seq = 1
-
-    # 序号保持3位长度，不够前面补零
-    seq_part = str(next_seq).zfill(3)
-
-    # 拼接生成需求编号
-    requirement_id = f"R_{seq_part}"
-    return requirement_id
+    return allocate_code(requirement_sequence())
 
 @product_backlog_bp.route('/product_backlog/add', methods=['POST'])
+@self_checked('product_backlog.product_backlog')
 def add_product_backlog():
     # 检查权限
     if not check_system_feature_access(session, 'product_backlog.product_backlog'):
@@ -127,6 +104,7 @@ def add_product_backlog():
         return jsonify({'success': False, 'message': f'添加失败: {str(e)}'})
 
 @product_backlog_bp.route('/product_backlog/get/<int:backlog_id>')
+@self_checked('product_backlog.product_backlog')
 def get_product_backlog(backlog_id):
     try:
         # 检查权限
@@ -163,6 +141,7 @@ def get_product_backlog(backlog_id):
 
 
 @product_backlog_bp.route('/product_backlog/edit/<int:backlog_id>', methods=['POST'])
+@self_checked('product_backlog.product_backlog')
 def edit_product_backlog(backlog_id):
     # 检查权限
     if not check_system_feature_access(session, 'product_backlog.product_backlog'):
@@ -213,6 +192,7 @@ def edit_product_backlog(backlog_id):
         return jsonify({'success': False, 'message': f'更新失败: {str(e)}'})
 
 @product_backlog_bp.route('/product_backlog/delete/<int:backlog_id>', methods=['POST'])
+@self_checked('product_backlog.product_backlog')
 def delete_product_backlog(backlog_id):
     # 检查权限
     if not check_system_feature_access(session, 'product_backlog.product_backlog'):
@@ -231,74 +211,65 @@ def delete_product_backlog(backlog_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'})
 
+def build_product_backlog_export():
+    """产品待办事项导出的查询和列定义"""
+    # 关联名称通过外连接一次查出，避免逐行加载关联对象
+    project, module = aliased(ProjectInfo), aliased(ProjectInfo)
+    customer_owner, analyst = aliased(User), aliased(User)
+    query = db.session.query(
+        ProductBacklog,
+        project.name.label('project_name'),
+        module.name.label('module_name'),
+        customer_owner.name.label('customer_owner_name'),
+        analyst.name.label('analyst_name')
+    ).outerjoin(project, project.id == ProductBacklog.project_id) \
+        .outerjoin(module, module.id == ProductBacklog.project_module_id) \
+        .outerjoin(customer_owner, customer_owner.id == ProductBacklog.customer_owner_id) \
+        .outerjoin(analyst, analyst.id == ProductBacklog.analyst_id) \
+        .order_by(ProductBacklog.created_at.desc())
+
+    columns = [
+        ExportColumn('需求编号', lambda row: row.ProductBacklog.requirement_id),
+        ExportColumn('所属项目', lambda row: row.project_name or ''),
+        ExportColumn('功能模块', lambda row: row.module_name or ''),
+        ExportColumn('需求标题', lambda row: row.ProductBacklog.title),
+        ExportColumn('需求描述', lambda row: row.ProductBacklog.description),
+        ExportColumn('需求类型', lambda row: row.ProductBacklog.requirement_type),
+        ExportColumn('责任人', lambda row: row.customer_owner_name or ''),
+        ExportColumn('优先级', lambda row: row.ProductBacklog.priority),
+        ExportColumn('提出日期', lambda row: format_date(row.ProductBacklog.created_at)),
+        ExportColumn('需求状态', lambda row: row.ProductBacklog.status),
+        ExportColumn('分析人员', lambda row: row.analyst_name or ''),
+        ExportColumn('执行进度', lambda row: row.ProductBacklog.progress),
+        ExportColumn('关联信息', lambda row: row.ProductBacklog.related_info),
+        ExportColumn('标签', lambda row: row.ProductBacklog.tags)
+    ]
+
+    return query, columns, '产品待办事项', '产品待办事项'
+
+
+@job_handler('product_backlog.export')
+def run_product_backlog_export_job(job, params, progress):
+    return run_export_job(job, build_product_backlog_export(), params.get('format', 'xlsx'))
+
+
 @product_backlog_bp.route('/product_backlog/export')
+@self_checked('product_backlog.product_backlog')
 def export_product_backlog():
     # 检查权限
     if not check_system_feature_access(session, 'product_backlog.product_backlog'):
         return redirect(url_for('auth.index'))
 
-    # 创建工作簿和工作表
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "产品待办事项"
-
-    # 设置表头样式
-    header_font = Font(bold=True)
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    # 写入表头
-    headers = ['需求编号', '所属项目', '功能模块', '需求标题', '需求描述', '需求类型', '责任人', '优先级',
-              '提出日期', '需求状态', '分析人员', '执行进度', '关联信息', '标签']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-    # 获取所有产品待办事项
-    backlogs = ProductBacklog.query.order_by(ProductBacklog.created_at.desc()).all()
-
-    # 写入数据
-    for row, backlog in enumerate(backlogs, 2):
-        ws.cell(row=row, column=1, value=backlog.requirement_id)
-        ws.cell(row=row, column=2, value=backlog.project.name if backlog.project else '')
-        ws.cell(row=row, column=3, value=backlog.project_module.name if backlog.project_module else '')
-        ws.cell(row=row, column=4, value=backlog.title)
-        ws.cell(row=row, column=5, value=backlog.description)
-        ws.cell(row=row, column=6, value=backlog.requirement_type)
-        ws.cell(row=row, column=7, value=backlog.customer_owner.name if backlog.customer_owner else '')
-        ws.cell(row=row, column=8, value=backlog.priority)
-        ws.cell(row=row, column=9, value=backlog.created_at.strftime('%Y-%m-%d') if backlog.created_at else '')
-        ws.cell(row=row, column=10, value=backlog.status)
-        ws.cell(row=row, column=11, value=backlog.analyst.name if backlog.analyst else '')
-        ws.cell(row=row, column=12, value=backlog.progress)
-        ws.cell(row=row, column=13, value=backlog.related_info)
-        ws.cell(row=row, column=14, value=backlog.tags)
-
-    # 设置列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column_letter].width = min(adjusted_width, 50)
-
-    # 将工作簿保存到内存中
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # 返回Excel文件作为附件下载
-    return send_file(output,
-                    as_attachment=True,
-                    download_name='产品待办事项.xlsx',
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    # 数据量大时提交后台任务，完成后在任务页面下载
+    if request.args.get('background'):
+        job = background_jobs.enqueue('product_backlog.export', session['user_id'], params=request.args.to_dict())
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+    query, columns, filename, sheet_title = build_product_backlog_export()
+    return export_response(query, columns, filename, sheet_title, request.args.get('format', 'xlsx'))
 
 @product_backlog_bp.route('/product_backlog/import', methods=['POST'])
+@self_checked('product_backlog.product_backlog')
 def import_product_backlog():
     # 检查权限
     if not check_system_feature_access(session, 'product_backlog.product_backlog'):
@@ -328,6 +299,10 @@ def import_product_backlog():
             if not any(cell for cell in row[:3]):
                 continue
 
+            # 导入的需求编号推进编号序列，避免之后自动生成重复编号
+            if row[0]:
+                observe_code(requirement_sequence(), str(row[0]))
+
             # 创建新的产品待办事项
             backlog = ProductBacklog(
                 requirement_id=row[0],
@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
 from models import db, ProjectInfo
 from utils import check_system_feature_access
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
+from project_tree import get_forest_tree, get_module_list, invalidate_project_tree, move_subtree, rename_node
 
 projects_bp = Blueprint('projects', __name__)
 
@@ -12,35 +13,19 @@ def check_access():
     pass  # 装饰器会处理权限检查逻辑
 
 @projects_bp.route('/projects')
+@self_checked('projects.projects')
 def projects():
     # 检查权限
     if not check_system_feature_access(session, 'projects.projects'):
         return redirect(url_for('auth.index'))
     
-    # 获取所有根节点（项目）
-    root_projects = ProjectInfo.query.filter_by(parent_id=None).order_by(ProjectInfo.order).all()
-    
-    # 递归获取树形结构数据
-    def build_tree(nodes):
-        tree = []
-        for node in nodes:
-            children = ProjectInfo.query.filter_by(parent_id=node.id).order_by(ProjectInfo.order).all()
-            tree.append({
-                'id': node.id,
-                'name': node.name,
-                'short_name': node.short_name,
-                'node_type': node.node_type,
-                'path': node.path,
-                'created_at': node.created_at,
-                'children': build_tree(children) if children else []
-            })
-        return tree
-    
-    projects_tree = build_tree(root_projects)
+    # 一次查询加载全部节点，在内存中组装树形结构（带缓存）
+    projects_tree = get_forest_tree()
     
     return render_template('projects.html', projects_tree=projects_tree)
 
 @projects_bp.route('/projects/<int:project_id>/modules')
+@self_checked('projects.projects')
 def get_project_modules(project_id):
     """获取指定项目下的功能模块（菜单和页面节点）"""
     # 检查权限
@@ -53,21 +38,7 @@ def get_project_modules(project_id):
         return jsonify({'success': False, 'message': '项目不存在'})
 
     # 获取项目下的所有菜单和页面节点（功能模块）
-    modules = ProjectInfo.query.filter(
-        ProjectInfo.path.like(f"/{project.name}%")
-    ).filter(
-        ProjectInfo.node_type.in_(['menu', 'page'])
-    ).order_by(ProjectInfo.path).all()
-
-    # 转换为字典格式
-    modules_data = []
-    for module in modules:
-        modules_data.append({
-            'id': module.id,
-            'name': module.name,
-            'node_type': module.node_type,
-            'path': module.path
-        })
+    modules_data = get_module_list(project.id)
 
     return jsonify({
         'success': True,
@@ -113,6 +84,7 @@ def add_project_node():
     try:
         db.session.add(new_node)
         db.session.commit()
+        invalidate_project_tree()
         return jsonify({
             'success': True,
             'message': '添加成功',
@@ -146,13 +118,15 @@ def edit_project_node(node_id):
     if not name:
         return jsonify({'success': False, 'message': '名称不能为空'})
     
-    # 更新节点信息
-    node.name = name
-    if node.node_type == 'project':
-        node.short_name = short_name
-    
     try:
+        # 更新节点信息，名称变化时同步更新子孙节点的路径
+        if name != node.name:
+            rename_node(node, name)
+        if node.node_type == 'project':
+            node.short_name = short_name
+
         db.session.commit()
+        invalidate_project_tree()
         return jsonify({'success': True, 'message': '更新成功'})
     except Exception as e:
         db.session.rollback()
@@ -176,6 +150,7 @@ def delete_project_node(node_id):
     try:
         db.session.delete(node)
         db.session.commit()
+        invalidate_project_tree()
         return jsonify({'success': True, 'message': '删除成功'})
     except Exception as e:
         db.session.rollback()
@@ -195,35 +170,26 @@ def move_project_node():
     if not node:
         return jsonify({'success': False, 'message': '节点不存在'})
     
-    # 更新父节点
-    node.parent_id = new_parent_id if new_parent_id else None
-    
-    # 更新排序
-    if new_order is not None:
-        node.order = new_order
-    
-    # 更新路径
+    new_parent = None
     if new_parent_id:
-        parent = ProjectInfo.query.get(new_parent_id)
-        if parent:
-            node.path = f"{parent.path}/{node.name}" if parent.path else f"/{parent.name}/{node.name}"
-        else:
-            node.path = f"/{node.name}"
-    else:
-        node.path = f"/{node.name}"
-    
-    # 递归更新子节点路径
-    def update_children_paths(parent_node):
-        children = ProjectInfo.query.filter_by(parent_id=parent_node.id).all()
-        for child in children:
-            child.path = f"{parent_node.path}/{child.name}"
-            update_children_paths(child)
-    
-    update_children_paths(node)
-    
+        new_parent = db.session.get(ProjectInfo, new_parent_id)
+        if not new_parent:
+            return jsonify({'success': False, 'message': '目标父节点不存在'})
+
     try:
+        # 更新父节点和路径，子孙节点的路径用一条 UPDATE 批量替换
+        move_subtree(node, new_parent)
+
+        # 更新排序
+        if new_order is not None:
+            node.order = new_order
+
         db.session.commit()
+        invalidate_project_tree()
         return jsonify({'success': True, 'message': '移动成功'})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'移动失败: {str(e)}'})
@@ -271,6 +237,7 @@ def move_node_up(node_id):
 
     try:
         db.session.commit()
+        invalidate_project_tree()
         return jsonify({'success': True, 'message': '上移成功'})
     except Exception as e:
         db.session.rollback()
@@ -319,6 +286,7 @@ def move_node_down(node_id):
 
     try:
         db.session.commit()
+        invalidate_project_tree()
         return jsonify({'success': True, 'message': '下移成功'})
     except Exception as e:
         db.session.rollback()
@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, flash, current_app
 from models import db, ProjectInfo, PrototypeImage, User
 from utils import check_system_feature_access
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
+from project_tree import load_subtree, flatten_subtree
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
@@ -15,6 +16,7 @@ def check_access():
     pass  # 路由权限由装饰器处理
 
 @prototype_bp.route('/prototype')
+@self_checked('prototype.prototype_list')
 def prototype_list():
     """原型图管理主页"""
     if not check_system_feature_access(session, 'prototype.prototype_list'):
@@ -284,22 +286,5 @@ def get_project_nodes(project_id):
 
 
 def get_all_project_nodes(project_id):
-    """递归获取项目的所有节点"""
-    def _get_children(parent_id):
-        children = []
-        # 按照order字段排序获取子节点
-        for child in ProjectInfo.query.filter_by(parent_id=parent_id).order_by(ProjectInfo.order):
-            children.append(child)
-            children.extend(_get_children(child.id))
-        return children
-
-    # 获取根节点
-    root_node = ProjectInfo.query.get(project_id)
-    if not root_node:
-        return []
-
-    # 获取所有子节点
-    all_nodes = [root_node]
-    all_nodes.extend(_get_children(root_node.id))
-
-    return all_nodes
\ No newline at end of file
+    """获取项目的所有节点（一次查询），父节点在前，同级按order排序"""
+    return flatten_subtree(load_subtree(project_id), project_id)
\ No newline at end of file
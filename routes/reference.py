@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify, session, redirect, url_for
+from reference_data import user_options, sprint_options, project_options, filter_options
+from story_lookup import lookup_stories
+
+reference_bp = Blueprint('reference', __name__)
+
+@reference_bp.before_request
+def check_access():
+    # 确保用户已登录
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+
+
+# 类型 -> 返回缓存列表的函数
+REFERENCE_LISTS = {
+    'users': user_options,
+    'sprints': lambda: sprint_options(request.args.get('project_id', type=int)),
+    'projects': project_options,
+}
+
+
+@reference_bp.route('/api/reference/<list_name>')
+def api_reference(list_name):
+    """
+    下拉框的按需检索（typeahead）
+    参数：q 名称关键词；limit 返回条数；迭代可按 project_id 过滤
+    """
+    loader = REFERENCE_LISTS.get(list_name)
+    if loader is None:
+        return jsonify({'success': False, 'message': '未知的参考数据类型'})
+
+    options = filter_options(loader(), request.args.get('q', '', type=str), request.args.get('limit', 20, type=int))
+    return jsonify({'success': True, 'options': [{'id': option.id, 'name': option.name} for option in options]})
+
+
+@reference_bp.route('/api/reference/stories')
+def api_reference_stories():
+    """
+    用户故事选择器的分页检索，最新的在前
+    参数：q 编号前缀或标题/描述关键词；project_id 项目；sprint_id 迭代；unassigned=1 只返回未加入迭代的故事；
+    cursor 上一次返回的 next_cursor；per_page 每页条数
+    """
+    stories, next_cursor = lookup_stories(
+        keyword=request.args.get('q', '', type=str).strip(),
+        project_id=request.args.get('project_id', type=int),
+        sprint_id=request.args.get('sprint_id', type=int),
+        unassigned=request.args.get('unassigned', type=int) == 1,
+        cursor=request.args.get('cursor', type=str),
+        per_page=request.args.get('per_page', 20, type=int)
+    )
+    return jsonify({
+        'success': True,
+        'options': [dict(story._asdict(), name=f"{story.story_id or '未分配ID'} - {story.title}") for story in stories],
+        'next_cursor': next_cursor
+    })
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models import db, Role, SystemFeature, RoleSystemFeature
-from utils import check_system_feature_access, check_user_role
-from decorators import check_access_blueprint
+from utils import check_system_feature_access, check_user_role, invalidate_permission_cache
+from decorators import check_access_blueprint, self_checked
 
 roles_bp = Blueprint('roles', __name__)
 
@@ -12,6 +12,7 @@ def check_access():
     pass  # 装饰器会处理权限检查逻辑
 
 @roles_bp.route('/roles')
+@self_checked('roles.roles')
 def roles():
     # 检查权限
     if not check_system_feature_access(session, 'roles.roles'):
@@ -69,6 +70,7 @@ def add_role():
             db.session.add(role_feature)
 
         db.session.commit()
+        invalidate_permission_cache()
         return jsonify({'success': True, 'message': '角色添加成功'})
     except Exception as e:
         db.session.rollback()
@@ -118,6 +120,7 @@ def edit_role(role_id):
             db.session.add(role_feature)
 
         db.session.commit()
+        invalidate_permission_cache()
         return jsonify({'success': True, 'message': '角色更新成功'})
     except Exception as e:
         db.session.rollback()
@@ -148,6 +151,7 @@ def delete_role(role_id):
         # 删除角色
         db.session.delete(role)
         db.session.commit()
+        invalidate_permission_cache()
         return jsonify({'success': True, 'message': '角色删除成功'})
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,30 @@
+from flask import Blueprint, request, jsonify, session, redirect, url_for
+from utils import check_system_feature_access
+from search import SEARCH_TARGETS, search_all
+
+search_bp = Blueprint('search', __name__)
+
+@search_bp.before_request
+def check_access():
+    # 确保用户已登录
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+
+
+@search_bp.route('/api/search')
+def api_search():
+    """
+    跨实体全文搜索，结果按相关度排序
+    参数：q 关键词；types 逗号分隔的实体类型（defect,test_case,user_story,product_backlog,knowledge），默认全部；limit 返回条数
+    只搜索当前用户有权限访问的实体
+    """
+    keyword = request.args.get('q', '', type=str).strip()
+    if not keyword:
+        return jsonify({'success': False, 'message': '请输入搜索关键词'})
+
+    types = [name for name in request.args.get('types', '', type=str).split(',') if name]
+    targets = [target for name, target in SEARCH_TARGETS.items()
+               if (not types or name in types) and check_system_feature_access(session, target.feature_key)]
+
+    results = search_all(keyword, targets, request.args.get('limit', 20, type=int))
+    return jsonify({'success': True, 'results': results, 'count': len(results)})
@@ -1,9 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from datetime import datetime
-from sqlalchemy import or_
-from models import db, User, Sprint, SprintBacklog, UserStory, SystemFeature, ProjectInfo
+from models import db, Sprint, SprintBacklog, UserStory, SystemFeature
 from utils import check_system_feature_access, check_user_role
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
+from burndown import refresh_sprint_burndown, compute_sprints_analytics
+from reference_data import user_options, project_options
+from loader_profiles import SPRINT_LIST, SPRINT_DETAIL
 
 sprints_bp = Blueprint('sprints', __name__)
 
@@ -19,16 +21,16 @@ def check_access():
 
 @sprints_bp.route('/sprints')
 def sprints():
-    # 按状态分组获取迭代
-    active_sprints = Sprint.query.filter_by(status='进行中').all()
-    upcoming_sprints = Sprint.query.filter_by(status='未开始').all()
-    completed_sprints = Sprint.query.filter_by(status='已完成').all()
+    # 按状态分组获取迭代，模板用到的项目、产品负责人、Scrum Master 一并加载
+    active_sprints = Sprint.query.options(*SPRINT_LIST).filter_by(status='进行中').all()
+    upcoming_sprints = Sprint.query.options(*SPRINT_LIST).filter_by(status='未开始').all()
+    completed_sprints = Sprint.query.options(*SPRINT_LIST).filter_by(status='已完成').all()
 
     # 获取所有用户用于下拉选择
-    users = User.query.all()
+    users = user_options()
 
     # 获取所有项目用于下拉选择
-    projects = ProjectInfo.query.filter_by(parent_id=None).all()
+    projects = project_options()
 
     return render_template('sprints.html',
                            active_sprints=active_sprints,
@@ -39,6 +41,7 @@ def sprints():
 
 
 @sprints_bp.route('/sprint/add', methods=['POST'])
+@self_checked('sprints.sprints')
 def add_sprint():
     # 检查权限
     if not check_system_feature_access(session, 'sprints.sprints'):
@@ -53,10 +56,15 @@ def add_sprint():
     scrum_master_id = request.form.get('scrum_master_id')
 
     if name and start_date and end_date:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        if end_date < start_date:
+            flash('结束日期不能早于开始日期！', 'error')
+            return redirect(url_for('sprints.sprints'))
         sprint = Sprint(
             name=name,
-            start_date=datetime.strptime(start_date, '%Y-%m-%d').date(),
-            end_date=datetime.strptime(end_date, '%Y-%m-%d').date(),
+            start_date=start_date,
+            end_date=end_date,
             team=team if team else None,
             product_owner_id=int(product_owner_id) if product_owner_id else None,
             scrum_master_id=int(scrum_master_id) if scrum_master_id else None,
@@ -72,6 +80,7 @@ def add_sprint():
 
 
 @sprints_bp.route('/sprint/edit', methods=['POST'])
+@self_checked('sprints.sprints')
 def edit_sprint():
     # 检查权限
     if not check_system_feature_access(session, 'sprints.sprints'):
@@ -90,14 +99,20 @@ def edit_sprint():
         project_id = request.form.get('project_id')
 
         if name and start_date and end_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            if end_date < start_date:
+                flash('结束日期不能早于开始日期！', 'error')
+                return redirect(url_for('sprints.sprints'))
             sprint.name = name
-            sprint.start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-            sprint.end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            sprint.start_date = start_date
+            sprint.end_date = end_date
             sprint.team = team if team else None
             sprint.product_owner_id = int(product_owner_id) if product_owner_id else None
             sprint.scrum_master_id = int(scrum_master_id) if scrum_master_id else None
             sprint.project_id = int(project_id) if project_id else None
 
+            refresh_sprint_burndown(sprint.id)
             db.session.commit()
             flash('迭代更新成功！', 'success')
         else:
@@ -107,12 +122,14 @@ def edit_sprint():
 
 
 @sprints_bp.route('/sprint/<int:sprint_id>')
+@self_checked('sprints.sprints')
 def sprint_detail(sprint_id):
     # 检查权限
     if not check_system_feature_access(session, 'sprints.sprints'):
         return redirect(url_for('auth.index'))
 
-    sprint = db.session.get(Sprint, sprint_id)
+    # 迭代待办及其用户故事、负责人一并加载
+    sprint = db.session.get(Sprint, sprint_id, options=SPRINT_DETAIL)
     if not sprint:
         flash('迭代不存在！', 'error')
         return redirect(url_for('sprints.sprints'))
@@ -128,32 +145,9 @@ def sprint_detail(sprint_id):
     total_story_points = sum(b.story_points or 0 for b in sprint.sprint_backlogs)
 
     # 获取所有用户用于下拉选择
-    users = User.query.all()
-
-    # 获取可以添加到迭代的用户故事（未分配到任何迭代的）
-    available_stories = UserStory.query.filter(
-        or_(UserStory.sprint_backlogs == None,
-            ~UserStory.sprint_backlogs.any())
-    ).all()
-
-    # 为每个用户故事添加项目路径信息
-    for story in available_stories:
-        # 通过产品待办列表获取项目路径信息
-        if story.product_backlog and story.product_backlog.project_module and story.product_backlog.project_module.path:
-            # 从路径中提取项目、菜单、页面信息
-            path_parts = story.product_backlog.project_module.path.split('/')
-            if len(path_parts) >= 3:
-                # 格式: /项目/菜单/页面 -> 项目-菜单-页面
-                story.project_path = ' - '.join(path_parts[1:])
-            else:
-                story.project_path = story.product_backlog.project_module.path.lstrip('/')
-        elif story.product_backlog and story.product_backlog.project:
-            # 如果没有功能模块，至少显示项目信息
-            story.project_path = story.product_backlog.project.name
-        else:
-            story.project_path = '未指定'
-
+    users = user_options()
 
+    # 可以添加到迭代的用户故事（未分配到任何迭代的）由页面通过 /api/reference/stories 分页加载
     return render_template('sprint_detail.html',
                            sprint=sprint,
                            todo_backlogs=todo_backlogs,
@@ -162,11 +156,11 @@ def sprint_detail(sprint_id):
                            done_backlogs=done_backlogs,
                            completed_count=completed_count,
                            total_story_points=total_story_points,
-                           users=users,
-                           available_stories=available_stories)
+                           users=users)
 
 
 @sprints_bp.route('/sprint/<int:sprint_id>/add', methods=['POST'])
+@self_checked('sprints.sprints')
 def add_to_sprint(sprint_id):
     # 检查权限
     if not check_system_feature_access(session, 'sprints.sprints'):
@@ -197,6 +191,7 @@ def add_to_sprint(sprint_id):
                 )
                 db.session.add(backlog)
 
+    refresh_sprint_burndown(sprint_id)
     db.session.commit()
     flash(f'成功添加 {len(user_story_ids)} 个用户故事到迭代！', 'success')
 
@@ -204,6 +199,7 @@ def add_to_sprint(sprint_id):
 
 
 @sprints_bp.route('/sprint/backlog/edit', methods=['POST'])
+@self_checked('sprints.sprints')
 def edit_sprint_backlog():
     # 检查权限
     if not check_system_feature_access(session, 'sprints.sprints'):
@@ -223,6 +219,7 @@ def edit_sprint_backlog():
         backlog.priority = priority
         backlog.assignee_id = int(assignee_id) if assignee_id else None
 
+        refresh_sprint_burndown(backlog.sprint_id)
         db.session.commit()
         flash('待办事项更新成功！', 'success')
 
@@ -230,6 +227,7 @@ def edit_sprint_backlog():
 
 
 @sprints_bp.route('/sprint/<int:sprint_id>/start', methods=['POST'])
+@self_checked('sprints.sprints')
 def start_sprint(sprint_id):
     """开始迭代"""
     # 检查权限
@@ -254,6 +252,7 @@ def start_sprint(sprint_id):
 
 
 @sprints_bp.route('/sprint/<int:sprint_id>/complete', methods=['POST'])
+@self_checked('sprints.sprints')
 def complete_sprint(sprint_id):
     """完成迭代"""
     # 检查权限
@@ -278,6 +277,7 @@ def complete_sprint(sprint_id):
 
 
 @sprints_bp.route('/sprint/backlog/<int:backlog_id>/remove', methods=['POST'])
+@self_checked('sprints.sprints')
 def remove_from_sprint(backlog_id):
     """从迭代中移除用户故事"""
     # 检查权限
@@ -289,9 +289,52 @@ def remove_from_sprint(backlog_id):
         return jsonify({'success': False, 'message': '待办事项不存在'})
 
     try:
+        sprint_id = backlog.sprint_id
         db.session.delete(backlog)
+        refresh_sprint_burndown(sprint_id)
         db.session.commit()
         return jsonify({'success': True, 'message': '已从迭代中移除用户故事'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': '操作失败: ' + str(e)})
+
+
+@sprints_bp.route('/sprints/analytics')
+@self_checked('sprints.sprints')
+def sprints_analytics():
+    """
+    多迭代燃尽图与速率统计（JSON）
+    参数 sprint_ids 为逗号分隔的迭代ID；不传时按 status（默认已完成）取最近 limit 个迭代
+    """
+    # 检查权限
+    if not check_system_feature_access(session, 'sprints.sprints'):
+        return jsonify({'success': False, 'message': '权限不足'})
+
+    try:
+        sprint_ids = [int(sprint_id) for sprint_id in request.args.get('sprint_ids', '').split(',') if sprint_id.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'message': '迭代ID格式错误'})
+
+    query = Sprint.query
+    if sprint_ids:
+        query = query.filter(Sprint.id.in_(sprint_ids))
+    else:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        query = query.filter_by(status=request.args.get('status', '已完成')).order_by(
+            Sprint.start_date.desc()
+        ).limit(limit)
+    sprints = sorted(query.all(), key=lambda sprint: (sprint.start_date is None,
+                                                  sprint.start_date.toordinal() if sprint.start_date else 0,
+                                                  sprint.id))
+
+    try:
+        sprints_data = compute_sprints_analytics(sprints)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'统计失败: {str(e)}'})
+
+    velocities = [item['completed_points'] for item in sprints_data]
+    return jsonify({
+        'success': True,
+        'sprints': sprints_data,
+        'average_velocity': round(sum(velocities) / len(velocities), 2) if velocities else 0
+    })
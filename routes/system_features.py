@@ -1,7 +1,7 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models import db, SystemFeature
-from utils import check_system_feature_access
-from decorators import check_access_blueprint
+from utils import check_system_feature_access, invalidate_permission_cache
+from decorators import check_access_blueprint, self_checked, get_endpoint_access_table
 
 system_features_bp = Blueprint('system_features', __name__)
 
@@ -12,6 +12,7 @@ def check_access():
     pass  # 装饰器会处理权限检查逻辑
 
 @system_features_bp.route('/system_features')
+@self_checked('system_features.system_features')
 def system_features():
     # 检查权限
     if not check_system_feature_access(session, 'system_features.system_features'):
@@ -103,6 +104,7 @@ def init_system_features():
         db.session.add(feature)
     
     db.session.commit()
+    invalidate_permission_cache()
     flash('系统功能初始化成功！', 'success')
     return redirect(url_for('system_features.system_features'))
 
@@ -142,7 +144,23 @@ def update_system_features():
                 feature.is_public = request.form[is_public_key] == 'on'
 
     db.session.commit()
+    invalidate_permission_cache()
     flash('系统功能更新成功！', 'success')
     return redirect(url_for('system_features.system_features'))
 
 
+@system_features_bp.route('/system_features/endpoint_mapping')
+def endpoint_mapping():
+    """诊断接口：列出各端点对应的系统功能，以及没有功能映射的端点"""
+    # 检查权限
+    if not check_system_feature_access(session, 'system_features.system_features'):
+        return jsonify({'success': False, 'message': '权限不足'})
+
+    table = get_endpoint_access_table()
+    table.refresh_features()
+
+    return jsonify({
+        'success': True,
+        'endpoints': {endpoint: rule._asdict() for endpoint, rule in sorted(table.rules.items())},
+        'unmapped_endpoints': table.unmapped_endpoints()
+    })
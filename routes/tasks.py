@@ -1,72 +1,23 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from models import db, Task, UserStory, User, Sprint, SprintBacklog, ProjectInfo
+from models import db, Task, UserStory, Sprint, SprintBacklog, ProjectInfo
 from utils import check_system_feature_access
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
+from burndown import refresh_story_burndown
+from sequences import allocate_code, observe_code, task_sequence
+from reference_data import user_options, sprint_options
 from datetime import datetime, timedelta
 from sqlalchemy import or_
-import re
 
 tasks_bp = Blueprint('tasks', __name__)
 
-def generate_task_id(story_id):
+def generate_task_id(user_story):
     """
     生成任务编号
     规则：TA_[故事编号]_[3位序号]
-    例如：如果故事是US_001_001，则任务编号为TA_US_001_001_001
+    例如：如果故事是US_001_001，则任务编号为TA_US_001_001_001；故事编号不是 US_ 格式时为 TA_[3位序号]
+    从编号序列原子分配，需在同一事务中提交
     """
-    # 从故事编号中提取序号部分
-    if story_id and story_id.startswith('US_'):
-        # 查询当前故事下最大的任务序号
-        story = UserStory.query.filter_by(story_id=story_id).first() if story_id else None
-        if story:
-            tasks = Task.query.filter_by(user_story_id=story.id).all()
-            if tasks:
-                max_seq = 0
-                for task in tasks:
-                    if task.task_id and task.task_id.startswith(f"TA_{story_id}_"):
-                        try:
-                            # 提取序号部分（最后3位）
-                            seq_part = task.task_id.split('_')[-1]
-                            seq = int(seq_part)
-                            if seq > max_seq:
-                                max_seq = seq
-                        except (IndexError, ValueError):
-                            pass
-                next_seq = max_seq + 1
-            else:
-                next_seq = 1
-        else:
-            next_seq = 1
-
-        # 序号保持3位长度，不够前面补零
-        seq_part = str(next_seq).zfill(3)
-        task_id = f"TA_{story_id}_{seq_part}"
-        return task_id
-
-    # 如果无法从故事编号中提取，则使用默认方式
-    # 查询当前故事下最大的任务序号
-    story = UserStory.query.filter_by(story_id=story_id).first() if story_id else None
-    if story:
-        tasks = Task.query.filter_by(user_story_id=story.id).all()
-        if tasks:
-            max_seq = 0
-            for task in tasks:
-                if task.task_id and re.match(r'^TA_\d+$', task.task_id):
-                    try:
-                        seq = int(task.task_id.split('_')[-1])  # 获取最后的序号部分
-                        if seq > max_seq:
-                            max_seq = seq
-                    except ValueError:
-                        pass
-            next_seq = max_seq + 1
-        else:
-            next_seq = 1
-    else:
-        next_seq = 1
-
-    # 生成任务编号
-    task_id = f"TA_{next_seq:03d}"
-    return task_id
+    return allocate_code(task_sequence(user_story))
 
 
 # 应用权限检查装饰器
@@ -83,20 +34,22 @@ def check_access():
     pass  # 其他路由由装饰器处理权限检查逻辑
 
 @tasks_bp.route('/tasks')
+@self_checked('tasks.tasks')
 def tasks():
     # 检查权限
     if not check_system_feature_access(session, 'tasks.tasks'):
         return redirect(url_for('auth.index'))
     
     # 获取所有迭代
-    sprints = Sprint.query.order_by(Sprint.start_date.desc()).all()
+    sprints = sprint_options()
 
     # 获取所有用户用于任务分配
-    users = User.query.all()
+    users = user_options()
     
     return render_template('tasks.html', sprints=sprints, users=users)
 
 @tasks_bp.route('/get_stories_by_sprint/<int:sprint_id>')
+@self_checked('tasks.tasks')
 def get_stories_by_sprint(sprint_id):
     """根据迭代ID获取关联的用户故事"""
     # 检查权限
@@ -184,6 +137,7 @@ def get_stories_by_sprint(sprint_id):
     })
 
 @tasks_bp.route('/get_tasks_by_story/<int:story_id>')
+@self_checked('tasks.tasks')
 def get_tasks_by_story(story_id):
     """根据用户故事ID获取关联的任务"""
     # 检查权限
@@ -199,7 +153,7 @@ def get_tasks_by_story(story_id):
     tasks = Task.query.filter_by(user_story_id=story_id).order_by(Task.created_at.desc()).all()
     
     # 获取所有用户，用于显示负责人信息
-    users = User.query.all()
+    users = user_options()
     users_dict = {user.id: user for user in users}
     
     # 转换任务为字典格式
@@ -231,6 +185,7 @@ def get_tasks_by_story(story_id):
     })
 
 @tasks_bp.route('/add_task/<int:story_id>', methods=['POST'])
+@self_checked('tasks.tasks')
 def add_task(story_id):
     """为用户故事添加任务"""
     # 检查权限
@@ -266,7 +221,9 @@ def add_task(story_id):
     try:
         # 如果用户没有提供任务编号，则自动生成
         if not task_id:
-            task_id = generate_task_id(user_story.story_id)
+            task_id = generate_task_id(user_story)
+        else:
+            observe_code(task_sequence(user_story), task_id)
         
         # 创建任务
         task = Task(
@@ -289,6 +246,7 @@ def add_task(story_id):
                 pass
         
         db.session.add(task)
+        refresh_story_burndown(task.user_story_id)
         db.session.commit()
         
         return jsonify({'success': True, 'message': '任务添加成功'})
@@ -298,6 +256,7 @@ def add_task(story_id):
         return jsonify({'success': False, 'message': f'添加任务失败: {str(e)}'})
 
 @tasks_bp.route('/edit_task/<int:task_id>', methods=['POST'])
+@self_checked('tasks.tasks')
 def edit_task(task_id):
     """编辑任务"""
     # 检查权限
@@ -398,7 +357,11 @@ def edit_task(task_id):
                     task.assignee_id = None
             else:
                 task.assignee_id = None
-        
+
+        # 状态变化会影响燃尽图
+        if 'status' in request.form and task.status != old_status:
+            refresh_story_burndown(task.user_story_id)
+
         db.session.commit()
         
         return jsonify({'success': True, 'message': '任务更新成功'})
@@ -408,6 +371,7 @@ def edit_task(task_id):
         return jsonify({'success': False, 'message': f'更新任务失败: {str(e)}'})
 
 @tasks_bp.route('/delete_task/<int:task_id>', methods=['POST'])
+@self_checked('tasks.tasks')
 def delete_task(task_id):
     """删除任务"""
     # 检查权限
@@ -420,7 +384,9 @@ def delete_task(task_id):
         return jsonify({'success': False, 'message': '任务不存在'})
     
     try:
+        story_id = task.user_story_id
         db.session.delete(task)
+        refresh_story_burndown(story_id)
         db.session.commit()
         return jsonify({'success': True, 'message': '任务删除成功'})
     
@@ -1,12 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, send_file
-from sqlalchemy import or_
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from sqlalchemy import select, union
 from models import db, TestCase, User, ProjectInfo, Sprint, UserStory, SprintBacklog, ProductBacklog
 from utils import check_system_feature_access
-from decorators import check_access_blueprint
+from decorators import check_access_blueprint, self_checked
+from sequences import allocate_code, case_sequence
+from importers import import_test_cases as import_test_cases_from_excel
+from exporters import ExportColumn, export_response, format_date, format_datetime
+from sqlalchemy.orm import aliased
+from werkzeug.datastructures import MultiDict
+from jobs import background_jobs, job_handler, run_export_job
+from search import text_filter
+from pagination import keyset_paginate
+from loader_profiles import TEST_CASE_LIST
+from reference_data import project_options, sprint_options
 from datetime import datetime
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Alignment
-from io import BytesIO
 
 test_cases_bp = Blueprint('test_cases', __name__)
 
@@ -16,42 +23,18 @@ test_cases_bp = Blueprint('test_cases', __name__)
 def check_access():
     pass  # 装饰器会处理权限检查逻辑
 
-def generate_case_id(project_short_name, user_story_id):
+def generate_case_id(project_short_name, story_code):
     """
     生成测试用例编号
-    规则：项目简称-用户故事ID-001，如：TIM-001-001
+    规则：项目简称-用户故事编号-001，如：TIM-US_001_001-001
+    按编号前缀从编号序列原子分配，需在同一事务中提交
     """
-    if not project_short_name or not user_story_id:
+    if not project_short_name or not story_code:
         return None
-
-    # 查询当前用户故事下最大的测试用例序号
-    cases = TestCase.query.filter_by(user_story_id=user_story_id).all()
-
-    if cases:
-        # 查找最大的序号并加1
-        max_seq = 0
-        for case in cases:
-            if case.case_id and case.case_id.startswith(f"{project_short_name}-{user_story_id}-"):
-                try:
-                    seq = int(case.case_id.split('-')[2])
-                    if seq > max_seq:
-                        max_seq = seq
-                except (IndexError, ValueError):
-                    # 如果解析失败，跳过该用例
-                    pass
-        next_seq = max_seq + 1
-    else:
-        # 如果当前用户故事下没有测试用例，默认值为1
-        next_seq = 1
-
-    # 序号保持3位长度，不够前面补零
-    seq_part = str(next_seq).zfill(3)
-
-    # 拼接生成用例编号
-    case_id = f"{project_short_name}-{user_story_id}-{seq_part}"
-    return case_id
+    return allocate_code(case_sequence(project_short_name, story_code))
 
 @test_cases_bp.route('/test_cases')
+@self_checked('test_cases.test_cases')
 def test_cases():
     """测试用例列表页面"""
     # 检查权限
@@ -60,22 +43,23 @@ def test_cases():
 
     # 获取查询参数
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', type=str)
     per_page = 10
     search = request.args.get('search', '', type=str)
     project_id = request.args.get('project_id', 0, type=int)
     sprint_id = request.args.get('sprint_id', 0, type=int)
 
-    # 构建查询
-    query = TestCase.query
+    # 构建查询，模板用到的项目、迭代、用户故事一并加载
+    query = TestCase.query.options(*TEST_CASE_LIST)
 
     # 搜索条件
     if search:
-        query = query.filter(
-            or_(
-                TestCase.case_id.contains(search),
-                TestCase.title.contains(search)
-            )
+        # 用例编号按前缀匹配（走唯一索引），标题、步骤、预期结果走全文索引，两者的结果合并
+        matched_ids = union(
+            select(TestCase.id).where(text_filter((TestCase.title, TestCase.steps, TestCase.expected_result), search)[0]),
+            select(TestCase.id).where(TestCase.case_id.startswith(search, autoescape=True))
         )
+        query = query.filter(TestCase.id.in_(matched_ids))
 
     # 项目筛选
     if project_id:
@@ -85,14 +69,13 @@ def test_cases():
     if sprint_id:
         query = query.filter(TestCase.sprint_id == sprint_id)
 
-    # 分页查询
-    pagination = query.order_by(TestCase.case_id).paginate(
-        page=page, per_page=per_page, error_out=False)
+    # 按 (用例编号, id) 游标分页
+    pagination = keyset_paginate(query, TestCase.case_id, TestCase.id, cursor=cursor, page=page, per_page=per_page)
     test_cases = pagination.items
 
     # 获取项目和迭代列表用于筛选
-    projects = ProjectInfo.query.filter_by(parent_id=None).all()
-    sprints = Sprint.query.all()
+    projects = project_options()
+    sprints = sprint_options()
 
     return render_template('test_cases.html',
                           test_cases=test_cases,
@@ -104,6 +87,7 @@ def test_cases():
                           sprint_id=sprint_id)
 
 @test_cases_bp.route('/test_cases/add', methods=['GET', 'POST'])
+@self_checked('test_cases.test_cases')
 def add_test_case():
     """添加测试用例"""
     # 检查权限
@@ -168,19 +152,16 @@ def add_test_case():
             flash('添加测试用例失败，请重试！', 'error')
 
     # GET请求，显示添加页面
-    projects = ProjectInfo.query.filter_by(parent_id=None).all()
-    sprints = Sprint.query.all()
-    user_stories = UserStory.query.all()
-    users = User.query.all()
+    projects = project_options()
+    sprints = sprint_options()
 
     return render_template('test_case_form.html',
                           action='add',
                           projects=projects,
-                          sprints=sprints,
-                          user_stories=user_stories,
-                          users=users)
+                          sprints=sprints)
 
 @test_cases_bp.route('/test_cases/edit/<int:case_id>', methods=['GET', 'POST'])
+@self_checked('test_cases.test_cases')
 def edit_test_case(case_id):
     """编辑测试用例"""
     # 检查权限
@@ -251,20 +232,17 @@ def edit_test_case(case_id):
             flash('更新测试用例失败，请重试！', 'error')
 
     # GET请求，显示编辑页面
-    projects = ProjectInfo.query.filter_by(parent_id=None).all()
-    sprints = Sprint.query.all()
-    user_stories = UserStory.query.all()
-    users = User.query.all()
+    projects = project_options()
+    sprints = sprint_options()
 
     return render_template('test_case_form.html',
                           action='edit',
                           test_case=test_case,
                           projects=projects,
-                          sprints=sprints,
-                          user_stories=user_stories,
-                          users=users)
+                          sprints=sprints)
 
 @test_cases_bp.route('/test_cases/delete/<int:case_id>', methods=['POST'])
+@self_checked('test_cases.test_cases')
 def delete_test_case(case_id):
     """删除测试用例"""
     # 检查权限
@@ -283,6 +261,7 @@ def delete_test_case(case_id):
         return jsonify({'success': False, 'message': '删除测试用例失败，请重试！'})
 
 @test_cases_bp.route('/test_cases/get_sprints')
+@self_checked('test_cases.test_cases')
 def get_sprints():
     """根据项目ID获取迭代"""
     # 检查权限
@@ -308,6 +287,7 @@ def get_sprints():
 
 
 @test_cases_bp.route('/test_cases/get_sprints_by_project')
+@self_checked('test_cases.test_cases')
 def get_sprints_by_project():
     """根据项目ID获取迭代"""
     # 检查权限
@@ -341,6 +321,7 @@ def get_sprints_by_project():
 
 
 @test_cases_bp.route('/test_cases/get_user_stories_by_sprint')
+@self_checked('test_cases.test_cases')
 def get_user_stories_by_sprint():
     """根据迭代ID获取用户故事"""
     # 检查权限
@@ -378,6 +359,7 @@ def get_user_stories_by_sprint():
 
 
 @test_cases_bp.route('/test_cases/get_user_stories')
+@self_checked('test_cases.test_cases')
 def get_user_stories():
     """根据项目ID获取用户故事"""
     # 检查权限
@@ -408,16 +390,11 @@ def get_user_stories():
 
     return jsonify({'success': True, 'user_stories': stories_data})
 
-@test_cases_bp.route('/test_cases/export')
-def export_test_cases():
-    """导出测试用例到Excel文件"""
-    # 检查权限
-    if not check_system_feature_access(session, 'test_cases.test_cases'):
-        return redirect(url_for('auth.index'))
-
+def build_test_cases_export(args):
+    """测试用例导出的查询和列定义，args 为请求参数"""
     # 获取查询参数
-    project_id = request.args.get('project_id', 0, type=int)
-    sprint_id = request.args.get('sprint_id', 0, type=int)
+    project_id = args.get('project_id', 0, type=int)
+    sprint_id = args.get('sprint_id', 0, type=int)
 
     # 构建查询
     query = TestCase.query
@@ -430,9 +407,6 @@ def export_test_cases():
     if sprint_id:
         query = query.filter(TestCase.sprint_id == sprint_id)
 
-    # 获取测试用例数据
-    test_cases = query.order_by(TestCase.created_at.desc()).all()
-
     # 获取项目和迭代信息
     project_name = ""
     sprint_name = ""
@@ -447,96 +421,89 @@ def export_test_cases():
         if sprint:
             sprint_name = sprint.name
 
-    # 创建工作簿和工作表
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "测试用例"
-
-    # 设置标题行样式
-    header_font = Font(bold=True)
-    header_alignment = Alignment(horizontal="center", vertical="center")
-
-    # 写入标题行
-    headers = [
-        '用例编号', '用例编辑状态', '所属项目', '项目模块', '所属迭代', '用户故事',
-        '用例标题', '测试用例类型', '具体功能点', '预置条件', '测试步骤', '预期结果',
-        '优先级', '是否自动化（是/否）', '编写人', '编写时间', '测试人', '测试环境',
-        '测试时间', '用例执行状态', '测试结果','实际结果', '备注'
+    # 关联名称通过外连接一次查出，避免逐行加载关联对象
+    created_by, tested_by = aliased(User), aliased(User)
+    query = query.outerjoin(ProjectInfo, ProjectInfo.id == TestCase.project_id) \
+        .outerjoin(Sprint, Sprint.id == TestCase.sprint_id) \
+        .outerjoin(UserStory, UserStory.id == TestCase.user_story_id) \
+        .outerjoin(created_by, created_by.id == TestCase.created_by_id) \
+        .outerjoin(tested_by, tested_by.id == TestCase.tested_by_id) \
+        .add_columns(ProjectInfo.name.label('project_name'), Sprint.name.label('sprint_name'),
+                     UserStory.title.label('user_story_title'), created_by.name.label('created_by_name'),
+                     tested_by.name.label('tested_by_name')) \
+        .order_by(TestCase.created_at.desc())
+
+    columns = [
+        ExportColumn('用例编号', lambda row: row.TestCase.case_id or ''),
+        ExportColumn('用例编辑状态', lambda row: row.TestCase.edit_status or ''),
+        ExportColumn('所属项目', lambda row: row.project_name or ''),
+        ExportColumn('项目模块', lambda row: row.TestCase.project_module or ''),
+        ExportColumn('所属迭代', lambda row: row.sprint_name or ''),
+        ExportColumn('用户故事', lambda row: row.user_story_title or ''),
+        ExportColumn('用例标题', lambda row: row.TestCase.title or ''),
+        ExportColumn('测试用例类型', lambda row: row.TestCase.case_type or ''),
+        ExportColumn('具体功能点', lambda row: row.TestCase.function_point or ''),
+        ExportColumn('预置条件', lambda row: row.TestCase.precondition or ''),
+        ExportColumn('测试步骤', lambda row: row.TestCase.steps or ''),
+        ExportColumn('预期结果', lambda row: row.TestCase.expected_result or ''),
+        ExportColumn('优先级', lambda row: row.TestCase.priority or ''),
+        ExportColumn('是否自动化（是/否）', lambda row: '是' if row.TestCase.is_automated else '否'),
+        ExportColumn('编写人', lambda row: row.created_by_name or ''),
+        ExportColumn('编写时间', lambda row: format_datetime(row.TestCase.created_at)),
+        ExportColumn('测试人', lambda row: row.tested_by_name or ''),
+        ExportColumn('测试环境', lambda row: row.TestCase.test_environment or ''),
+        ExportColumn('测试时间', lambda row: format_date(row.TestCase.tested_at)),
+        ExportColumn('用例执行状态', lambda row: row.TestCase.execution_status or ''),
+        ExportColumn('测试结果', lambda row: row.TestCase.test_result or ''),
+        ExportColumn('实际结果', lambda row: row.TestCase.actual_result or ''),
+        ExportColumn('备注', lambda row: row.TestCase.remarks or '')
     ]
 
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-        # 写入数据行
-        for row, case in enumerate(test_cases, 2):
-            # 获取关联信息
-            project_name = case.project.name if case.project else ''
-            sprint_name = case.sprint.name if case.sprint else ''
-            user_story_title = case.user_story.title if case.user_story else ''
-            created_by_name = case.created_by.name if case.created_by else ''
-            tested_by_name = case.tested_by.name if case.tested_by else ''
-
-            ws.cell(row=row, column=1, value=case.case_id or '')
-            ws.cell(row=row, column=2, value=case.edit_status or '')
-            ws.cell(row=row, column=3, value=project_name)
-            ws.cell(row=row, column=4, value=case.project_module or '')
-            ws.cell(row=row, column=5, value=sprint_name)
-            ws.cell(row=row, column=6, value=user_story_title)
-            ws.cell(row=row, column=7, value=case.title or '')
-            ws.cell(row=row, column=8, value=case.case_type or '')
-            ws.cell(row=row, column=9, value=case.function_point or '')
-            ws.cell(row=row, column=10, value=case.precondition or '')
-            ws.cell(row=row, column=11, value=case.steps or '')
-            ws.cell(row=row, column=12, value=case.expected_result or '')
-            ws.cell(row=row, column=13, value=case.priority or '')
-            ws.cell(row=row, column=14, value='是' if case.is_automated else '否')
-            ws.cell(row=row, column=15, value=created_by_name)
-            ws.cell(row=row, column=16, value=case.created_at.strftime('%Y-%m-%d %H:%M:%S') if case.created_at else '')
-            ws.cell(row=row, column=17, value=tested_by_name)
-            ws.cell(row=row, column=18, value=case.test_environment or '')
-            ws.cell(row=row, column=19, value=case.tested_at.strftime('%Y-%m-%d') if case.tested_at else '')
-            ws.cell(row=row, column=20, value=case.execution_status or '')
-            ws.cell(row=row, column=21, value=case.test_result or '')
-            ws.cell(row=row, column=22, value=case.actual_result or '')
-            ws.cell(row=row, column=23, value=case.remarks or '')
-
-    # 调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column_letter].width = min(adjusted_width, 50)
-
-    # 将工作簿保存到内存中
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
     # 生成文件名
     filename_parts = ["测试用例"]
     if project_name:
         filename_parts.append(project_name)
     if sprint_name:
         filename_parts.append(sprint_name)
-    filename = "_".join(filename_parts) + ".xlsx"
+    filename = "_".join(filename_parts)
+
+    return query, columns, filename, '测试用例'
+
+
+@job_handler('test_cases.export')
+def run_test_cases_export_job(job, params, progress):
+    return run_export_job(job, build_test_cases_export(MultiDict(params)), params.get('format', 'xlsx'))
+
+
+@test_cases_bp.route('/test_cases/export')
+@self_checked('test_cases.test_cases')
+def export_test_cases():
+    """导出测试用例到Excel文件"""
+    # 检查权限
+    if not check_system_feature_access(session, 'test_cases.test_cases'):
+        return redirect(url_for('auth.index'))
+
+    # 数据量大时提交后台任务，完成后在任务页面下载
+    if request.args.get('background'):
+        job = background_jobs.enqueue('test_cases.export', session['user_id'], params=request.args.to_dict())
+        return redirect(url_for('jobs.job_detail', job_id=job.id))
+
+    query, columns, filename, sheet_title = build_test_cases_export(request.args)
+    return export_response(query, columns, filename, sheet_title, request.args.get('format', 'xlsx'))
+
+@job_handler('test_cases.import')
+def run_test_cases_import_job(job, params, progress):
+    def on_progress(committed_row, total_rows):
+        if total_rows:
+            progress(committed_row * 100 // total_rows, f'已提交到第{committed_row}行，共{total_rows}行')
+
+    report = import_test_cases_from_excel(job.input_path, job.user_id, start_row=params.get('start_row', 2),
+                                          on_progress=on_progress)
+    return report.to_dict()
 
-    # 返回Excel文件作为附件下载
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
 
 @test_cases_bp.route('/test_cases/import', methods=['GET', 'POST'])
+@self_checked('test_cases.test_cases')
 def import_test_cases():
     """从Excel文件导入测试用例"""
     # 检查权限
@@ -561,179 +528,19 @@ def import_test_cases():
             flash('只支持.xlsx格式的文件', 'error')
             return redirect(request.url)
 
-        try:
-            # 读取Excel文件
-            workbook = load_workbook(file)
-            worksheet = workbook.active
-
-            # 解析数据并创建测试用例
-            success_count = 0
-            error_count = 0
-
-            # 用于跟踪当前导入过程中每个用户故事的用例序号
-            import_case_counters = {}
-
-            # 从第二行开始读取数据（第一行是标题）
-            for row_num, row in enumerate(worksheet.iter_rows(min_row=2, values_only=True), 2):
-                try:
-                    # 获取行数据
-                    case_id = row[0] if row[0] else None
-                    edit_status = row[1] if row[1] else '新增'
-                    project_name = row[2] if row[2] else None
-                    project_module = row[3] if row[3] else None
-                    sprint_name = row[4] if row[4] else None
-                    user_story_title = row[5] if row[5] else None
-                    title = row[6] if row[6] else None
-                    case_type = row[7] if row[7] else None
-                    function_point = row[8] if row[8] else None
-                    precondition = row[9] if row[9] else None
-                    steps = row[10] if row[10] else None
-                    expected_result = row[11] if row[11] else None
-                    priority = row[12] if row[12] else 'P3'
-                    is_automated_str = row[13] if row[13] else '否'
-                    created_by_name = row[14] if row[14] else None
-                    created_at_str = row[15] if row[15] else None
-                    tested_by_name = row[16] if row[16] else None
-                    test_environment = row[17] if row[17] else None
-                    tested_at_str = row[18] if row[18] else None
-                    execution_status = row[19] if row[19] else '未开始'
-                    test_result = row[20] if row[20] else None
-                    actual_result = row[21] if row[21] else None
-                    remarks = row[22] if row[22] else None
-
-                    # 验证必填字段
-                    if not title:
-                        error_count += 1
-                        continue
-
-                    # 查找关联对象
-                    project = None
-                    project_short_name = None
-                    if project_name:
-                        project = ProjectInfo.query.filter_by(name=project_name).first()
-                        if project and project.short_name:
-                            project_short_name = project.short_name
-
-                    sprint = None
-                    if sprint_name:
-                        sprint = Sprint.query.filter_by(name=sprint_name).first()
-
-                    user_story = None
-                    user_story_id = None
-                    if user_story_title:
-                        user_story = UserStory.query.filter_by(title=user_story_title).first()
-                        if user_story and user_story.story_id:
-                            user_story_id = user_story.story_id
-
-                    created_by = None
-                    if created_by_name:
-                        created_by = User.query.filter_by(name=created_by_name).first()
-
-                    tested_by = None
-                    if tested_by_name:
-                        tested_by = User.query.filter_by(name=tested_by_name).first()
-
-                    # 处理布尔值
-                    is_automated = is_automated_str == '是'
-
-                    # 处理日期
-                    created_at = None
-                    if created_at_str:
-                        try:
-                            created_at = datetime.strptime(created_at_str, '%Y-%m-%d %H:%M:%S')
-                        except ValueError:
-                            pass
-
-                    tested_at = None
-                    if tested_at_str:
-                        try:
-                            tested_at = datetime.strptime(tested_at_str, '%Y-%m-%d')
-                        except ValueError:
-                            pass
-
-                    # 自动生成用例编号
-                    generated_case_id = None
-                    if project_short_name and user_story_id:
-                        # 创建一个用于当前导入过程的唯一键
-                        counter_key = f"{project_short_name}-{user_story_id}"
-
-                        # 检查是否已经为这个用户故事生成过用例编号
-                        if counter_key in import_case_counters:
-                            # 如果已经存在，递增计数器
-                            import_case_counters[counter_key] += 1
-                        else:
-                            # 如果不存在，先查询数据库中已有的最大序号
-                            max_seq = 0
-                            existing_cases = TestCase.query.filter_by(
-                                user_story_id=user_story.id if user_story else None).all()
-                            for case in existing_cases:
-                                if case.case_id and case.case_id.startswith(f"{project_short_name}-{user_story_id}-"):
-                                    try:
-                                        seq = int(case.case_id.split('-')[2])
-                                        if seq > max_seq:
-                                            max_seq = seq
-                                    except (IndexError, ValueError):
-                                        # 如果解析失败，跳过该用例
-                                        pass
-                            # 设置初始计数器为数据库中最大序号+1
-                            import_case_counters[counter_key] = max_seq + 1
-
-                        # 使用当前计数器值生成用例编号
-                        next_seq = import_case_counters[counter_key]
-                        seq_part = str(next_seq).zfill(3)
-                        generated_case_id = f"{project_short_name}-{user_story_id}-{seq_part}"
-                    elif case_id:
-                        # 如果无法自动生成，则使用Excel中提供的用例编号
-                        generated_case_id = case_id
-                    # print(generated_case_id)
-
-                    # 创建测试用例对象
-                    test_case = TestCase(
-                        case_id=generated_case_id,  # 使用自动生成的用例编号
-                        project_id=project.id if project else None,
-                        project_module=project_module,
-                        sprint_id=sprint.id if sprint else None,
-                        user_story_id=user_story.id if user_story else None,
-                        edit_status=edit_status,
-                        execution_status=execution_status,
-                        test_result=test_result,
-                        case_type=case_type,
-                        function_point=function_point,
-                        title=title,
-                        precondition=precondition,
-                        steps=steps,
-                        expected_result=expected_result,
-                        actual_result=actual_result,
-                        test_environment=test_environment,
-                        priority=priority,
-                        is_automated=is_automated,
-                        created_by_id=created_by.id if created_by else session.get('user_id'),
-                        created_at=created_at,
-                        tested_by_id=tested_by.id if tested_by else None,
-                        tested_at=tested_at,
-                        remarks=remarks
-                    )
-
-                    db.session.add(test_case)
-                    success_count += 1
-
-                except Exception as e:
-                    error_count += 1
-                    error_details = {
-                        'row_number': row_num,
-                        'error_message': str(e),
-                        'row_data': row  # 保存出错行的数据以便分析
-                    }
-                    # 记录错误但继续处理其他行
-                    print(f"处理第{row_num}行时出错: {error_details}")
+        start_row = request.form.get('start_row', 2, type=int)
 
-            db.session.commit()
-            flash(f'导入完成！成功导入{success_count}条记录，{error_count}条记录失败。', 'success')
-
-        except Exception as e:
-            db.session.rollback()
-            flash(f'导入失败：{str(e)}', 'error')
+        # 大文件提交后台任务，在任务页面查看进度和导入结果
+        if request.form.get('background'):
+            job = background_jobs.enqueue('test_cases.import', session['user_id'],
+                                          params={'start_row': start_row}, upload=file)
+            return redirect(url_for('jobs.job_detail', job_id=job.id))
 
+        report = import_test_cases_from_excel(file, session.get('user_id'), start_row=start_row)
+        if report.error_count or report.aborted:
+            # 停留在导入页面展示逐行错误和已提交的进度
+            return render_template('test_case_import.html', report=report)
+        flash(f'导入完成！成功导入{report.imported_count}条记录。', 'success')
         return redirect(url_for('test_cases.test_cases'))
 
     # GET请求显示导入页面
@@ -1,9 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, send_file
 from sqlalchemy import or_
-from models import db, UserStory, User, SystemFeature, ProjectInfo, Sprint, SprintBacklog, UserRole, Role, \
-    ProductBacklog
-from utils import check_system_feature_access, check_user_role
-from decorators import check_access_blueprint
+from models import db, UserStory, SystemFeature, ProjectInfo, Sprint, SprintBacklog, ProductBacklog
+from utils import check_system_feature_access
+from user_directory import non_admin_users
+from reference_data import project_options
+from loader_profiles import USER_STORY_LIST
+from decorators import check_access_blueprint, self_checked
+from project_tree import get_module_tree
+from sequences import allocate_code, preview_code, observe_code, story_sequence
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment
 from io import BytesIO
@@ -13,37 +17,9 @@ user_stories_bp = Blueprint('user_stories', __name__)
 def generate_story_id(product_backlog_id):
     """
     生成用户故事编号
-    规则：US_需求ID(3位)_序号(3位)
+    规则：US_需求ID(3位)_序号(3位)，从编号序列原子分配，需在同一事务中提交
     """
-    # 获取需求ID，保持3位长度，不够前面补零
-    backlog_part = str(product_backlog_id).zfill(3)
-
-    # 查询当前需求下最大的用户故事序号
-    stories = UserStory.query.filter_by(product_backlog_id=product_backlog_id).all()
-
-    if stories:
-        # 查找最大的序号并加1
-        max_seq = 0
-        for story in stories:
-            if story.story_id and story.story_id.startswith(f"US_{backlog_part}_"):
-                try:
-                    seq = int(story.story_id.split('_')[2])
-                    if seq > max_seq:
-                        max_seq = seq
-                except (IndexError, ValueError):
-                    # 如果解析失败，跳过该故事
-                    pass
-        next_seq = max_seq + 1
-    else:
-        # 如果当前需求没有用户故事，默认值为1
-        next_seq = 1
-
-    # 序号保持3位长度，不够前面补零
-    seq_part = str(next_seq).zfill(3)
-
-    # 拼接生成故事编号
-    story_id = f"US_{backlog_part}_{seq_part}"
-    return story_id
+    return allocate_code(story_sequence(product_backlog_id))
 
 
 # 应用权限检查装饰器
@@ -53,32 +29,25 @@ def check_access():
     pass  # 装饰器会处理权限检查逻辑
 
 @user_stories_bp.route('/user_stories')
+@self_checked('user_stories.user_stories')
 def user_stories():
     # 检查权限
     if not check_system_feature_access(session, 'user_stories.user_stories'):
         return redirect(url_for('auth.index'))
     
     # 获取所有项目（根节点）
-    projects = ProjectInfo.query.filter_by(parent_id=None).order_by(ProjectInfo.order).all()
-    
-    # 获取所有用户故事
-    user_stories = UserStory.query.order_by(UserStory.created_at.desc()).all()
+    projects = project_options()
     
+    # 用户故事由页面按需求通过接口加载，这里不再查询全部故事
     # 获取所有非管理员用户，用于分配负责人
-    # 首先获取所有用户
-    all_users = User.query.all()
-    # 然后过滤掉具有admin角色的用户
-    users = []
-    for user in all_users:
-        if not check_user_role(user.id, 'admin'):
-            users.append(user)
+    users = non_admin_users()
     
     return render_template('user_stories.html', 
-                          user_stories=user_stories, 
                           users=users,
                           projects=projects)
 
 @user_stories_bp.route('/get_project_tree/<int:project_id>')
+@self_checked('user_stories.user_stories')
 def get_project_tree(project_id):
     """获取指定项目的菜单和页面树形结构"""
     # 检查权限
@@ -90,41 +59,16 @@ def get_project_tree(project_id):
     if not project:
         return jsonify({'success': False, 'message': '项目不存在'})
     
-    nodes = ProjectInfo.query.filter(
-        ProjectInfo.path.like(f"/{project.name}%")
-    ).filter(
-        ProjectInfo.node_type.in_(['menu', 'page'])
-    ).order_by(ProjectInfo.path).all()
-    
-    # 构建树形结构
-    def build_tree(parent_path=f"/{project.name}"):
-        tree = []
-        for node in nodes:
-            # 检查是否为当前层级的直接子节点
-            node_path_parts = node.path.split('/')
-            parent_path_parts = parent_path.split('/')
-            
-            # 如果节点路径比父路径多一级，则为直接子节点
-            if len(node_path_parts) == len(parent_path_parts) + 1 and node.path.startswith(parent_path + "/"):
-                children = build_tree(node.path)
-                tree.append({
-                    'id': node.id,
-                    'name': node.name,
-                    'node_type': node.node_type,
-                    'path': node.path,
-                    'children': children if children else []
-                })
-        return tree
-    
-    # 构建项目下的树形结构
-    project_tree = build_tree(f"/{project.name}")
-    
+    # 构建项目下的树形结构（按项目缓存，节点变化时失效）
+    project_tree = get_module_tree(project.id)
+
     return jsonify({
         'success': True,
         'tree': project_tree
     })
 
 @user_stories_bp.route('/get_product_backlogs')
+@self_checked('user_stories.user_stories')
 def get_product_backlogs():
     """根据项目ID和状态获取产品待办事项列表"""
     # 检查权限
@@ -167,6 +111,7 @@ def get_product_backlogs():
     })
 
 @user_stories_bp.route('/get_user_stories_by_product_backlog/<int:product_backlog_id>')
+@self_checked('user_stories.user_stories')
 def get_user_stories_by_product_backlog_id(product_backlog_id):
     """根据产品待办事项ID获取关联的用户故事"""
     # 检查权限
@@ -178,16 +123,12 @@ def get_user_stories_by_product_backlog_id(product_backlog_id):
     if not product_backlog:
         return jsonify({'success': False, 'message': '产品待办事项不存在'})
 
-    # 获取产品待办事项关联的用户故事
-    user_stories = UserStory.query.filter_by(product_backlog_id=product_backlog_id).order_by(
+    # 获取产品待办事项关联的用户故事，所在迭代一并加载
+    user_stories = UserStory.query.options(*USER_STORY_LIST).filter_by(product_backlog_id=product_backlog_id).order_by(
         UserStory.created_at.desc()).all()
 
     # 获取所有非管理员用户，用于显示负责人信息
-    users = []
-    all_users = User.query.all()
-    for user in all_users:
-        if not check_user_role(user.id, 'admin'):
-            users.append(user)
+    users = non_admin_users()
     
     # 转换用户故事为字典格式
     stories_data = []
@@ -222,6 +163,7 @@ def get_user_stories_by_product_backlog_id(product_backlog_id):
 
 
 @user_stories_bp.route('/add_user_story/<int:product_backlog_id>', methods=['GET', 'POST'])
+@self_checked('user_stories.user_stories')
 def add_user_story(product_backlog_id):
     # 检查权限
     if not check_system_feature_access(session, 'user_stories.user_stories'):
@@ -233,7 +175,7 @@ def add_user_story(product_backlog_id):
         return jsonify({'success': False, 'message': '产品待办事项不存在'})
 
     # 获取所有非管理员用户（通过角色关联判断）
-    users = User.query.join(UserRole).filter(Role.name != 'admin').all()
+    users = non_admin_users()
     
     if request.method == 'POST':
         # 处理表单提交
@@ -252,6 +194,8 @@ def add_user_story(product_backlog_id):
             # 如果用户没有提供故事编号，则自动生成
             if not story_id:
                 story_id = generate_story_id(product_backlog_id)
+            else:
+                observe_code(story_sequence(product_backlog_id), story_id)
             
             # 创建新的用户故事
             user_story = UserStory(
@@ -297,6 +241,7 @@ def add_user_story(product_backlog_id):
                           story_id=f"US_{product_backlog_id:02d}_")
 
 @user_stories_bp.route('/edit_user_story/<int:user_story_id>', methods=['POST'])
+@self_checked('user_stories.user_stories')
 def edit_user_story(user_story_id):
     # 检查权限
     if not check_system_feature_access(session, 'user_stories.user_stories'):
@@ -350,6 +295,7 @@ def edit_user_story(user_story_id):
         return jsonify({'success': False, 'message': '用户故事不存在'})
 
 @user_stories_bp.route('/delete_user_story/<int:user_story_id>', methods=['POST'])
+@self_checked('user_stories.user_stories')
 def delete_user_story(user_story_id):
     # 检查权限
     if not check_system_feature_access(session, 'user_stories.user_stories'):
@@ -381,6 +327,7 @@ def delete_user_story(user_story_id):
         return jsonify({'success': False, 'message': '用户故事不存在'})
 
 @user_stories_bp.route('/get_edit_user_story_modal/<int:user_story_id>')
+@self_checked('user_stories.user_stories')
 def get_edit_user_story_modal(user_story_id):
     """获取编辑用户故事的模态框"""
     # 检查权限
@@ -393,7 +340,7 @@ def get_edit_user_story_modal(user_story_id):
         return jsonify({'success': False, 'message': '用户故事不存在'})
     
     # 获取所有非管理员用户，用于分配负责人
-    users = User.query.join(UserRole).filter(Role.name != 'admin').all()
+    users = non_admin_users()
     
     return render_template('edit_user_story_modal.html', 
                          user_story=user_story, 
@@ -401,6 +348,7 @@ def get_edit_user_story_modal(user_story_id):
 
 
 @user_stories_bp.route('/get_add_user_story_modal')
+@self_checked('user_stories.user_stories')
 def get_add_user_story_modal():
     """获取添加用户故事的模态框"""
     # 检查权限
@@ -411,19 +359,20 @@ def get_add_user_story_modal():
     project_page_id = request.args.get('project_page_id', type=int)
     
     # 获取所有非管理员用户，用于分配负责人
-    users = User.query.join(UserRole).filter(Role.name != 'admin').all()
+    users = non_admin_users()
     
     # 获取项目页面信息
     project_page = db.session.get(ProjectInfo, project_page_id) if project_page_id else None
-    # 生成故事编号
+    # 预览故事编号（不占用序号，提交时再分配）
     story_id = None
     if project_page_id:
-        story_id = generate_story_id(project_page_id)
+        story_id = preview_code(story_sequence(project_page_id))
     return render_template('add_user_story_modal.html', 
                          users=users,
                          story_id=story_id )
 
 @user_stories_bp.route('/export_user_stories/<int:page_id>')
+@self_checked('user_stories.user_stories')
 def export_user_stories(page_id):
     """导出指定页面的用户故事到Excel文件"""
     # 检查权限
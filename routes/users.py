@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models import db, User, Estimate, SystemFeature, UserRole, Role
 from decorators import check_access_blueprint
-from utils import check_user_role
+from utils import check_user_role, invalidate_permission_cache
+from user_directory import get_user_directory
 
 users_bp = Blueprint('users', __name__, url_prefix='/users')
 
@@ -25,11 +26,12 @@ def users():
     users = users_pagination.items
     roles = Role.query.all()
 
-    # 为每个用户获取角色
+    # 从用户目录中取每个用户的角色
+    directory = get_user_directory()
     for user in users:
-        user_roles = UserRole.query.filter_by(user_id=user.id).all()
-        user.role_ids = [ur.role_id for ur in user_roles]
-        user.role_names = [ur.role.display_name for ur in user_roles]
+        user_roles = directory.roles_of(user.id)
+        user.role_ids = [role.id for role in user_roles]
+        user.role_names = [role.display_name for role in user_roles]
 
     return render_template('users.html', users=users, roles=roles, pagination=users_pagination)
 
@@ -51,6 +53,7 @@ def set_admin(user_id):
                 user_role = UserRole(user_id=user_id, role_id=admin_role.id)
                 db.session.add(user_role)
                 db.session.commit()
+                invalidate_permission_cache(user_id)
     return redirect(url_for('users.users'))
 
 @users_bp.route('/unset_admin/<int:user_id>', methods=['POST'])
@@ -68,6 +71,7 @@ def unset_admin(user_id):
             if user_role:
                 db.session.delete(user_role)
                 db.session.commit()
+                invalidate_permission_cache(user_id)
     return redirect(url_for('users.users'))
 
 
@@ -85,6 +89,7 @@ def delete_user(user_id):
 
         db.session.delete(user)
         db.session.commit()
+        invalidate_permission_cache(user_id)
     return redirect(url_for('users.users'))
 
 
@@ -114,6 +119,7 @@ def assign_roles(user_id):
             db.session.add(user_role)
 
         db.session.commit()
+        invalidate_permission_cache(user_id)
         return jsonify({'success': True, 'message': '角色分配成功'})
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,108 @@
+"""
+全文搜索
+缺陷、测试用例、用户故事、产品待办事项和知识文章的标题/正文建有 FULLTEXT 索引（ngram 分词，支持中文），
+检索使用 MATCH ... AGAINST 走索引，而不是无法使用索引的 LIKE '%关键词%' 全表扫描。
+ngram 默认按 2 个字切词，少于 2 个字的关键词无法通过全文索引匹配，此时退回 LIKE 查询。
+"""
+
+import re
+from collections import namedtuple
+
+from flask import url_for
+from sqlalchemy import and_, or_, false, literal, null
+from sqlalchemy.dialects.mysql import match
+
+from models import db, Defect, TestCase, UserStory, ProductBacklog, AgileKnowledge
+
+
+# 与 MySQL 的 ngram_token_size 一致
+NGRAM_TOKEN_SIZE = 2
+MAX_SEARCH_LIMIT = 50
+
+# 可搜索的实体：全文索引列、结果编号列、所需的系统功能、详情页 (端点, ID参数名)
+SearchTarget = namedtuple('SearchTarget', ['name', 'label', 'model', 'columns', 'code_column',
+                                           'feature_key', 'detail_endpoint'])
+
+SEARCH_TARGETS = {
+    'defect': SearchTarget('defect', '缺陷', Defect, (Defect.title, Defect.description),
+                           Defect.defect_id, 'defects.defects', ('defects.edit_defect', 'defect_id')),
+    'test_case': SearchTarget('test_case', '测试用例', TestCase,
+                              (TestCase.title, TestCase.steps, TestCase.expected_result),
+                              TestCase.case_id, 'test_cases.test_cases',
+                              ('test_cases.edit_test_case', 'case_id')),
+    'user_story': SearchTarget('user_story', '用户故事', UserStory, (UserStory.title, UserStory.description),
+                               UserStory.story_id, 'user_stories.user_stories', None),
+    'product_backlog': SearchTarget('product_backlog', '产品待办事项', ProductBacklog,
+                                    (ProductBacklog.title, ProductBacklog.description),
+                                    ProductBacklog.requirement_id, 'product_backlog.product_backlog', None),
+    'knowledge': SearchTarget('knowledge', '知识文章', AgileKnowledge, (AgileKnowledge.title, AgileKnowledge.content),
+                              None, 'knowledge.knowledge_view', ('knowledge.knowledge_detail', 'knowledge_id')),
+}
+
+
+def split_terms(keyword):
+    """按空白拆分关键词，去掉布尔模式中的运算符"""
+    return [term for term in re.split(r'\s+', re.sub(r'[+\-<>()~*"@]', ' ', keyword or '')) if term]
+
+
+def boolean_query(terms):
+    """每个词作为短语且必须出现：+"词1" +"词2"（ngram 下短语匹配相当于子串匹配）"""
+    return ' '.join(f'+"{term}"' for term in terms)
+
+
+def uses_fulltext(terms):
+    return bool(terms) and all(len(term) >= NGRAM_TOKEN_SIZE for term in terms)
+
+
+def text_filter(columns, keyword):
+    """
+    全文搜索条件
+    :return: (过滤条件, 相关度表达式)；关键词过短时相关度为 None
+    """
+    terms = split_terms(keyword)
+    if uses_fulltext(terms):
+        relevance = match(*columns, against=boolean_query(terms)).in_boolean_mode()
+        return relevance, relevance
+    if not terms:
+        return false(), None
+    # 单字关键词退回 LIKE
+    return and_(*[or_(*[column.contains(term) for column in columns]) for term in terms]), None
+
+
+def search_target(target, keyword, limit):
+    """在单个实体中搜索，按相关度排序"""
+    condition, relevance = text_filter(target.columns, keyword)
+    code_column = target.code_column if target.code_column is not None else null()
+    score = relevance if relevance is not None else literal(0)
+    rows = db.session.query(
+        target.model.id, code_column.label('code'), target.columns[0].label('title'), score.label('score')
+    ).filter(condition).order_by(score.desc(), target.model.id.desc()).limit(limit).all()
+    return [{
+        'type': target.name,
+        'type_label': target.label,
+        'id': row.id,
+        'code': row.code,
+        'title': row.title,
+        'score': float(row.score or 0),
+        'url': detail_url(target, row.id)
+    } for row in rows]
+
+
+def detail_url(target, row_id):
+    if not target.detail_endpoint:
+        return None
+    endpoint, arg_name = target.detail_endpoint
+    return url_for(endpoint, **{arg_name: row_id})
+
+
+def search_all(keyword, targets, limit=20):
+    """
+    跨实体搜索：每个实体各取相关度最高的 limit 条，再按相关度合并
+    各表的相关度按各自的词频统计计算，合并排序只是近似
+    """
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    results = []
+    for target in targets:
+        results.extend(search_target(target, keyword, limit))
+    results.sort(key=lambda item: item['score'], reverse=True)
+    return results[:limit]
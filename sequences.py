@@ -0,0 +1,177 @@
+"""
+业务编号序列
+每个范围（全局需求、每个需求下的故事、每个故事下的任务、每个用例前缀、全局缺陷）一行计数器，
+分配时用 UPDATE value = value + 1 原子递增，行锁持有到调用方事务提交，并发创建不会得到相同编号。
+计数器由 migrations.py 根据现有编号初始化；缺失的范围在第一次分配时按现有数据补齐。
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdSequence, ProductBacklog, UserStory, Task, TestCase, Defect
+
+
+_sequence_table = IdSequence.__table__
+
+
+def _increment(scope):
+    result = db.session.execute(
+        update(_sequence_table).where(_sequence_table.c.scope == scope).values(
+            value=_sequence_table.c.value + 1, updated_at=datetime.utcnow()
+        )
+    )
+    return result.rowcount > 0
+
+
+def _current(scope):
+    return db.session.execute(
+        select(_sequence_table.c.value).where(_sequence_table.c.scope == scope)
+    ).scalar()
+
+
+def _insert(scope, value):
+    """插入计数器行，并发插入时返回 False"""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(_sequence_table).values(scope=scope, value=value, updated_at=datetime.utcnow()))
+        return True
+    except IntegrityError:
+        return False
+
+
+def next_value(scope, seed=None):
+    """
+    原子递增并返回范围内的下一个序号（不提交事务）
+    :param seed: 计数器不存在时返回现有最大序号的函数
+    """
+    if not _increment(scope):
+        start = seed() if seed else 0
+        if _insert(scope, start + 1):
+            return start + 1
+        # 其他请求刚创建了计数器
+        _increment(scope)
+    return _current(scope)
+
+
+def next_values(scope, count, seed=None):
+    """
+    原子占用范围内连续的 count 个序号（不提交事务），用于批量导入
+    :return: 第一个序号
+    """
+    if count <= 0:
+        return None
+    result = db.session.execute(
+        update(_sequence_table).where(_sequence_table.c.scope == scope).values(
+            value=_sequence_table.c.value + count, updated_at=datetime.utcnow()
+        )
+    )
+    if result.rowcount == 0:
+        start = seed() if seed else 0
+        if _insert(scope, start + count):
+            return start + 1
+        return next_values(scope, count)
+    return _current(scope) - count + 1
+
+
+def peek_value(scope, seed=None):
+    """预览下一个序号，不占用（用于表单中预填编号）"""
+    current = _current(scope)
+    if current is None:
+        current = seed() if seed else 0
+    return current + 1
+
+
+def observe_value(scope, value, seed=None):
+    """手工指定编号时调用，保证计数器不小于该序号，避免之后自动分配出重复编号"""
+    if value is None:
+        return
+    result = db.session.execute(
+        update(_sequence_table).where(
+            _sequence_table.c.scope == scope, _sequence_table.c.value < value
+        ).values(value=value, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0 and _current(scope) is None:
+        if not _insert(scope, max(value, seed() if seed else 0)):
+            observe_value(scope, value)
+
+
+def parse_seq(code, prefix):
+    """解析 前缀+数字 格式编号中的序号，不匹配时返回 None"""
+    if code and code.startswith(prefix):
+        rest = code[len(prefix):]
+        if rest.isdigit():
+            return int(rest)
+    return None
+
+
+def max_seq(codes, prefix):
+    return max((seq for seq in (parse_seq(code, prefix) for code in codes) if seq is not None), default=0)
+
+
+def _like_prefix(column, prefix):
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(escaped + '%', escape='\\')
+
+
+# 各类编号的范围、前缀与现有最大序号
+
+def requirement_sequence():
+    prefix = 'R_'
+    return 'requirement', prefix, lambda: max_seq(
+        (row[0] for row in db.session.query(ProductBacklog.requirement_id).filter(
+            _like_prefix(ProductBacklog.requirement_id, prefix))), prefix)
+
+
+def story_sequence(product_backlog_id):
+    prefix = f"US_{str(product_backlog_id).zfill(3)}_"
+    return f'story:{product_backlog_id}', prefix, lambda: max_seq(
+        (row[0] for row in db.session.query(UserStory.story_id).filter(
+            UserStory.product_backlog_id == product_backlog_id)), prefix)
+
+
+def task_sequence(user_story):
+    """故事编号为 US_ 格式时为 TA_[故事编号]_序号，否则为 TA_序号，均按故事分配"""
+    if user_story.story_id and user_story.story_id.startswith('US_'):
+        prefix = f"TA_{user_story.story_id}_"
+    else:
+        prefix = 'TA_'
+    return f'task:{user_story.id}', prefix, lambda: max_seq(
+        (row[0] for row in db.session.query(Task.task_id).filter(Task.user_story_id == user_story.id)), prefix)
+
+
+def case_sequence(project_short_name, story_code):
+    prefix = f"{project_short_name}-{story_code}-"
+    return f'case:{project_short_name}-{story_code}', prefix, lambda: max_seq(
+        (row[0] for row in db.session.query(TestCase.case_id).filter(_like_prefix(TestCase.case_id, prefix))), prefix)
+
+
+def defect_sequence():
+    prefix = 'F_'
+    return 'defect', prefix, lambda: max_seq(
+        (row[0] for row in db.session.query(Defect.defect_id).filter(_like_prefix(Defect.defect_id, prefix))), prefix)
+
+
+def allocate_code(sequence):
+    """按 (范围, 前缀, 种子函数) 分配下一个编号，序号至少 3 位"""
+    scope, prefix, seed = sequence
+    return f"{prefix}{next_value(scope, seed):03d}"
+
+
+def allocate_codes(sequence, count):
+    """一次分配 count 个连续编号"""
+    scope, prefix, seed = sequence
+    first = next_values(scope, count, seed)
+    return [f"{prefix}{value:03d}" for value in range(first, first + count)] if count > 0 else []
+
+
+def preview_code(sequence):
+    scope, prefix, seed = sequence
+    return f"{prefix}{peek_value(scope, seed):03d}"
+
+
+def observe_code(sequence, code):
+    """手工填写的编号符合该序列格式时，推进计数器"""
+    scope, prefix, seed = sequence
+    observe_value(scope, parse_seq(code, prefix), seed)
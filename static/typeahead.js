@@ -0,0 +1,59 @@
+// 下拉框按需检索：<select data-typeahead="/api/reference/users">
+// 在下拉框前插入搜索框，输入关键词后从接口检索选项；占位选项和当前选中的选项始终保留
+// data-typeahead-params="project_id,sprint_id"：检索时带上这些表单字段的当前值
+(function () {
+    function setupTypeahead(select) {
+        const input = document.createElement('input');
+        input.type = 'search';
+        input.className = 'form-control form-control-sm mb-1';
+        input.placeholder = select.dataset.typeaheadPlaceholder || '输入关键词搜索';
+        select.parentNode.insertBefore(input, select);
+
+        let timer = null;
+        let requestId = 0;
+
+        function load(keyword) {
+            const url = new URL(select.dataset.typeahead, window.location.origin);
+            url.searchParams.set('q', keyword);
+            (select.dataset.typeaheadParams || '').split(',').filter(Boolean).forEach(name => {
+                const field = document.getElementById(name);
+                if (field && field.value) {
+                    url.searchParams.set(name, field.value);
+                }
+            });
+            const currentRequest = ++requestId;
+            fetch(url)
+                .then(response => response.json())
+                .then(data => {
+                    // 只使用最后一次请求的结果
+                    if (!data.success || currentRequest !== requestId) {
+                        return;
+                    }
+                    const selected = select.value;
+                    Array.from(select.options).forEach(option => {
+                        if (option.value && option.value !== selected) {
+                            option.remove();
+                        }
+                    });
+                    data.options.forEach(item => {
+                        if (String(item.id) === selected) {
+                            return;
+                        }
+                        const option = document.createElement('option');
+                        option.value = item.id;
+                        option.textContent = item.name;
+                        select.appendChild(option);
+                    });
+                })
+                .catch(error => console.error('Error:', error));
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(() => load(input.value.trim()), 250);
+        });
+        load('');
+    }
+
+    document.querySelectorAll('select[data-typeahead]').forEach(setupTypeahead);
+})();
@@ -0,0 +1,77 @@
+"""
+用户故事检索（故事选择器）
+表单中不再把全部用户故事渲染到页面里，而是按关键词、项目、迭代分页检索。
+项目路径（项目 - 菜单 - 页面）在同一条查询中联表取出功能模块路径和项目名称后计算，
+不再对每个故事依次懒加载 product_backlog -> project_module -> path。
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import select, union, exists
+from sqlalchemy.orm import aliased
+
+from models import db, UserStory, ProductBacklog, ProjectInfo, SprintBacklog
+from pagination import keyset_paginate
+from search import text_filter
+
+
+StoryOption = namedtuple('StoryOption', ['id', 'story_id', 'title', 'priority', 'effort', 'project_path'])
+
+
+def format_project_path(module_path, project_name):
+    """/项目/菜单/页面 -> 项目 - 菜单 - 页面；没有功能模块时显示项目名称"""
+    if module_path:
+        path_parts = module_path.split('/')
+        if len(path_parts) >= 3:
+            return ' - '.join(path_parts[1:])
+        return module_path.lstrip('/')
+    return project_name or '未指定'
+
+
+def story_lookup_query(keyword=None, project_id=None, sprint_id=None, unassigned=False):
+    """
+    用户故事检索查询（id、编号、标题、优先级、工作量以及功能模块路径和项目名称）
+    :param keyword: 故事编号前缀，或标题/描述的全文检索
+    :param project_id: 只返回该项目产品待办事项下的故事
+    :param sprint_id: 只返回已加入该迭代的故事
+    :param unassigned: 只返回未加入任何迭代的故事
+    """
+    module, project = aliased(ProjectInfo), aliased(ProjectInfo)
+    query = db.session.query(
+        UserStory.id, UserStory.story_id, UserStory.title, UserStory.priority, UserStory.effort,
+        module.path.label('module_path'), project.name.label('project_name')
+    ).outerjoin(ProductBacklog, ProductBacklog.id == UserStory.product_backlog_id) \
+        .outerjoin(module, module.id == ProductBacklog.project_module_id) \
+        .outerjoin(project, project.id == ProductBacklog.project_id)
+
+    if keyword:
+        # 编号按前缀匹配（走唯一索引），标题和描述走全文索引，两者的结果合并
+        matched_ids = union(
+            select(UserStory.id).where(text_filter((UserStory.title, UserStory.description), keyword)[0]),
+            select(UserStory.id).where(UserStory.story_id.startswith(keyword, autoescape=True))
+        )
+        query = query.filter(UserStory.id.in_(matched_ids))
+    if project_id:
+        query = query.filter(ProductBacklog.project_id == project_id)
+    if sprint_id:
+        query = query.filter(UserStory.id.in_(
+            select(SprintBacklog.user_story_id).where(SprintBacklog.sprint_id == sprint_id)))
+    if unassigned:
+        query = query.filter(~exists().where(SprintBacklog.user_story_id == UserStory.id))
+    return query
+
+
+def to_story_option(row):
+    return StoryOption(row.id, row.story_id, row.title, row.priority, row.effort,
+                       format_project_path(row.module_path, row.project_name))
+
+
+def lookup_stories(keyword=None, project_id=None, sprint_id=None, unassigned=False, cursor=None, per_page=20):
+    """
+    分页检索用户故事，最新的在前
+    :return: ([StoryOption, ...], 下一页游标或 None)
+    """
+    pagination = keyset_paginate(story_lookup_query(keyword, project_id, sprint_id, unassigned),
+                                 UserStory.id, UserStory.id, cursor=cursor, per_page=per_page,
+                                 descending=True, with_total=False)
+    return [to_story_option(row) for row in pagination.items], pagination.next_cursor
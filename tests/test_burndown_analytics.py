@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检查多迭代批量燃尽计算（compute_sprints_analytics）
+结束日期早于开始日期的迭代天数为 0，其已完成任务不能计入相邻迭代的燃尽曲线，
+放在最后一个时也不能让按天分箱的数组越界。
+测试数据只 flush 不提交，结束后回滚。需要连接已执行过 migrations.py 的 MySQL 数据库。
+
+使用方法：python tests/test_burndown_analytics.py 或 python -m pytest tests/test_burndown_analytics.py
+"""
+
+import sys
+import os
+import uuid
+from datetime import date, datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Sprint, SprintBacklog, UserStory, Task
+from burndown import compute_sprints_analytics
+
+
+def _name(prefix):
+    return f'bd_{prefix}_{uuid.uuid4().hex[:8]}'
+
+
+def _sprint_with_story(start_date, end_date, story_points, tasks):
+    """
+    创建迭代及其一个用户故事
+    :param tasks: [(状态, 完成时间), ...]
+    """
+    sprint = Sprint(name=_name('sprint'), start_date=start_date, end_date=end_date, status='已完成')
+    story = UserStory(title=_name('story'))
+    db.session.add_all([sprint, story,
+                        SprintBacklog(sprint=sprint, user_story=story, story_points=story_points)])
+    for status, completed_at in tasks:
+        db.session.add(Task(name=_name('task'), user_story=story, status=status, completed_at=completed_at))
+    return sprint
+
+
+def check_zero_length_sprint():
+    """返回问题列表 [(说明, 详情)]"""
+    problems = []
+    try:
+        # 结束日期早于开始日期；其中一个任务在开始日期之前完成
+        reversed_sprint = _sprint_with_story(date(2024, 1, 10), date(2024, 1, 5), 4,
+                                             [('已完成', datetime(2024, 1, 1, 10)), ('未开始', None)])
+        # 紧随其后的正常迭代，任务都未完成，每天剩余故事点应保持 8
+        next_sprint = _sprint_with_story(date(2024, 1, 11), date(2024, 1, 20), 8.25, [('未开始', None)])
+        db.session.flush()
+
+        for order in ([reversed_sprint, next_sprint], [next_sprint, reversed_sprint]):
+            results = {item['id']: item for item in compute_sprints_analytics(order)}
+            reversed_result, next_result = results[reversed_sprint.id], results[next_sprint.id]
+            label = '异常迭代在前' if order[0] is reversed_sprint else '异常迭代在后'
+            print(f"{label}: 下一个迭代剩余故事点 {[day['remaining_points'] for day in next_result['burndown_data']]}")
+            if reversed_result['burndown_data']:
+                problems.append((label, f"天数为 0 的迭代不应有燃尽数据: {reversed_result['burndown_data']}"))
+            if len(next_result['burndown_data']) != 10:
+                problems.append((label, f"正常迭代应有 10 天数据: {len(next_result['burndown_data'])}"))
+            if any(day['remaining_points'] != 8.25 for day in next_result['burndown_data']):
+                problems.append((label, f"正常迭代的剩余故事点被其他迭代的任务扣减: {next_result['burndown_data']}"))
+            if next_result['completed_points'] != 0:
+                problems.append((label, f"正常迭代的完成故事点应为 0: {next_result['completed_points']}"))
+    finally:
+        db.session.rollback()
+    return problems
+
+
+def test_zero_length_sprint():
+    app = create_app()
+    with app.app_context():
+        problems = check_zero_length_sprint()
+    assert not problems, f"燃尽计算有误: {problems}"
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        print("=" * 60)
+        print("检查天数为 0 的迭代的燃尽计算")
+        print("=" * 60)
+        problems = check_zero_length_sprint()
+        if problems:
+            print("燃尽计算有误:")
+            for label, detail in problems:
+                print(f"   - {label}: {detail}")
+            sys.exit(1)
+        print("燃尽计算正确")
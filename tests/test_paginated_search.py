@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检查带全文搜索条件的列表分页
+缺陷列表和测试用例列表按关键词搜索时，过滤条件是 MySQL 的 MATCH ... AGAINST，
+分页的总条数缓存需要按数据库方言编译查询语句，否则会抛出 UnsupportedCompilationError。
+需要连接已执行过 migrations.py 的 MySQL 数据库。
+
+使用方法：python tests/test_paginated_search.py 或 python -m pytest tests/test_paginated_search.py
+"""
+
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, union
+
+from app import create_app
+from models import Defect, TestCase
+from pagination import keyset_paginate
+from search import text_filter
+
+# 全文索引（两个字以上）和 LIKE（单字）两种搜索条件
+KEYWORDS = ['登录失败', '登', 'login']
+
+
+def defect_search(keyword):
+    """与缺陷列表相同的搜索查询"""
+    return Defect.query.filter(text_filter((Defect.title, Defect.description), keyword)[0])
+
+
+def test_case_search(keyword):
+    """与测试用例列表相同的搜索查询"""
+    matched_ids = union(
+        select(TestCase.id).where(text_filter((TestCase.title, TestCase.steps, TestCase.expected_result), keyword)[0]),
+        select(TestCase.id).where(TestCase.case_id.startswith(keyword, autoescape=True))
+    )
+    return TestCase.query.filter(TestCase.id.in_(matched_ids))
+
+
+def page_through(query, sort_column, id_column, descending, per_page=2):
+    """从第一页开始沿 next_cursor 翻到最后一页，返回 (总条数, 翻页取到的条数)"""
+    pagination = keyset_paginate(query, sort_column, id_column, per_page=per_page, descending=descending)
+    total, fetched = pagination.total, len(pagination.items)
+    while pagination.has_next:
+        pagination = keyset_paginate(query, sort_column, id_column, cursor=pagination.next_cursor,
+                                     page=pagination.page + 1, per_page=per_page, descending=descending)
+        fetched += len(pagination.items)
+    return total, fetched
+
+
+def check_paginated_search():
+    """返回翻页条数与总条数不一致的搜索 [(说明, 关键词, 总条数, 翻页条数)]"""
+    problems = []
+    for keyword in KEYWORDS:
+        for description, query, sort_column, id_column, descending in [
+            ('缺陷列表', defect_search(keyword), Defect.created_at, Defect.id, True),
+            ('测试用例列表', test_case_search(keyword), TestCase.case_id, TestCase.id, False),
+        ]:
+            total, fetched = page_through(query, sort_column, id_column, descending)
+            print(f"{description} 搜索 {keyword!r}: 共 {total} 条, 翻页取到 {fetched} 条")
+            if total != fetched:
+                problems.append((description, keyword, total, fetched))
+    return problems
+
+
+def test_paginated_search():
+    app = create_app()
+    with app.app_context():
+        problems = check_paginated_search()
+    assert not problems, f"以下搜索的翻页结果与总条数不一致: {problems}"
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        print("=" * 60)
+        print("检查带搜索条件的列表分页")
+        print("=" * 60)
+        problems = check_paginated_search()
+        if problems:
+            print("以下搜索的翻页结果与总条数不一致:")
+            for description, keyword, total, fetched in problems:
+                print(f"   - {description} {keyword!r}: 共 {total} 条, 翻页取到 {fetched} 条")
+            sys.exit(1)
+        print("所有搜索的分页结果正确")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检查列表页的查询次数不随行数增长（模板逐行懒加载关联对象会造成 N+1 查询）
+对每个列表页分别准备少量和较多的数据行，通过测试客户端渲染页面并统计发出的 SQL 条数，两次必须相同。
+测试数据只 flush 不提交，每轮结束后回滚。需要连接已执行过 migrations.py 的 MySQL 数据库。
+
+使用方法：python tests/test_query_counts.py 或 python -m pytest tests/test_query_counts.py
+"""
+
+import sys
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import (db, User, Role, UserRole, ProjectInfo, ProductBacklog, UserStory, Sprint, SprintBacklog,
+                    Defect, TestCase, AgileKnowledge)
+
+# 两次渲染的数据行数
+SMALL_ROWS = 2
+LARGE_ROWS = 8
+
+
+def _name(prefix):
+    return f'qc_{prefix}_{uuid.uuid4().hex[:8]}'
+
+
+def _add(obj):
+    db.session.add(obj)
+    return obj
+
+
+def _user():
+    name = _name('user')
+    return _add(User(name=name, password='x', nickname=name, email=f'{name}@example.com'))
+
+
+def _project():
+    return _add(ProjectInfo(name=_name('project'), node_type='project'))
+
+
+def _sprint(project=None, status='进行中'):
+    return _add(Sprint(name=_name('sprint'), start_date=date.today(), end_date=date.today(), status=status,
+                       project=project, product_owner=_user(), scrum_master=_user()))
+
+
+def _story(product_backlog=None):
+    return _add(UserStory(title=_name('story'), product_backlog=product_backlog))
+
+
+def _backlog(project=None):
+    return _add(ProductBacklog(title=_name('backlog'), project=project))
+
+
+def seed_defects(rows, admin):
+    project = _project()
+    for _ in range(rows):
+        _add(Defect(title=_name('defect'), project=project, assignee=_user(), resolver=_user(),
+                    created_by_id=admin.id))
+    db.session.flush()
+    return f'/defects?project_id={project.id}'
+
+
+def seed_test_cases(rows, admin):
+    project = _project()
+    for _ in range(rows):
+        _add(TestCase(title=_name('case'), project=project, sprint=_sprint(project), user_story=_story()))
+    db.session.flush()
+    return f'/test_cases?project_id={project.id}'
+
+
+def seed_product_backlogs(rows, admin):
+    for _ in range(rows):
+        _add(ProductBacklog(title=_name('backlog'), project=_project(), project_module=_project(),
+                            customer_owner=_user()))
+    db.session.flush()
+    return '/product_backlog'
+
+
+def seed_user_stories(rows, admin):
+    backlog = _backlog()
+    for _ in range(rows):
+        _add(SprintBacklog(sprint=_sprint(), user_story=_story(backlog)))
+    db.session.flush()
+    return f'/get_user_stories_by_product_backlog/{backlog.id}'
+
+
+def seed_sprints(rows, admin):
+    for _ in range(rows):
+        _sprint(_project())
+    db.session.flush()
+    return '/sprints'
+
+
+def seed_sprint_detail(rows, admin):
+    sprint = _sprint()
+    for _ in range(rows):
+        _add(SprintBacklog(sprint=sprint, user_story=_story(), assignee=_user()))
+    db.session.flush()
+    return f'/sprint/{sprint.id}'
+
+
+def seed_knowledge(rows, admin):
+    for _ in range(rows):
+        _add(AgileKnowledge(title=_name('article'), content='x', author=_user(), updated_at=datetime.utcnow()))
+    db.session.flush()
+    return '/knowledge_view'
+
+
+# (说明, 准备数据并返回页面地址的函数)
+LIST_VIEWS = [
+    ('缺陷列表', seed_defects),
+    ('测试用例列表', seed_test_cases),
+    ('需求列表', seed_product_backlogs),
+    ('需求下的用户故事', seed_user_stories),
+    ('迭代列表', seed_sprints),
+    ('迭代详情', seed_sprint_detail),
+    ('知识库', seed_knowledge),
+]
+
+
+@contextmanager
+def count_queries():
+    """统计代码块内发出的 SQL 条数，结果在 yield 的列表中"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def render_with_rows(client, seed, rows):
+    """准备 rows 行数据并以管理员身份渲染页面，返回 (状态码, SQL 条数)；数据随后回滚"""
+    try:
+        admin = _user()
+        _add(UserRole(user=admin, role=Role.query.filter_by(name='admin').one()))
+        db.session.flush()
+        url = seed(rows, admin)
+        admin_id, admin_name = admin.id, admin.name
+        # 清掉构造时已在内存中关联好的对象，页面渲染时和真实请求一样从数据库加载关联
+        db.session.expire_all()
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin_id
+            sess['username'] = admin_name
+        with count_queries() as statements:
+            response = client.get(url)
+        return response.status_code, len(statements)
+    finally:
+        db.session.rollback()
+
+
+def check_query_counts(app):
+    """返回查询次数随行数增长的页面列表 [(说明, 少量行的条数, 较多行的条数)]"""
+    problems = []
+    client = app.test_client()
+    for description, seed in LIST_VIEWS:
+        # 先渲染一次，让进程内缓存（权限、下拉数据等）就绪
+        render_with_rows(client, seed, SMALL_ROWS)
+        small_status, small_count = render_with_rows(client, seed, SMALL_ROWS)
+        large_status, large_count = render_with_rows(client, seed, LARGE_ROWS)
+        print(f"{description}: {SMALL_ROWS} 行 {small_count} 条 SQL, {LARGE_ROWS} 行 {large_count} 条 SQL")
+        assert small_status == 200 and large_status == 200, f"{description} 渲染失败: {small_status}, {large_status}"
+        if large_count != small_count:
+            problems.append((description, small_count, large_count))
+    return problems
+
+
+def test_query_counts():
+    app = create_app()
+    # 测试客户端的请求复用这里的应用上下文，与准备数据共用同一个数据库会话
+    with app.app_context():
+        problems = check_query_counts(app)
+    assert not problems, f"以下页面的查询次数随行数增长: {problems}"
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        print("=" * 60)
+        print("检查列表页的查询次数")
+        print("=" * 60)
+        problems = check_query_counts(app)
+        if problems:
+            print("以下页面的查询次数随行数增长:")
+            for description, small_count, large_count in problems:
+                print(f"   - {description}: {SMALL_ROWS} 行 {small_count} 条, {LARGE_ROWS} 行 {large_count} 条")
+            sys.exit(1)
+        print("所有列表页的查询次数都不随行数增长")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检查常用查询的执行计划是否使用了索引
+对每个查询执行 EXPLAIN，要求目标表的访问方式不是全表扫描（type=ALL）且使用了索引。
+需要连接已执行过 migrations.py 的 MySQL 数据库。
+
+使用方法：python tests/test_query_plans.py 或 python -m pytest tests/test_query_plans.py
+"""
+
+import sys
+import os
+from datetime import date
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app import create_app
+from models import db, Task, Defect, SprintBacklog, GameRound, Estimate, UserRole, ProjectInfo
+
+
+def hot_queries():
+    """(说明, 目标表, 查询)"""
+    return [
+        ('故事下指定状态的任务', 'task',
+         Task.query.filter(Task.user_story_id == 1, Task.status == '已完成')),
+        ('我的待办任务', 'task',
+         Task.query.filter(Task.assignee_id == 1, Task.status != '已完成', Task.end_date <= date.today())),
+        ('迭代的缺陷', 'defect',
+         Defect.query.filter(Defect.sprint_id == 1)),
+        ('缺陷列表筛选', 'defect',
+         Defect.query.filter(Defect.project_id == 1, Defect.status == '待处理', Defect.priority == 'P1')
+         .order_by(Defect.created_at.desc())),
+        ('我的待处理缺陷', 'defect',
+         Defect.query.filter(Defect.resolver_id == 1, Defect.status == '待处理')),
+        ('我的待验证缺陷', 'defect',
+         Defect.query.filter(Defect.assignee_id == 1, Defect.status == '已修复')),
+        ('迭代的故事', 'sprint_backlog',
+         SprintBacklog.query.filter(SprintBacklog.sprint_id == 1)),
+        ('故事所在的迭代', 'sprint_backlog',
+         SprintBacklog.query.filter(SprintBacklog.user_story_id == 1)),
+        ('故事的未结束回合', 'game_round',
+         GameRound.query.filter(GameRound.user_story_id == 1, GameRound.end_time.is_(None))),
+        ('全部未结束回合', 'game_round',
+         GameRound.query.filter(GameRound.end_time.is_(None))),
+        ('回合的出牌', 'estimate',
+         Estimate.query.filter(Estimate.round_id == 1)),
+        ('用户的角色', 'user_role',
+         UserRole.query.filter(UserRole.user_id == 1)),
+        ('子节点', 'project_info',
+         ProjectInfo.query.filter(ProjectInfo.parent_id == 1).order_by(ProjectInfo.order)),
+        ('路径前缀', 'project_info',
+         ProjectInfo.query.filter(ProjectInfo.path.like('/项目/%'))),
+    ]
+
+
+def explain(query):
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [dict(row) for row in db.session.execute(text(f'EXPLAIN {sql}')).mappings()]
+
+
+def check_query_plans():
+    """返回未使用索引的查询列表 [(说明, 执行计划行)]"""
+    problems = []
+    for description, table, query in hot_queries():
+        plan = [row for row in explain(query) if row.get('table') == table]
+        row = plan[0] if plan else {}
+        print(f"{description}: type={row.get('type')}, key={row.get('key')}, rows={row.get('rows')}")
+        if not row or row.get('type') == 'ALL' or not row.get('key'):
+            problems.append((description, row))
+    return problems
+
+
+def test_query_plans():
+    app = create_app()
+    with app.app_context():
+        problems = check_query_plans()
+    assert not problems, f"以下查询没有使用索引: {problems}"
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        print("=" * 60)
+        print("检查常用查询的执行计划")
+        print("=" * 60)
+        problems = check_query_plans()
+        if problems:
+            print("以下查询没有使用索引:")
+            for description, row in problems:
+                print(f"   - {description}: {row}")
+            sys.exit(1)
+        print("所有查询都使用了索引")
@@ -0,0 +1,281 @@
+"""
+我的待办
+每类待办用一次走索引的查询计算，结果按用户缓存一小段时间（首页每次加载都会请求 /api/my_todos）。
+任务、缺陷、迭代、用户角色发生变化并提交后，通过 Session 事件清除受影响用户的缓存；
+绕过 ORM 的批量写入（如缺陷导入）用 mark_todo_users 登记受影响的用户。
+未分配角色的用户列表与具体用户无关，所有管理员共用一份缓存，用反连接一次查出。
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, exists, inspect, or_, and_
+
+from cache import TTLCache
+from models import db, User, Role, UserRole, Task, Defect, Sprint
+from utils import get_user_permissions
+
+
+# 多进程部署时其他进程最多在 ttl 秒后看到变化
+_digest_cache = TTLCache(maxsize=2048, ttl=60)
+_NO_ROLE_KEY = ('no_role',)
+
+# 变化后需要清除缓存的模型 -> 记录待办所属用户的列
+_WATCHED_COLUMNS = {
+    Task: ('assignee_id',),
+    Defect: ('resolver_id', 'assignee_id'),
+    Sprint: ('scrum_master_id',),
+    UserRole: ('user_id',),
+}
+
+# session.info 中待清除的用户；ALL 表示清除全部
+_PENDING_KEY = 'todo_digest_users'
+ALL = object()
+
+
+def _task_todo(task, today):
+    if task.end_date < today:
+        return {
+            'id': f"task_overdue_{task.id}",
+            'type': 'task',
+            'priority': 'high',
+            'title': f'任务已逾期: {task.name}',
+            'description': f'任务"{task.name}"应于{task.end_date}完成，现已逾期',
+            'due_date': task.end_date.strftime('%Y-%m-%d'),
+            'related_id': task.id,
+            'action_url': f"/tasks/edit/{task.id}"
+        }
+    return {
+        'id': f"task_due_soon_{task.id}",
+        'type': 'task',
+        'priority': 'medium' if task.end_date > today else 'high',
+        'title': f'任务即将到期: {task.name}',
+        'description': f'任务"{task.name}"需要在{task.end_date}前完成',
+        'due_date': task.end_date.strftime('%Y-%m-%d'),
+        'related_id': task.id,
+        'action_url': f"/tasks/edit/{task.id}"
+    }
+
+
+def get_pending_tasks(user_id, today):
+    """分配给用户、未完成且已逾期或 1 天内到期的任务（ix_task_assignee_status_end）"""
+    tasks = db.session.query(Task.id, Task.name, Task.end_date).filter(
+        Task.assignee_id == user_id,
+        Task.status != '已完成',
+        Task.end_date <= today + timedelta(days=1)
+    ).order_by(Task.end_date, Task.id).all()
+    return [_task_todo(task, today) for task in tasks]
+
+
+def get_sprint_alerts(user_id, today):
+    """用户作为 Scrum Master 的迭代中，即将开始未启动、已结束未完成的迭代"""
+    starting = and_(Sprint.start_date >= today, Sprint.start_date <= today + timedelta(days=1),
+                    Sprint.status != '进行中')
+    ended = and_(Sprint.end_date < today, Sprint.status != '已完成')
+    sprints = db.session.query(Sprint.id, Sprint.name, Sprint.start_date, Sprint.end_date, Sprint.status).filter(
+        Sprint.scrum_master_id == user_id,
+        or_(starting, ended)
+    ).order_by(Sprint.id).all()
+
+    todos = []
+    for sprint in sprints:
+        if today <= sprint.start_date <= today + timedelta(days=1) and sprint.status != '进行中':
+            todos.append({
+                'id': f"sprint_starting_{sprint.id}",
+                'type': 'sprint',
+                'priority': 'medium',
+                'title': f'迭代即将开始: {sprint.name}',
+                'description': f'迭代"{sprint.name}"将于{sprint.start_date}开始，请更新状态',
+                'due_date': sprint.start_date.strftime('%Y-%m-%d'),
+                'related_id': sprint.id,
+                'action_url': f"/sprints/edit/{sprint.id}"
+            })
+        if sprint.end_date < today and sprint.status != '已完成':
+            todos.append({
+                'id': f"sprint_ended_{sprint.id}",
+                'type': 'sprint',
+                'priority': 'high',
+                'title': f'迭代已结束: {sprint.name}',
+                'description': f'迭代"{sprint.name}"已于{sprint.end_date}结束，请更新状态',
+                'due_date': sprint.end_date.strftime('%Y-%m-%d'),
+                'related_id': sprint.id,
+                'action_url': f"/sprints/edit/{sprint.id}"
+            })
+    return todos
+
+
+def get_user_alerts():
+    """未分配角色的用户（NOT EXISTS 反连接，所有管理员共用一份缓存）"""
+    todos = _digest_cache.get(_NO_ROLE_KEY)
+    if todos is None:
+        users = db.session.query(User.id, User.name).filter(
+            ~exists().where(UserRole.user_id == User.id)
+        ).order_by(User.id).all()
+        todos = [{
+            'id': f"user_no_role_{user.id}",
+            'type': 'user',
+            'priority': 'low',
+            'title': f'用户未分配角色: {user.name}',
+            'description': f'用户"{user.name}"尚未分配任何角色',
+            'due_date': '',
+            'related_id': user.id,
+            'action_url': f"/users/{user.id}/assign_roles"
+        } for user in users]
+        _digest_cache.set(_NO_ROLE_KEY, todos)
+    return todos
+
+
+def get_pending_defects(user_id):
+    """由用户解决、状态为“待处理”的缺陷（ix_defect_resolver_status）"""
+    defects = db.session.query(Defect.id, Defect.title).filter(
+        Defect.resolver_id == user_id,
+        Defect.status == '待处理'
+    ).order_by(Defect.id).all()
+    return [{
+        'id': f"defect_pending_{defect.id}",
+        'type': 'defect',
+        'priority': 'high',
+        'title': f'待处理缺陷: {defect.title}',
+        'description': f'缺陷"{defect.title}"需要您处理，请及时查看',
+        'due_date': '',
+        'related_id': defect.id,
+        'action_url': f"/defects/edit/{defect.id}"
+    } for defect in defects]
+
+
+def get_verify_defects(user_id):
+    """分配给用户、状态为“已修复”待验证的缺陷（ix_defect_assignee_status）"""
+    defects = db.session.query(Defect.id, Defect.title).filter(
+        Defect.assignee_id == user_id,
+        Defect.status == '已修复'
+    ).order_by(Defect.id).all()
+    return [{
+        'id': f"defect_verify_{defect.id}",
+        'type': 'defect',
+        'priority': 'medium',
+        'title': f'待验证缺陷: {defect.title}',
+        'description': f'您修复的缺陷"{defect.title}"已标记为已修复，请等待测试人员验证',
+        'due_date': '',
+        'related_id': defect.id,
+        'action_url': f"/defects/edit/{defect.id}"
+    } for defect in defects]
+
+
+def _build_digest(user_id, role_names, today):
+    """
+    按角色计算用户自己的待办，不含未分配角色的用户提醒
+    :return: (排在用户提醒之前的待办, 排在之后的待办)，保持原有的展示顺序
+    """
+    parts = []
+    # 1. 开发团队成员相关待办 - 即将到期或已逾期的任务
+    if role_names & {'developer', 'admin'}:
+        parts.append(get_pending_tasks(user_id, today))
+    # 4. 开发团队成员相关待办 - 待处理的缺陷
+    if role_names & {'developer', 'admin', 'QA'}:
+        parts.append(get_pending_defects(user_id))
+    # 2. Scrum Master相关待办 - 迭代状态提醒
+    if role_names & {'scrum_master', 'admin'}:
+        parts.append(get_sprint_alerts(user_id, today))
+    head = [todo for part in parts for todo in part]
+    # 5. 测试人员相关待办 - 待验证的缺陷
+    tail = get_verify_defects(user_id) if role_names & {'QA', 'admin'} else []
+    return head, tail
+
+
+def get_user_todos(user_id):
+    """
+    获取用户待办事项
+    用户自己的待办按 (用户, 日期) 缓存，跨天后重新计算逾期/到期状态
+    """
+    permissions = get_user_permissions(user_id)
+    today = datetime.now().date()
+    cached = _digest_cache.get(('user', user_id))
+    if cached is None or cached[0] != today:
+        cached = (today,) + _build_digest(user_id, permissions.role_names, today)
+        _digest_cache.set(('user', user_id), cached)
+    _, head, tail = cached
+
+    # 3. 系统管理员相关待办 - 未分配角色的用户
+    user_alerts = get_user_alerts() if permissions.is_admin else []
+    return head + user_alerts + tail
+
+
+def invalidate_user_todos(user_ids=ALL, no_role=False):
+    """
+    清除待办缓存
+    :param user_ids: 受影响的用户ID集合；为 ALL 时清除全部
+    :param no_role: 是否清除“未分配角色的用户”列表
+    """
+    if user_ids is ALL:
+        _digest_cache.clear()
+        return
+    for user_id in user_ids:
+        _digest_cache.pop(('user', user_id))
+    if no_role:
+        _digest_cache.pop(_NO_ROLE_KEY)
+
+
+def mark_todo_users(session, user_ids=ALL, no_role=False):
+    """登记受影响的用户，提交后清除其待办缓存（回滚则丢弃）"""
+    pending = session.info.get(_PENDING_KEY)
+    if pending is ALL:
+        return
+    if user_ids is ALL:
+        session.info[_PENDING_KEY] = ALL
+        return
+    pending = pending or set()
+    pending.update(user_id for user_id in user_ids if user_id)
+    if no_role:
+        pending.add(_NO_ROLE_KEY)
+    session.info[_PENDING_KEY] = pending
+
+
+def _changed_user_ids(obj, columns):
+    """对象修改前后涉及的全部用户ID"""
+    state = inspect(obj)
+    user_ids = set()
+    for column in columns:
+        added, unchanged, deleted = state.attrs[column].history
+        user_ids.update(value for value in (added or ()) + (unchanged or ()) + (deleted or ()) if value)
+    return user_ids
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flush_context):
+    user_ids = set()
+    no_role = False
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Role):
+            # 角色改名或删除影响拥有该角色的全部用户，角色很少变化，直接全部清除
+            mark_todo_users(session)
+            return
+        # 用户增删、改名以及角色分配变化都会影响“未分配角色的用户”提醒
+        no_role = no_role or isinstance(obj, (User, UserRole))
+        columns = _WATCHED_COLUMNS.get(type(obj))
+        if columns:
+            user_ids |= _changed_user_ids(obj, columns)
+    if user_ids or no_role:
+        mark_todo_users(session, user_ids, no_role)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    # Query.delete() / Query.update() 等批量语句不经过 flush，无法得知涉及哪些用户，全部清除
+    if (orm_execute_state.is_delete or orm_execute_state.is_update) and any(
+            mapper.class_ in (User, Role) or mapper.class_ in _WATCHED_COLUMNS
+            for mapper in orm_execute_state.all_mappers):
+        mark_todo_users(orm_execute_state.session)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_invalidation(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is ALL:
+        invalidate_user_todos()
+    elif pending:
+        invalidate_user_todos([user_id for user_id in pending if user_id != _NO_ROLE_KEY],
+                              no_role=_NO_ROLE_KEY in pending)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_invalidation(session):
+    session.info.pop(_PENDING_KEY, None)
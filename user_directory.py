@@ -0,0 +1,85 @@
+"""
+用户目录
+一次联表查询加载全部用户及其角色，缓存为 用户 -> 角色 映射，供各页面的负责人下拉框、用户管理等共用，
+不再对每个用户单独查询角色。用户、角色、角色分配变化并提交后通过 Session 事件清除缓存。
+"""
+
+from collections import namedtuple
+
+from cache import TTLCache, invalidate_on_commit
+from models import db, User, Role, UserRole
+
+
+RoleInfo = namedtuple('RoleInfo', ['id', 'name', 'display_name'])
+DirectoryUser = namedtuple('DirectoryUser', ['id', 'name', 'nickname', 'roles'])
+
+# 多进程部署时其他进程最多在 ttl 秒后看到变化
+_directory_cache = TTLCache(maxsize=1, ttl=300)
+_DIRECTORY_KEY = 'directory'
+
+
+class UserDirectory:
+    """全部用户（按 id 排序）及每个用户的角色"""
+
+    def __init__(self, users):
+        self.users = users
+        self._by_id = {user.id: user for user in users}
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def roles_of(self, user_id):
+        """用户的角色列表 [RoleInfo, ...]"""
+        user = self._by_id.get(user_id)
+        return user.roles if user else ()
+
+    def role_names_of(self, user_id):
+        return frozenset(role.name for role in self.roles_of(user_id))
+
+
+def _load_directory():
+    """用户 LEFT JOIN 角色分配 LEFT JOIN 角色，一次查询"""
+    rows = db.session.query(
+        User.id, User.name, User.nickname, Role.id.label('role_id'), Role.name.label('role_name'),
+        Role.display_name
+    ).outerjoin(UserRole, UserRole.user_id == User.id).outerjoin(
+        Role, Role.id == UserRole.role_id
+    ).order_by(User.id, Role.id).all()
+
+    users = []
+    for row in rows:
+        if not users or users[-1].id != row.id:
+            users.append(DirectoryUser(row.id, row.name, row.nickname, []))
+        if row.role_id is not None:
+            users[-1].roles.append(RoleInfo(row.role_id, row.role_name, row.display_name))
+    return UserDirectory([user._replace(roles=tuple(user.roles)) for user in users])
+
+
+def get_user_directory():
+    directory = _directory_cache.get(_DIRECTORY_KEY)
+    if directory is None:
+        directory = _load_directory()
+        _directory_cache.set(_DIRECTORY_KEY, directory)
+    return directory
+
+
+def users_with_role(role_name):
+    """具有指定角色的用户"""
+    return [user for user in get_user_directory().users if any(role.name == role_name for role in user.roles)]
+
+
+def users_without_role(role_name):
+    """不具有指定角色的用户（包括未分配任何角色的用户）"""
+    return [user for user in get_user_directory().users if all(role.name != role_name for role in user.roles)]
+
+
+def non_admin_users():
+    """非管理员用户，用于分配负责人等下拉框"""
+    return users_without_role('admin')
+
+
+def invalidate_user_directory():
+    _directory_cache.clear()
+
+
+invalidate_on_commit(db.session, (User, Role, UserRole), lambda changed: invalidate_user_directory())
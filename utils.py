@@ -1,38 +1,103 @@
+from collections import namedtuple
+
+from flask import g, has_app_context
+
+from cache import TTLCache
 from models import SystemFeature, User, UserRole, RoleSystemFeature, Role, db
 
 
+# 用户的有效权限：角色名集合、可访问的 route_name 集合（已包含公开功能）、是否管理员
+UserPermissions = namedtuple('UserPermissions', ['role_names', 'route_names', 'is_admin'])
+
+# 跨请求的进程级权限缓存；多进程部署时其他进程最多在 ttl 秒后感知角色/功能变化
+_permission_cache = TTLCache(maxsize=2048, ttl=60)
+_PUBLIC_KEY = ('public',)
+
+
+def _load_public_route_names():
+    """加载已启用且公开的系统功能路由名称"""
+    route_names = _permission_cache.get(_PUBLIC_KEY)
+    if route_names is None:
+        rows = db.session.query(SystemFeature.route_name).filter(
+            SystemFeature.is_enabled.is_(True),
+            SystemFeature.is_public.is_(True)
+        ).all()
+        route_names = frozenset(row.route_name for row in rows)
+        _permission_cache.set(_PUBLIC_KEY, route_names)
+    return route_names
+
+
+def _load_user_permissions(user_id):
+    """从数据库加载用户的角色与可访问功能（两次查询）"""
+    role_rows = db.session.query(Role.name).join(UserRole, UserRole.role_id == Role.id).filter(
+        UserRole.user_id == user_id
+    ).all()
+    role_names = frozenset(row.name for row in role_rows)
+
+    feature_rows = db.session.query(SystemFeature.route_name).join(
+        RoleSystemFeature, RoleSystemFeature.system_feature_id == SystemFeature.id
+    ).join(
+        UserRole, UserRole.role_id == RoleSystemFeature.role_id
+    ).filter(UserRole.user_id == user_id).distinct().all()
+    route_names = frozenset(row.route_name for row in feature_rows) | _load_public_route_names()
+
+    return UserPermissions(role_names, route_names, 'admin' in role_names)
+
+
+def get_user_permissions(user_id):
+    """
+    获取用户的有效权限
+    同一请求内缓存在 flask.g 上，跨请求缓存在进程级 TTL 缓存中
+    """
+    request_cache = None
+    if has_app_context():
+        request_cache = g.setdefault('_user_permissions', {})
+        permissions = request_cache.get(user_id)
+        if permissions is not None:
+            return permissions
+
+    permissions = _permission_cache.get(('user', user_id))
+    if permissions is None:
+        permissions = _load_user_permissions(user_id)
+        _permission_cache.set(('user', user_id), permissions)
+
+    if request_cache is not None:
+        request_cache[user_id] = permissions
+    return permissions
+
+
+def invalidate_permission_cache(user_id=None):
+    """
+    使权限缓存失效
+    :param user_id: 仅清除指定用户；为 None 时清除全部（角色功能或系统功能变化时使用）
+    """
+    if user_id is None:
+        _permission_cache.clear()
+    else:
+        _permission_cache.pop(('user', user_id))
+
+    if has_app_context():
+        request_cache = g.get('_user_permissions')
+        if request_cache:
+            if user_id is None:
+                request_cache.clear()
+            else:
+                request_cache.pop(user_id, None)
+
+
 def check_system_feature_access(session, route_name):
     """检查用户是否有访问特定系统功能的权限"""
-    # 检查用户是否具有访问该功能的角色
     user_id = session.get('user_id')
     if user_id:
-        # 检查用户是否是管理员
-        if check_user_role(user_id, 'admin'):
+        permissions = get_user_permissions(user_id)
+        # 管理员拥有全部功能权限
+        if permissions.is_admin:
             return True
+        # 角色授予的功能以及公开功能
+        return route_name in permissions.route_names
 
-        # 获取用户的角色
-        user_roles = UserRole.query.filter_by(user_id=user_id).all()
-        role_ids = [ur.role_id for ur in user_roles]
-
-        # 检查这些角色是否具有访问该功能的权限
-        if role_ids:
-            # 获取与这些角色关联的系统功能
-            role_features = RoleSystemFeature.query.filter(
-                RoleSystemFeature.role_id.in_(role_ids),
-                RoleSystemFeature.system_feature_id.in_(
-                    db.session.query(SystemFeature.id).filter_by(route_name=route_name)
-                )
-            ).first()
-
-            if role_features:
-                return True
-
-    # 检查系统功能是否公开（无需登录即可访问）
-    system_feature = SystemFeature.query.filter_by(route_name=route_name).first()
-    if system_feature and system_feature.is_enabled and system_feature.is_public:
-        return True
-
-    return False
+    # 未登录用户只能访问已启用的公开功能
+    return route_name in _load_public_route_names()
 
 def get_user_roles(user_id):
     """获取用户的所有角色"""
@@ -41,9 +106,6 @@ def get_user_roles(user_id):
 
 def check_user_role(user_id, role_name):
     """检查用户是否具有特定角色"""
-    user_roles = UserRole.query.join(Role).filter(
-        UserRole.user_id == user_id,
-        Role.name == role_name
-    ).first()
-
-    return user_roles is not None
+    if not user_id:
+        return False
+    return role_name in get_user_permissions(user_id).role_names